@@ -6,21 +6,74 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, PlainTextResponse, Response
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
 from datetime import datetime
 import uvicorn
 import random
+import json
+import logging
 import os
+import time
+
+from tracing import TraceIdFilter
+
+# 日志带上当前请求的 trace id，可据此在 trace 文件里找到完整链路。
+# 处理器挂在根 logger 上：各模块 logging.getLogger(__name__) 的记录都会经过它
+_log_handler = logging.StreamHandler()
+_log_handler.addFilter(TraceIdFilter())
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [trace=%(trace_id)s] %(name)s: %(message)s"))
+logging.getLogger().addHandler(_log_handler)
+logging.getLogger().setLevel(logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # 每次上游请求一条 INFO，太吵
+
+logger = logging.getLogger(__name__)
 
 # ========== 导入后端服务 ==========
 try:
     from qwen_service import qwen_service
 except ImportError:
-    print("警告: qwen_service.py 未找到，AI 功能将使用模拟模式")
+    logger.warning("qwen_service.py 未找到，AI 功能将使用模拟模式")
     qwen_service = None
 
+try:
+    from server.claude_service import ClaudeService
+    claude_service = ClaudeService()
+except ImportError:
+    # 未安装 anthropic 时只使用 Qwen
+    claude_service = None
+
+from event_deck import EventDeck
+from intent_engine import IntentEngine, Resolution
+from job_pool import JobListingPool
+from market_engine import INTERVALS, MarketEngine
+from metrics import BATCH_ITEMS, REGISTRY, MetricsMiddleware, record_fallback
+from provider_router import ClaudeProvider, ProviderRouter, QwenProvider
+from session_store import SessionStore
+from tracing import TracingMiddleware, exporter as trace_exporter, span, traced
+
+# 职位预生成池：按简历分桶，命中时无需等待大模型
+job_pool = JobListingPool(qwen_service) if qwen_service else None
+
+# 职场事件牌库：按职场状态分桶抽取，消耗快的桶由 AI 在后台补充
+event_deck = EventDeck(qwen_service)
+
+# 服务端行情：所有玩家共享一个市场，后台按 tick 推进
+market_engine = MarketEngine()
+
+# 玩家行动先走本地意图引擎，拿不准的再交给 AI
+intent_engine = IntentEngine()
+
+# 服务端会话：客户端只上传会话 id 和本轮新增内容
+session_store = SessionStore()
+
+# NPC 对话 / 每日任务按延迟和错误率在 Qwen 与 Claude 之间路由，故障时自动切换
+provider_router = ProviderRouter(
+    [QwenProvider(qwen_service)] + ([ClaudeProvider(claude_service)] if claude_service else [])
+) if qwen_service else None
+
 # ========== 创建 FastAPI 应用 ==========
 fastapi_app = FastAPI(
     title="职场沙盒游戏 API",
@@ -34,7 +87,11 @@ fastapi_app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+fastapi_app.add_middleware(MetricsMiddleware)
+# 每个请求按阶段记录耗时，响应头带 X-Trace-Id；设置了 TRACE_FILE 时完整链路写入该文件
+fastapi_app.add_middleware(TracingMiddleware)
 
 # ========== 数据模型 ==========
 class Player(BaseModel):
@@ -47,9 +104,22 @@ class ChatRequest(BaseModel):
     npc_name: str
     player_message: str
     conversation_history: List[dict] = []
+    player_info: Optional[dict] = None  # 不带会话时需包含完整玩家信息（至少 name）；带会话时只需上传变化的字段
+    workplace_status: Optional[dict] = None
+    session_id: Optional[str] = None  # 使用服务端会话时，历史和状态无需重复上传
+
+class TaskRequest(BaseModel):
+    player_info: Player
+    current_time: str = "09:00"
+
+class SessionCreateRequest(BaseModel):
     player_info: Optional[Player] = None
     workplace_status: Optional[dict] = None
 
+class SessionUpdateRequest(BaseModel):
+    player_info: Optional[dict] = None       # 只需上传变化的字段
+    workplace_status: Optional[dict] = None
+
 # ========== NPC 配置 ==========
 NPC_PROFILES = {
     "张经理": {
@@ -74,12 +144,118 @@ class JobGenerateRequest(BaseModel):
     count: Optional[int] = 15
 
 class InterviewQuestionRequest(BaseModel):
-    player_info: dict
-    company_info: dict
-    job_info: dict
-    round_info: dict
+    # 使用会话时，以下信息只需在首次请求（或发生变化时）上传
+    player_info: Optional[dict] = None
+    company_info: Optional[dict] = None
+    job_info: Optional[dict] = None
+    round_info: Optional[dict] = None
     conversation_history: List[dict] = []
     action: Optional[str] = "full"  # 'full' or 'analyze'
+    session_id: Optional[str] = None
+    new_turns: List[dict] = []  # 使用会话时，上次请求之后新增的对话（如玩家的回答）
+
+INTERVIEW_CONTEXT_FIELDS = ("player_info", "company_info", "job_info", "round_info")
+
+# ========== 会话 ==========
+
+def _get_session(session_id: str):
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"会话 '{session_id}' 不存在或已过期")
+    return session
+
+@traced("session.resolve")
+def _player_state(session_id: Optional[str], player_info: Optional[dict], workplace_status: Optional[dict]):
+    """
+    解析玩家状态，返回 (会话, 玩家信息, 职场状态)
+
+    不带会话时 player_info 按 Player 校验（必须有 name）；
+    使用会话时请求中的 player_info / workplace_status 视为增量（字段都可省略），合并进会话后返回完整状态
+    """
+    if not session_id:
+        if player_info is None:
+            return None, None, workplace_status
+        try:
+            return None, Player.model_validate(player_info).model_dump(), workplace_status
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            raise HTTPException(status_code=422, detail=f"player_info.{field}: {error['msg']}")
+
+    session = _get_session(session_id)
+    session_store.update(session, player_info=player_info, workplace_status=workplace_status)
+    return session, dict(session.player_info) or None, dict(session.workplace_status) or None
+
+def _chat_context(request: ChatRequest):
+    """解析对话请求的上下文，返回 (会话, 对话历史, 玩家信息, 职场状态)"""
+    session, player_info, workplace_status = _player_state(
+        request.session_id, request.player_info, request.workplace_status)
+    history = session.history(f"npc:{request.npc_name}") if session else request.conversation_history
+    return session, history, player_info, workplace_status
+
+def _record_chat_turn(session, request: ChatRequest, result: dict):
+    thread = f"npc:{request.npc_name}"
+    session_store.append(session, thread, "player", request.player_message)
+    session_store.append(session, thread, request.npc_name, result.get("npc_response", ""))
+
+@traced("session.resolve")
+def _interview_context(request: InterviewQuestionRequest):
+    """解析面试请求的上下文，返回 (会话, 面试信息, 对话历史)"""
+    provided = {name: getattr(request, name) for name in INTERVIEW_CONTEXT_FIELDS}
+    if not request.session_id:
+        missing = [name for name, value in provided.items() if value is None]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"缺少字段: {', '.join(missing)}")
+        return None, provided, request.conversation_history
+
+    session = _get_session(request.session_id)
+    previous = session.context.get("interview", {})
+    # 换了公司或职位视为新的一场面试
+    if any(
+        provided[name] is not None and provided[name] != previous.get(name)
+        for name in ("company_info", "job_info")
+    ):
+        session_store.clear(session, "interview")
+    interview = {name: provided[name] if provided[name] is not None else previous.get(name)
+                 for name in INTERVIEW_CONTEXT_FIELDS}
+    missing = [name for name, value in interview.items() if value is None]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"会话中缺少面试信息: {', '.join(missing)}")
+    session_store.update(session, context={"interview": interview})
+
+    for turn in request.new_turns:
+        session_store.append(session, "interview", turn.get("role", "player"), turn.get("content", ""))
+    return session, interview, session.history("interview")
+
+def _record_interview_question(session, result: dict):
+    if session is not None and result.get("question"):
+        session_store.append(session, "interview", "assistant", result["question"])
+
+@fastapi_app.post("/api/session")
+async def create_session(request: SessionCreateRequest):
+    """创建服务端会话，之后的对话 / 面试请求只需带上 session_id"""
+    session = session_store.create(
+        player_info=request.player_info.model_dump() if request.player_info else None,
+        workplace_status=request.workplace_status
+    )
+    return {"session_id": session.id}
+
+@fastapi_app.patch("/api/session/{session_id}")
+async def update_session(session_id: str, request: SessionUpdateRequest):
+    """合并玩家信息 / 职场状态的增量"""
+    session = _get_session(session_id)
+    session_store.update(session, player_info=request.player_info, workplace_status=request.workplace_status)
+    return {
+        "session_id": session.id,
+        "player_info": session.player_info,
+        "workplace_status": session.workplace_status
+    }
+
+@fastapi_app.delete("/api/session/{session_id}")
+async def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"会话 '{session_id}' 不存在或已过期")
+    return {"deleted": True}
 
 # ========== FastAPI 端点 ==========
 
@@ -90,19 +266,62 @@ async def generate_jobs(request: JobGenerateRequest):
         # 使用本地模拟数据
         from qwen_service import QwenService
         temp_service = QwenService()
-        return temp_service._mock_job_listings(request.count)
+        return temp_service._mock_job_listings(request.count or 15)
     
+    jobs = job_pool.take(request.player_resume, request.count)
+    if jobs is not None:
+        return jobs
+
     try:
         jobs = await qwen_service.generate_job_listings(
             player_info=request.player_resume,
-            count=request.count
+            count=request.count or 15
         )
         return jobs
-    except Exception as e:
-        print(f"生成职位列表失败: {e}")
+    except Exception:
+        logger.exception("生成职位列表失败，改用模拟职位")
         from qwen_service import QwenService
         temp_service = QwenService()
-        return temp_service._mock_job_listings(request.count)
+        return temp_service._mock_job_listings(request.count or 15)
+    finally:
+        job_pool.live_finished(request.player_resume)
+
+@fastapi_app.post("/api/jobs/generate/stream")
+async def generate_jobs_stream(request: JobGenerateRequest):
+    """
+    AI 生成招聘职位列表 - 流式输出版本（NDJSON）
+
+    每生成完一个职位就输出一行 JSON，无需等待整个列表生成完毕
+    """
+
+    async def generate():
+        if not qwen_service:
+            from qwen_service import QwenService
+            jobs = QwenService()._mock_job_listings(request.count or 15)
+            for job in jobs:
+                yield json.dumps(job, ensure_ascii=False) + "\n"
+            return
+
+        pooled = job_pool.take(request.player_resume, request.count)
+        if pooled is not None:
+            for job in pooled:
+                yield json.dumps(job, ensure_ascii=False) + "\n"
+            return
+
+        try:
+            async for job in qwen_service.generate_job_listings_stream(
+                player_info=request.player_resume,
+                count=request.count or 15
+            ):
+                yield json.dumps(job, ensure_ascii=False) + "\n"
+        finally:
+            job_pool.live_finished(request.player_resume)
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 @fastapi_app.post("/api/interview/question")
 async def generate_interview_question(request: InterviewQuestionRequest):
@@ -114,19 +333,20 @@ async def generate_interview_question(request: InterviewQuestionRequest):
             "type": "personal",
             "display_type": "自我介绍"
         }
-    
+
+    session, interview, history = _interview_context(request)
     try:
         result = await qwen_service.generate_interview_question(
-            player_info=request.player_info,
-            company_info=request.company_info,
-            job_info=request.job_info,
-            round_info=request.round_info,
-            conversation_history=request.conversation_history,
+            **interview,
+            conversation_history=history,
             action=request.action
         )
+        if request.action != 'analyze':
+            _record_interview_question(session, result)
         return result
-    except Exception as e:
-        print(f"生成面试问题失败: {e}")
+    except Exception:
+        logger.exception("生成面试问题失败，改用备用问题")
+        record_fallback("interview_question")
         return {
             "question": "能聊聊你对这个职位的理解吗？",
             "sample_answer": "我认为这个职位需要扎实的技术功底和良好的沟通能力...",
@@ -138,30 +358,46 @@ async def generate_interview_question(request: InterviewQuestionRequest):
 from fastapi.responses import StreamingResponse
 import asyncio
 
+def _sse_event(event: str, data) -> str:
+    """格式化一条带事件名的 SSE 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @fastapi_app.post("/api/interview/question/stream")
 async def generate_interview_question_stream(request: InterviewQuestionRequest):
-    """AI 生成面试问题 - 流式输出版本"""
-    
+    """
+    AI 生成面试问题 - 流式输出版本（面试流水线）
+
+    点评与下一题并发生成，上游逐 token 输出，每部分生成完立即作为独立的 SSE 事件推送：
+        event: question / type / display_type（最先到达）
+        event: analysis（玩家已回答过时）
+        event: sample_answer_delta（题目生成后开始，示例回答的增量文本）
+        event: sample_answer（示例回答全文，最后到达）
+        event: done（完整结果）
+    """
+
+    session, interview, history = _interview_context(request) if qwen_service else (None, None, None)
+
     async def generate():
         if not qwen_service:
-            fallback = '{"question": "请简单介绍一下你自己。", "sample_answer": "面试官您好...", "type": "personal", "display_type": "自我介绍"}'
-            yield f"data: {fallback}\n\n"
+            fallback = {"question": "请简单介绍一下你自己。", "sample_answer": "面试官您好...", "type": "personal", "display_type": "自我介绍"}
+            for key, value in fallback.items():
+                yield _sse_event(key, value)
+            yield _sse_event("done", fallback)
             return
         
         try:
-            result = await qwen_service.generate_interview_question_stream(
-                player_info=request.player_info,
-                company_info=request.company_info,
-                job_info=request.job_info,
-                round_info=request.round_info,
-                conversation_history=request.conversation_history
-            )
-            async for chunk in result:
-                yield f"data: {chunk}\n\n"
-        except Exception as e:
-            print(f"流式生成面试问题失败: {e}")
-            fallback = '{"question": "你为什么想加入我们公司？", "sample_answer": "贵公司的发展前景和企业文化让我非常感兴趣...", "type": "behavioral", "display_type": "求职动机"}'
-            yield f"data: {fallback}\n\n"
+            async for event, data in qwen_service.generate_interview_question_stream(
+                **interview,
+                conversation_history=history
+            ):
+                if event == "done":
+                    _record_interview_question(session, data)
+                yield _sse_event(event, data)
+        except Exception:
+            logger.exception("流式生成面试问题失败，改用备用问题")
+            record_fallback("interview_question")
+            fallback = {"question": "你为什么想加入我们公司？", "sample_answer": "贵公司的发展前景和企业文化让我非常感兴趣...", "type": "behavioral", "display_type": "求职动机"}
+            yield _sse_event("done", fallback)
     
     return StreamingResponse(
         generate(),
@@ -172,15 +408,128 @@ async def generate_interview_question_stream(request: InterviewQuestionRequest):
         }
     )
 
+@fastapi_app.on_event("startup")
+async def start_market():
+    """启动行情推进"""
+    market_engine.start()
+
+@fastapi_app.on_event("shutdown")
+async def close_upstream_client():
+    """停止行情推进，关闭上游连接池"""
+    await market_engine.stop()
+    if qwen_service:
+        await qwen_service.client.aclose()
+
 @fastapi_app.get("/api/status")
 async def root():
     return {
         "status": "running",
         "service": "职场沙盒游戏 API",
         "timestamp": datetime.now().isoformat(),
-        "ai_available": qwen_service is not None
+        "ai_available": qwen_service is not None,
+        "upstream": qwen_service.client.stats() if qwen_service else None,
+        "providers": provider_router.stats() if provider_router else None,
+        "job_pool": job_pool.stats() if job_pool else None,
+        "cache": qwen_service.cache.stats() if qwen_service else None,
+        "single_flight": qwen_service.flight.stats() if qwen_service else None,
+        "prompts": qwen_service.prompts.stats() if qwen_service else None,
+        "structured_outputs": qwen_service.outputs.stats() if qwen_service else None,
+        "sessions": session_store.stats(),
+        "intent": intent_engine.stats(),
+        "event_deck": event_deck.stats(),
+        "market": market_engine.stats(),
+        "tracing": trace_exporter.stats()
     }
 
+def _register_collectors():
+    """把各组件 stats() 中的状态接入 /api/metrics（抓取时读取）"""
+    REGISTRY.collect(
+        "app_sessions", "服务端会话数", "gauge", (),
+        lambda: [((), session_store.stats()["sessions"])])
+    REGISTRY.collect(
+        "action_intents_total", "玩家行动的解析方式（local 本地 / llm AI / fallback AI 失败后用本地结果）",
+        "counter", ("resolver",),
+        lambda: [(("local",), intent_engine.local), (("llm",), intent_engine.llm_resolved),
+                 (("fallback",), intent_engine.llm_failed)])
+    REGISTRY.collect(
+        "action_local_ratio", "本地意图引擎直接解析的行动占比", "gauge", (),
+        lambda: [((), intent_engine.stats()["local_ratio"] or 0)])
+    REGISTRY.collect(
+        "event_deck_draws_total",
+        "事件牌库抽取结果（hit 命中 / miss 该玩家已抽完 / fallback_* 上游失败后允许重复的兜底抽取）", "counter", ("result",),
+        lambda: [
+            (("hit",), event_deck.hits), (("miss",), event_deck.misses),
+            (("fallback_hit",), event_deck.fallback_hits), (("fallback_miss",), event_deck.fallback_misses),
+        ])
+    REGISTRY.collect(
+        "event_deck_events", "事件牌库中可抽取的事件数（各分桶合计）", "gauge", (),
+        lambda: [((), event_deck.stats()["events"])])
+    REGISTRY.collect(
+        "market_tick", "行情引擎已推进的 tick 数", "counter", (),
+        lambda: [((), market_engine.tick)])
+    REGISTRY.collect(
+        "market_snapshots_total", "行情快照的编码次数 / 返回次数", "counter", ("kind",),
+        lambda: [(("encoded",), market_engine.snapshots_encoded), (("served",), market_engine.snapshots_served)])
+    REGISTRY.collect(
+        "market_stream_subscribers", "当前行情推送的订阅连接数", "gauge", (),
+        lambda: [((), market_engine.subscribers)])
+    REGISTRY.collect(
+        "market_stream_frames_total", "已发布的行情推送帧数 / 慢连接重新同步次数", "counter", ("kind",),
+        lambda: [(("published",), market_engine.frames_published), (("resync",), market_engine.stream_resyncs)])
+    if not qwen_service:
+        return
+
+    upstream = qwen_service.client
+    REGISTRY.collect(
+        "llm_upstream_inflight", "正在等待上游响应的调用数", "gauge", (),
+        lambda: [((), upstream.inflight)])
+    REGISTRY.collect(
+        "llm_upstream_queued", "因并发上限排队的调用数", "gauge", (),
+        lambda: [((), upstream.queued)])
+    REGISTRY.collect(
+        "llm_circuit_open", "上游熔断器是否打开（half_open 记为 0.5）", "gauge", (),
+        lambda: [((), {"closed": 0, "half_open": 0.5, "open": 1}[upstream.breaker.state])])
+    REGISTRY.collect(
+        "llm_circuit_rejected_total", "熔断期间被直接拒绝的调用数", "counter", (),
+        lambda: [((), upstream.breaker.rejected)])
+    REGISTRY.collect(
+        "llm_hedged_total", "发出的对冲请求数", "counter", (),
+        lambda: [((), upstream.hedged)])
+
+    def cache_requests():
+        for endpoint, counters in qwen_service.cache.stats()["endpoints"].items():
+            for result in ("hits", "stale_hits", "misses"):
+                yield (endpoint, result), counters[result]
+    REGISTRY.collect(
+        "llm_cache_requests_total", "响应缓存查询数", "counter", ("endpoint", "result"), cache_requests)
+    REGISTRY.collect(
+        "llm_cache_hit_ratio", "响应缓存命中率（含过期命中）", "gauge", ("endpoint",),
+        lambda: [((endpoint,), counters["hit_rate"])
+                 for endpoint, counters in qwen_service.cache.stats()["endpoints"].items()])
+    REGISTRY.collect(
+        "llm_single_flight_coalesced_total", "与在途的相同调用合并的请求数", "counter", (),
+        lambda: [((), qwen_service.flight.coalesced)])
+
+    def structured_outputs():
+        for endpoint, counters in qwen_service.outputs.counters.items():
+            for outcome, value in counters.items():
+                yield (endpoint, outcome), value
+    REGISTRY.collect(
+        "llm_structured_outputs_total", "结构化输出校验结果（valid / repaired / reasked / failed）",
+        "counter", ("endpoint", "outcome"), structured_outputs)
+
+    if job_pool:
+        REGISTRY.collect(
+            "job_pool_requests_total", "职位池查询数", "counter", ("result",),
+            lambda: [(("hits",), job_pool.hits), (("misses",), job_pool.misses)])
+
+_register_collectors()
+
+@fastapi_app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式的运行指标"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ========== 前端静态文件服务 ==========
 
 # 检查前端构建目录是否存在
@@ -193,7 +542,7 @@ if not os.path.exists(frontend_dir):
 if os.path.exists(frontend_dir):
     fastapi_app.mount("/assets", StaticFiles(directory=os.path.join(frontend_dir, "assets")), name="assets")
 else:
-    print(f"警告: 前端构建目录不存在 ({frontend_dir})")
+    logger.warning("前端构建目录不存在 (%s)", frontend_dir)
 
 @fastapi_app.get("/")
 async def serve_frontend():
@@ -223,26 +572,96 @@ async def chat_with_npc(request: ChatRequest):
     if not npc:
         raise HTTPException(status_code=404, detail=f"NPC '{request.npc_name}' 不存在")
 
-    result = await qwen_service.chat_with_npc(
+    session, history, player_info, workplace_status = _chat_context(request)
+    result = await provider_router.call(
+        "chat_with_npc",
         npc_name=request.npc_name,
         npc_profile=npc,
         player_message=request.player_message,
-        conversation_history=request.conversation_history,
-        player_info=request.player_info.model_dump() if request.player_info else None,
-        workplace_status=request.workplace_status
+        conversation_history=history,
+        player_info=player_info,
+        workplace_status=workplace_status
     )
+    if result is None:
+        # 所有后端都失败：本地模拟回复
+        result = qwen_service._mock_npc_response(request.npc_name, player_info, workplace_status)
+    if session is not None:
+        _record_chat_turn(session, request, result)
 
     return result
 
 
+@fastapi_app.post("/api/chat/stream")
+async def chat_with_npc_stream(request: ChatRequest):
+    """
+    与 NPC 对话 - 流式输出版本
+
+    event: delta  对话正文片段（逐 token 下发）
+    event: done   完整结果，结构与 /api/chat 相同（含 emotion / relationship_change）
+    """
+    npc = NPC_PROFILES.get(request.npc_name)
+    if qwen_service and not npc:
+        raise HTTPException(status_code=404, detail=f"NPC '{request.npc_name}' 不存在")
+    session, history, player_info, workplace_status = _chat_context(request)
+
+    async def generate():
+        if not qwen_service:
+            result = {
+                "npc_response": "AI 服务暂时不可用。这是一个完整的 3D 职场沙盒游戏，请查看部署说明了解如何运行完整版本。",
+                "emotion": "neutral",
+                "relationship_change": 0
+            }
+            yield _sse_event("delta", result["npc_response"])
+            yield _sse_event("done", result)
+            return
+
+        async for event, data in qwen_service.chat_with_npc_stream(
+            npc_name=request.npc_name,
+            npc_profile=npc,
+            player_message=request.player_message,
+            conversation_history=history,
+            player_info=player_info,
+            workplace_status=workplace_status
+        ):
+            if event == "done" and session is not None:
+                _record_chat_turn(session, request, data)
+            yield _sse_event(event, data)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
+@fastapi_app.post("/api/tasks")
+async def generate_daily_tasks(request: TaskRequest):
+    """生成每日工作任务"""
+    if not qwen_service:
+        from qwen_service import QwenService
+        temp_service = QwenService()
+        return temp_service._mock_tasks()
+
+    result = await provider_router.call(
+        "generate_tasks",
+        player_info=request.player_info.model_dump(),
+        current_time=request.current_time
+    )
+    return result or qwen_service._mock_tasks()
+
+
 # ========== 新增：玩家行动处理 ==========
 
 class ActionRequest(BaseModel):
     action: str  # 玩家输入的行动描述
-    player_info: Optional[Player] = None
+    player_info: Optional[dict] = None  # 同 ChatRequest：带会话时只需上传变化的字段
     workplace_status: Optional[dict] = None
     visible_objects: List[str] = []  # 场景中可见的物品
     visible_npcs: List[str] = []  # 场景中可见的 NPC
+    session_id: Optional[str] = None
 
 class AnimationCommand(BaseModel):
     type: str  # throw, hit, debris, hurt, dodge, gather, flee, mood
@@ -261,181 +680,90 @@ class ActionResponse(BaseModel):
 async def execute_action(request: ActionRequest):
     """
     处理玩家行动，返回动画指令和状态变化
-    AI 会判断行动是否可行，并返回应该播放的动画序列
+
+    先由本地意图引擎解析（微秒级）；只有置信度不足的行动才交给 AI 判断，
+    AI 不可用或失败时仍返回本地解析结果
     """
+    resolution = intent_engine.resolve(request.action, request.visible_objects, request.visible_npcs)
+    if resolution.confident:
+        return resolution.result
     if not qwen_service:
-        # 使用本地规则处理
-        return _process_action_locally(request)
-    
+        return _process_action_locally(resolution)
+
+    _, player_info, workplace_status = _player_state(
+        request.session_id, request.player_info, request.workplace_status)
     try:
         result = await qwen_service.process_player_action(
             action=request.action,
-            player_info=request.player_info.model_dump() if request.player_info else None,
-            workplace_status=request.workplace_status,
+            player_info=player_info,
+            workplace_status=workplace_status,
             visible_objects=request.visible_objects,
             visible_npcs=request.visible_npcs
         )
-        return result
-    except Exception as e:
-        print(f"处理行动失败: {e}")
-        return _process_action_locally(request)
+    except Exception:
+        logger.exception("处理行动失败，改用本地意图解析结果")
+        result = None
+    # 只有真正调用了大模型才记录升级结果
+    intent_engine.record_escalation(result is not None)
+    if result is None:
+        return _process_action_locally(resolution)
+    return result
 
 
-def _process_action_locally(request: ActionRequest) -> dict:
-    """本地规则处理玩家行动（减少 AI 调用）"""
-    action = request.action.lower()
-    
-    animations = []
-    npc_reactions = {}
-    state_changes = {"mood": 0, "stress": 0, "work_progress": 0, "relationships": {}}
-    feasible = True
-    description = ""
-    dialogue = None
-    
-    # 投掷类行动
-    if any(word in action for word in ['砸', '扔', '投', '丢']):
-        # 解析目标
-        target_npc = None
-        thrown_object = None
-        
-        for obj in request.visible_objects:
-            if obj in action:
-                thrown_object = obj
-                break
-        if not thrown_object:
-            thrown_object = "水杯"  # 默认物品
-            
-        for npc in request.visible_npcs:
-            if npc in action:
-                target_npc = npc
-                break
-        if not target_npc and request.visible_npcs:
-            target_npc = request.visible_npcs[0]  # 默认第一个 NPC
-        
-        if target_npc:
-            description = f"你拿起{thrown_object}狠狠地砸向了{target_npc}！"
-            animations = [
-                {"type": "throw", "object": thrown_object, "target": target_npc, "duration": 500},
-                {"type": "hit", "target": target_npc, "delay": 500},
-                {"type": "debris", "object": thrown_object, "delay": 600},
-                {"type": "hurt", "target": target_npc, "delay": 600}
-            ]
-            # 其他 NPC 反应
-            for npc in request.visible_npcs:
-                if npc != target_npc:
-                    npc_reactions[npc] = random.choice(["gather", "flee", "shock"])
-            npc_reactions[target_npc] = "hurt"
-            
-            state_changes = {
-                "mood": -30,
-                "stress": +50,
-                "work_progress": -20,
-                "relationships": {target_npc: -50}
-            }
-            dialogue = f"{target_npc}捂着头大喊：你疯了吗！"
-        else:
-            feasible = False
-            description = "你找不到攻击目标。"
-    
-    # 攻击类行动
-    elif any(word in action for word in ['打', '揍', '踢', '攻击']):
-        target_npc = None
-        for npc in request.visible_npcs:
-            if npc in action:
-                target_npc = npc
-                break
-        
-        if target_npc:
-            description = f"你冲向{target_npc}挥出了拳头！"
-            animations = [
-                {"type": "charge", "target": target_npc, "duration": 300},
-                {"type": "hurt", "target": target_npc, "delay": 300}
-            ]
-            for npc in request.visible_npcs:
-                if npc != target_npc:
-                    npc_reactions[npc] = "gather"
-            npc_reactions[target_npc] = "hurt"
-            state_changes = {"mood": -40, "stress": +60, "relationships": {target_npc: -80}}
-            dialogue = f"{target_npc}倒退几步，震惊地看着你。"
-        else:
-            feasible = False
-            description = "你挥舞着拳头，但没有打中任何人。"
-    
-    # 工作类行动
-    elif any(word in action for word in ['工作', '代码', '写', '做', '完成']):
-        description = "你专注地开始工作..."
-        animations = [{"type": "work", "duration": 2000}]
-        state_changes = {"mood": -5, "stress": +10, "work_progress": +15}
-        
-    # 摸鱼类行动
-    elif any(word in action for word in ['摸鱼', '休息', '偷懒', '刷手机']):
-        description = "你偷偷摸起了鱼..."
-        animations = [{"type": "idle", "variant": "phone", "duration": 2000}]
-        state_changes = {"mood": +10, "stress": -10, "work_progress": -5}
-        
-        # 可能被发现
-        if random.random() < 0.3:
-            target_npc = random.choice(request.visible_npcs) if request.visible_npcs else "张经理"
-            npc_reactions[target_npc] = "notice"
-            dialogue = f"{target_npc}似乎注意到了你在摸鱼..."
-    
-    # 对话类行动
-    elif any(word in action for word in ['说', '问', '聊', '告诉']):
-        target_npc = None
-        for npc in request.visible_npcs:
-            if npc in action:
-                target_npc = npc
-                break
-        
-        if target_npc:
-            description = f"你走向{target_npc}开始交谈。"
-            animations = [{"type": "walk", "target": target_npc, "duration": 500}]
-            npc_reactions[target_npc] = "talk"
-        else:
-            description = "你自言自语了几句。"
-            
-    # 默认行动
-    else:
-        description = f"你尝试{action}..."
-        animations = [{"type": "generic", "duration": 1000}]
-    
-    return {
-        "feasible": feasible,
-        "description": description,
-        "animations": animations,
-        "npc_reactions": npc_reactions,
-        "state_changes": state_changes,
-        "dialogue": dialogue
-    }
+def _process_action_locally(resolution: Resolution) -> dict:
+    """AI 不可用或失败时使用本地意图引擎的结果（即使置信度不足）"""
+    record_fallback("player_action")
+    return resolution.result
 
 
 # ========== 新增：职场事件生成 ==========
 
 class EventRequest(BaseModel):
-    player_info: Optional[Player] = None
+    player_info: Optional[dict] = None  # 同 ChatRequest：带会话时只需上传变化的字段
     workplace_status: Optional[dict] = None
     event_type: str = "random"  # random, politics, bullying, opportunity, crisis
+    session_id: Optional[str] = None
 
 @fastapi_app.post("/api/event")
 async def generate_event(request: EventRequest):
-    """生成职场随机事件"""
-    if not qwen_service:
-        return _generate_mock_event(request.event_type)
-    
-    try:
-        result = await qwen_service.generate_workplace_event(
-            player_info=request.player_info.model_dump() if request.player_info else {},
-            workplace_status=request.workplace_status or {},
-            event_type=request.event_type
-        )
-        return result
-    except Exception as e:
-        print(f"生成事件失败: {e}")
+    """
+    生成职场随机事件
+
+    优先从事件牌库按职场状态抽取（不重复该玩家近期见过的事件），牌库在后台由 AI 补充；
+    该玩家已抽完匹配的事件时才实时生成
+    """
+    session, player_info, workplace_status = _player_state(
+        request.session_id, request.player_info, request.workplace_status)
+    player = session.id if session else (player_info or {}).get("name")
+    event = event_deck.draw(request.event_type, workplace_status or {}, player=player, player_info=player_info)
+    if event is not None:
+        return event
+
+    if qwen_service:
+        try:
+            result = await qwen_service.generate_workplace_event(
+                player_info=player_info or {},
+                workplace_status=workplace_status or {},
+                event_type=request.event_type
+            )
+            if result:
+                # 实时生成的事件入库并计入该玩家的历史，返回时带上牌库里的 id
+                card_id = event_deck.add(result, request.event_type, workplace_status or {}, player=player)
+                return {**result, "id": card_id} if card_id else result
+        except Exception:
+            logger.exception("生成事件失败")
+
+    # 上游失败 / 熔断时允许重复抽取（单独计数，不算第二次未命中）
+    event = event_deck.draw(request.event_type, workplace_status or {}, player=player, allow_repeat=True)
+    if event is None:
         return _generate_mock_event(request.event_type)
+    record_fallback("workplace_event")
+    return event
 
 
 def _generate_mock_event(event_type: str) -> dict:
     """模拟职场事件"""
+    record_fallback("workplace_event")
     events = {
         "politics": {
             "title": "派系拉拢",
@@ -476,22 +804,162 @@ def _generate_mock_event(event_type: str) -> dict:
 
 @fastapi_app.get("/api/market")
 async def get_market_data():
-    """获取市场数据"""
-    stocks = [
-        {"code": "TECH001", "name": "科技先锋", "price": round(random.uniform(80, 120), 2), "change": round(random.uniform(-5, 5), 2)},
-        {"code": "FINA002", "name": "金融稳健", "price": round(random.uniform(50, 70), 2), "change": round(random.uniform(-3, 3), 2)},
-    ]
+    """获取市场数据（所有玩家共享同一个服务端行情，同一 tick 内直接返回已编码的快照）"""
+    return Response(content=market_engine.snapshot_json(), media_type="application/json")
 
-    funds = [
-        {"code": "FUND001", "name": "稳健理财A", "nav": round(random.uniform(1.0, 1.5), 4), "change": round(random.uniform(-1, 1), 2)},
-    ]
 
-    return {
-        "stocks": stocks,
-        "funds": funds,
-        "timestamp": datetime.now().isoformat()
+@fastapi_app.get("/api/market/stream")
+async def stream_market():
+    """
+    订阅行情推送（SSE）
+
+    先收到 hello（增量帧的字段顺序）和 snapshot（完整快照），之后每个 tick 一条 tick 增量帧，
+    只包含有变动的品种；跨交易日时再次下发 snapshot。每帧只编码一次，所有订阅者共用
+    """
+    return StreamingResponse(
+        market_engine.stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
+@fastapi_app.get("/api/market/history")
+async def get_market_history(code: str, interval: str = "1m", limit: Optional[int] = None):
+    """
+    获取某只股票的 K 线（interval: tick / 1m / 5m / day）
+
+    各周期的 K 线在每个 tick 增量维护，这里只是对环形缓冲区取最近 limit 根
+    """
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"不支持的周期: {interval}，可选 {', '.join(INTERVALS)}")
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit 必须为正整数")
+    history = market_engine.history(code, interval, limit)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"股票不存在: {code}")
+    return history
+
+async def _market_snapshot() -> dict:
+    """批量请求中的行情（结果要嵌入批量响应，返回字典而不是已编码的 JSON）"""
+    return market_engine.snapshot()
+
+# ========== 批量请求 ==========
+
+# 一个批次最多的子请求数 / 整批的截止时间（秒，请求里的 deadline 不能超过它）
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "16"))
+BATCH_DEADLINE = float(os.getenv("BATCH_DEADLINE", "30"))
+
+class BatchItem(BaseModel):
+    type: str  # chat, tasks, action, event, market, jobs, interview, session
+    id: Optional[str] = None  # 客户端自定义标识，原样带回
+    body: dict = {}
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    deadline: Optional[float] = None  # 秒，默认 BATCH_DEADLINE
+    stream: bool = False  # True 时按完成顺序逐行输出 NDJSON
+
+# 子请求类型 → (请求体模型, 处理函数)；直接复用各接口的实现，省去单独的 HTTP 往返
+BATCH_HANDLERS = {
+    "chat": (ChatRequest, chat_with_npc),
+    "tasks": (TaskRequest, generate_daily_tasks),
+    "action": (ActionRequest, execute_action),
+    "event": (EventRequest, generate_event),
+    "market": (None, _market_snapshot),
+    "jobs": (JobGenerateRequest, generate_jobs),
+    "interview": (InterviewQuestionRequest, generate_interview_question),
+    "session": (SessionCreateRequest, create_session),
+}
+
+async def _run_batch_item(index: int, item: BatchItem) -> dict:
+    """执行一个子请求；任何失败都只影响这一项，转换为该项的 status / error"""
+    result = {"index": index, "id": item.id, "type": item.type}
+    handler = BATCH_HANDLERS.get(item.type)
+    if handler is None:
+        return {**result, "ok": False, "status": 400, "error": f"未知的子请求类型 '{item.type}'"}
+    model, func = handler
+    with span("batch.item", index=index, type=item.type) as current:
+        try:
+            value = await (func(model.model_validate(item.body)) if model else func())
+            outcome = {"ok": True, "status": 200, "result": jsonable_encoder(value)}
+        except ValidationError as e:
+            outcome = {"ok": False, "status": 422, "error": [
+                {"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()
+            ]}
+        except HTTPException as e:
+            outcome = {"ok": False, "status": e.status_code, "error": e.detail}
+        except Exception as e:
+            logger.exception("批量子请求 %s#%d 失败", item.type, index)
+            outcome = {"ok": False, "status": 500, "error": f"{type(e).__name__}: {e}"}
+        if current is not None:
+            current.set(status=outcome["status"])
+    BATCH_ITEMS.inc(type=item.type, status=outcome["status"])
+    return {**result, **outcome}
+
+def _batch_timeout(index: int, item: BatchItem) -> dict:
+    BATCH_ITEMS.inc(type=item.type, status=504)
+    return {"index": index, "id": item.id, "type": item.type, "ok": False, "status": 504, "error": "超过批次截止时间"}
+
+@fastapi_app.post("/api/batch")
+async def run_batch(request: BatchRequest):
+    """
+    一次请求执行多个子请求（如同一场景里几个 NPC 的对话 + 事件 + 行情）
+
+    子请求在服务端并发执行，单项失败不影响其他项；到达截止时间仍未完成的项被取消并标记为 504。
+    默认按提交顺序返回 {"results": [...]}；stream=true 时按完成顺序逐行输出（NDJSON），每行带 index
+    """
+    if not request.items:
+        raise HTTPException(status_code=422, detail="items 不能为空")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"单个批次最多 {BATCH_MAX_ITEMS} 个子请求")
+    if request.deadline is not None and request.deadline <= 0:
+        raise HTTPException(status_code=400, detail="deadline 必须为正数")
+    deadline = min(request.deadline or BATCH_DEADLINE, BATCH_DEADLINE)
+    started = time.monotonic()
+    tasks = {
+        asyncio.create_task(_run_batch_item(index, item)): index
+        for index, item in enumerate(request.items)
     }
 
+    if not request.stream:
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=deadline)
+        finally:
+            for task in tasks:
+                task.cancel()
+        results = [
+            _batch_timeout(index, request.items[index]) if task in pending else task.result()
+            for task, index in tasks.items()
+        ]
+        return {"results": results, "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+
+    async def generate():
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.get):
+                    yield json.dumps(task.result(), ensure_ascii=False) + "\n"
+            for task in sorted(pending, key=tasks.get):
+                task.cancel()
+                yield json.dumps(_batch_timeout(tasks[task], request.items[tasks[task]]), ensure_ascii=False) + "\n"
+        finally:
+            # 客户端提前断开时同样取消未完成的子请求
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 # ========== 启动应用 ==========
 
 if __name__ == "__main__":
@@ -503,8 +971,12 @@ if __name__ == "__main__":
     print(f"API 端点:")
     print(f"   - GET  /              (前端游戏)")
     print(f"   - GET  /api/status    (服务状态)")
+    print(f"   - GET  /api/metrics   (Prometheus 指标)")
     print(f"   - POST /api/chat      (NPC 对话)")
+    print(f"   - POST /api/batch     (批量子请求)")
     print(f"   - GET  /api/market    (市场数据)")
+    print(f"   - GET  /api/market/stream  (行情推送 SSE)")
+    print(f"   - GET  /api/market/history (K 线)")
     print("=" * 60)
 
     uvicorn.run(
@@ -0,0 +1,285 @@
+"""
+端到端压测
+在后台启动本地替身大模型服务和 app.py，通过真实 HTTP 按设定并发压各个接口，
+统计每个接口的吞吐、p50/p95/p99 延迟与首字节时间（TTFB），结果保存为 JSON 便于对比
+
+用法：
+    python benchmarks/e2e_load.py --concurrency 16 --requests 200 --profile fast
+    python benchmarks/e2e_load.py --endpoints chat,event --baseline benchmarks/results/base.json
+
+--baseline 指定上一次的结果文件时，任一接口 p95 延迟或 TTFB 变差超过 --tolerance 即以退出码 1 结束
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+import uvicorn
+
+from stand_in_llm import PROFILES, start_stand_in
+
+
+PLAYER = {"name": "压测员工", "position": "实习生", "money": 5000, "day": 3}
+RESUME = {"name": "压测求职者", "education": "本科", "major": "计算机", "experience": 1, "skills": ["Python", "SQL"]}
+
+
+@dataclass
+class Scenario:
+    """一个被压测的接口；payload(i) 生成第 i 个请求的请求体"""
+    method: str
+    path: str
+    payload: Optional[Callable[[int], dict]] = None
+
+
+# 默认每个请求的输入都不同，避免响应缓存 / 职位池把上游延迟全部挡掉；--repeat 时使用相同输入
+SCENARIOS: Dict[str, Scenario] = {
+    "chat": Scenario("POST", "/api/chat", lambda i: {
+        "npc_name": "张经理",
+        "player_message": f"张经理，第{i}份周报我放您桌上了",
+        "player_info": PLAYER,
+        "workplace_status": {"kpi": 60, "stress": 30, "reputation": 0},
+    }),
+    "action": Scenario("POST", "/api/action", lambda i: {
+        "action": f"把第{i}份文件扔向打印机",
+        "player_info": PLAYER,
+        "visible_objects": ["打印机", "咖啡杯"],
+        "visible_npcs": ["张经理"],
+    }),
+    "event": Scenario("POST", "/api/event", lambda i: {
+        "player_info": {**PLAYER, "name": f"压测员工{i % 50}", "day": i},
+        "workplace_status": {"kpi": i % 100, "stress": (i * 7) % 100, "reputation": (i * 3) % 50},
+        "event_type": ["politics", "bullying", "opportunity", "crisis"][i % 4],
+    }),
+    "jobs": Scenario("POST", "/api/jobs/generate", lambda i: {
+        "player_resume": {**RESUME, "experience": i % 10, "major": f"专业{i}"},
+        "count": 5,
+    }),
+    "interview": Scenario("POST", "/api/interview/question", lambda i: {
+        "player_info": RESUME,
+        "company_info": {"name": f"公司{i}", "type": "big"},
+        "job_info": {"title": "后端开发工程师"},
+        "round_info": {"round": 1 + i % 3, "interviewerRole": "技术面试官"},
+        "conversation_history": [],
+    }),
+    "interview_stream": Scenario("POST", "/api/interview/question/stream", lambda i: {
+        "player_info": RESUME,
+        "company_info": {"name": f"公司{i}", "type": "startup"},
+        "job_info": {"title": "产品经理"},
+        "round_info": {"round": 1 + i % 3, "interviewerRole": "产品总监"},
+        "conversation_history": [],
+    }),
+    "market": Scenario("GET", "/api/market"),
+    # 一个办公室场景的全部请求合并为一次往返
+    "batch": Scenario("POST", "/api/batch", lambda i: {"items": [
+        {"type": "chat", "body": {**SCENARIOS["chat"].payload(i), "npc_name": npc}}
+        for npc in ("张经理", "李同事", "王前辈")
+    ] + [
+        {"type": "event", "body": SCENARIOS["event"].payload(i)},
+        {"type": "market"},
+    ]}),
+}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app() -> tuple:
+    """在后台线程启动 app.py，返回 (server, base_url)；需在 QWEN_BASE_URL 设置好之后调用"""
+    from app import fastapi_app
+
+    port = _free_port()
+    config = uvicorn.Config(fastapi_app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    repeat: bool
+) -> dict:
+    """按并发上限发出 requests 个请求，逐个记录总耗时与首字节时间"""
+    latencies, ttfbs = [], []
+    errors: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        body = scenario.payload(0 if repeat else i) if scenario.payload else None
+        async with semaphore:
+            started = time.perf_counter()
+            ttfb = None
+            try:
+                async with client.stream(scenario.method, scenario.path, json=body) as response:
+                    async for _ in response.aiter_raw():
+                        if ttfb is None:
+                            ttfb = time.perf_counter() - started
+                    status = response.status_code
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                return
+            elapsed = time.perf_counter() - started
+        if status >= 400:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+            return
+        latencies.append(elapsed)
+        ttfbs.append(ttfb if ttfb is not None else elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {f"p{int(q * 100)}": _ms(percentile(latencies, q)) for q in (0.5, 0.95, 0.99)},
+        "ttfb_ms": {f"p{int(q * 100)}": _ms(percentile(ttfbs, q)) for q in (0.5, 0.95, 0.99)},
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """对比两次结果，返回变差超过容忍度的指标说明"""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("latency_ms", "ttfb_ms"):
+            before, after = previous[metric].get("p95"), current[metric].get("p95")
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{name} {metric} p95: {before} → {after}")
+        before, after = previous.get("throughput_rps"), current.get("throughput_rps")
+        if before and after and after < before * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {before} → {after}")
+    return regressions
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_table(results: dict):
+    print(f"{'接口':<18}{'成功/总数':>10}{'吞吐(rps)':>11}{'p50':>9}{'p95':>9}{'p99':>9}{'TTFB p50':>10}{'TTFB p95':>10}")
+    for name, r in results["endpoints"].items():
+        lat, ttfb = r["latency_ms"], r["ttfb_ms"]
+        print(
+            f"{name:<18}{r['ok']:>5}/{r['requests']:<4}{r['throughput_rps'] or 0:>11}"
+            f"{lat['p50'] or '-':>9}{lat['p95'] or '-':>9}{lat['p99'] or '-':>9}"
+            f"{ttfb['p50'] or '-':>10}{ttfb['p95'] or '-':>10}"
+        )
+        if r["errors"]:
+            print(f"{'':<18}错误: {r['errors']}")
+
+
+async def run(args) -> dict:
+    _, app_url = start_app()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=args.timeout) as client:
+        for name in args.endpoints:
+            scenario = SCENARIOS[name]
+            if args.warmup:
+                await run_scenario(client, scenario, args.warmup, args.concurrency, args.repeat)
+            results[name] = await run_scenario(client, scenario, args.requests, args.concurrency, args.repeat)
+        status = (await client.get("/api/status")).json()
+    return {"endpoints": results, "status": status}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.py 端到端压测")
+    parser.add_argument("--endpoints", default=",".join(SCENARIOS),
+                        help=f"逗号分隔，可选: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=100, help="每个接口的请求数")
+    parser.add_argument("--warmup", type=int, default=0, help="每个接口正式计时前的预热请求数")
+    parser.add_argument("--profile", default="fast", choices=sorted(PROFILES), help="替身上游的延迟 / 故障配置")
+    parser.add_argument("--repeat", action="store_true", help="所有请求使用相同输入（测缓存命中路径）")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", default=None, help="结果文件，默认 benchmarks/results/e2e-<时间>.json")
+    parser.add_argument("--baseline", default=None, help="对比的历史结果文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的变差比例")
+    args = parser.parse_args()
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知接口: {', '.join(unknown)}")
+
+    # app.py 在导入时创建 QwenService，必须先把上游指向替身服务
+    _, upstream_url = start_stand_in(PROFILES[args.profile])
+    os.environ["QWEN_BASE_URL"] = upstream_url
+    os.environ.setdefault("MODELSCOPE_API_KEY", "stand-in")
+
+    run_results = asyncio.run(run(args))
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "profile": args.profile,
+            "repeat": args.repeat,
+        },
+        **run_results,
+    }
+
+    print_table(results)
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"变差: {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"与基线相比没有超过 {args.tolerance:.0%} 的变差")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+模型输出解析对比：原正则写法 vs llm_parser 单遍解析
+构造不同规模的模拟输出（含思考块、说明文字中的括号、截断、不闭合的括号），统计每种写法的耗时和是否解析正确
+
+用法：
+    python benchmarks/llm_parser.py
+"""
+
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_parser import JsonExtractor, parse_json
+
+
+def regex_parse(text: str, kind: str = "object"):
+    """QwenService 原来的写法：去思考块 → 贪婪正则 → json.loads"""
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+    pattern = r'\{[\s\S]+\}' if kind == "object" else r'\[[\s\S]+\]'
+    match = re.search(pattern, text)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group())
+    except ValueError:
+        return None
+
+
+def make_jobs(count: int) -> list:
+    return [
+        {
+            "id": f"job_{i}",
+            "title": "后端开发工程师",
+            "company": "星火科技",
+            "salary": "15-25K",
+            "requirements": ["熟悉 Python {asyncio}", "了解 [分布式] 系统"],
+            "description": "负责核心服务的设计与开发，参与性能优化。" * 3,
+        }
+        for i in range(count)
+    ]
+
+
+def make_cases(count: int) -> dict:
+    jobs = make_jobs(count)
+    body = json.dumps(jobs, ensure_ascii=False, indent=2)
+    think = "<think>" + "先分析简历 {学历, 专业} 再决定 [职位] 数量。" * (count * 4) + "</think>"
+    truncated = body[:int(len(body) * 0.9)]
+    return {
+        # (输出文本, kind, 期望结果)
+        "clean": (body, "array", jobs),
+        "think+prose": (f"{think}\n以下是职位列表：\n{body}\n注：薪资仅供参考 [单位: 元]", "array", jobs),
+        "truncated": (think + truncated, "array", None),
+        "unbalanced": ("{" * (count * 20) + truncated, "object", None),
+        # 只有开括号、没有闭括号：贪婪正则在每个 '{' 处都要回溯到结尾
+        "runaway": ("请补充 {" * (count * 4), "object", None),
+    }
+
+
+def time_call(fn, *args) -> float:
+    runs, total = timeit.Timer(lambda: fn(*args)).autorange()
+    return total / runs * 1000
+
+
+def streamed(text: str, kind: str):
+    extractor = JsonExtractor(kind, partial_items=False)
+    for i in range(0, len(text), 16):
+        if extractor.feed(text[i:i + 16]):
+            break
+    return extractor.finish()
+
+
+def main():
+    print(f"{'jobs':>5} {'case':<12} {'chars':>8} {'regex ms':>10} {'single ms':>10} {'stream ms':>10}  regex / single 结果")
+    for count in (15, 100, 500):
+        for name, (text, kind, expected) in make_cases(count).items():
+            regex_result = regex_parse(text, kind)
+            single_result = parse_json(text, kind, partial_items=False)
+
+            def verdict(result):
+                if expected is None:
+                    return f"{len(result)} 项" if isinstance(result, list) else "失败"
+                return "正确" if result == expected else "错误"
+
+            print(
+                f"{count:>5} {name:<12} {len(text):>8} "
+                f"{time_call(regex_parse, text, kind):>10.2f} "
+                f"{time_call(parse_json, text, kind, False):>10.2f} "
+                f"{time_call(streamed, text, kind):>10.2f}  "
+                f"{verdict(regex_result)} / {verdict(single_result)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Prompt 前缀复用测量
+用一组不同的玩家 / 面试 / 简历输入构建 prompt（不调用上游），统计每个接口：
+- 静态前缀长度及其在整个 system prompt 中的占比
+- 前缀复用率（使用已编译前缀的调用占比）
+- 与上一个请求实际共享的前缀长度
+
+用法：
+    python benchmarks/prompt_prefix.py
+"""
+
+import itertools
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import NPC_PROFILES
+from prompt_templates import PromptLibrary
+from qwen_service import QwenService
+
+
+def main():
+    random.seed(7)
+    service = QwenService()
+    service.prompts = PromptLibrary(measure=True)
+
+    names = ["小明", "阿强", "Lily", "王小二"]
+    for npc_name, player in itertools.product(NPC_PROFILES, names):
+        service._build_npc_messages(
+            npc_name, NPC_PROFILES[npc_name], "你好",
+            player_info={"name": player, "position": "实习生", "day": random.randint(1, 30)},
+            workplace_status={"kpi": random.randint(30, 90), "stress": random.randint(0, 80)}
+        )
+
+    companies = [
+        {"name": "字节跳动", "type": "大厂"},
+        {"name": "星火科技", "type": "初创"},
+        {"name": "国家电网", "type": "国企"},
+        {"name": "中软数据", "type": "中型"},
+    ]
+    for company, round_num, pressure in itertools.product(companies, (1, 2), (False, True)):
+        service._build_interview_messages(
+            player_info={"name": random.choice(names), "skills": ["Python", "Vue"], "experience": random.randint(0, 6)},
+            company_info=company,
+            job_info={"title": random.choice(["后端开发", "前端开发", "产品经理"])},
+            round_info={"round": round_num, "interviewerRole": "技术面试官", "isPressure": pressure},
+            conversation_history=[{"role": "assistant", "content": "说说你的项目"}, {"role": "player", "content": "我做过电商"}]
+        )
+
+    for _ in range(10):
+        service._build_job_listing_messages(
+            {"name": random.choice(names), "education": random.choice(["本科", "硕士"]),
+             "major": random.choice(["计算机", "金融"]), "experience": random.randint(0, 8),
+             "skills": random.sample(["Java", "Go", "SQL", "Excel", "PS"], 2)},
+            count=15
+        )
+
+    print(json.dumps(service.prompts.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+多后端路由演练
+用两个本地替身后端（不调用任何上游）模拟一次故障过程，观察路由分布和故障切换：
+1. 正常：fast（约 20ms）与 slow（约 60ms）都健康，流量应集中到 fast
+2. 故障：fast 开始全部报错，调用应立即切到 slow，且不需要重启
+3. 恢复：fast 恢复，冷却期满探测成功后流量回到 fast
+
+用法：
+    python benchmarks/provider_router.py
+"""
+
+from collections import Counter
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from provider_router import Provider, ProviderRouter
+
+
+class StandInProvider(Provider):
+    """按设定延迟返回固定结果的本地替身后端"""
+
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.latency = latency
+        self.failing = False
+
+    async def chat_with_npc(self, npc_name, npc_profile, player_message, **kwargs):
+        await asyncio.sleep(self.latency * random.uniform(0.8, 1.2))
+        if self.failing:
+            raise ConnectionError(f"{self.name} 不可用")
+        return {"npc_response": f"[{self.name}] 收到：{player_message}", "emotion": "neutral", "relationship_change": 0}
+
+    async def generate_tasks(self, player_info, current_time="09:00"):
+        await asyncio.sleep(self.latency * 2)
+        return None if self.failing else {"daily_message": self.name, "tasks": []}
+
+
+async def run_phase(router: ProviderRouter, calls: int, concurrency: int = 8) -> Counter:
+    served = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            result = await router.call("chat_with_npc", "张经理", {}, f"第{i}条")
+            served[result["npc_response"].split("]")[0][1:] if result else "fallback"] += 1
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return served
+
+
+async def main():
+    random.seed(3)
+    fast = StandInProvider("fast", 0.02)
+    slow = StandInProvider("slow", 0.06)
+    router = ProviderRouter([slow, fast], cooldown=0.5, explore_rate=0.05)
+
+    normal = await run_phase(router, 200)
+    fast.failing = True
+    outage = await run_phase(router, 200)
+    fast.failing = False
+    await asyncio.sleep(0.6)
+    recovered = await run_phase(router, 200)
+
+    print("正常:", dict(normal))
+    print("故障:", dict(outage))
+    print("恢复:", dict(recovered))
+    print(json.dumps(router.stats(), ensure_ascii=False, indent=2))
+
+    checks = {
+        "正常时大部分流量走 fast": normal["fast"] > normal["slow"] * 3,
+        "故障期间没有调用落到兜底": outage["fallback"] == 0,
+        "故障期间流量切到 slow": outage["slow"] >= 190,
+        "恢复后流量回到 fast": recovered["fast"] > recovered["slow"] * 3,
+    }
+    for name, ok in checks.items():
+        print(f"{'OK  ' if ok else 'FAIL'} {name}")
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
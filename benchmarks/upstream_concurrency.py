@@ -0,0 +1,91 @@
+"""
+上游并发压测
+启动本地替身大模型服务（固定延迟），对比：
+- 旧实现：在 async 函数里调用同步 OpenAI 客户端（阻塞事件循环，N 个请求串行）
+- 新实现：UpstreamClient 异步客户端（N 个请求并发，总耗时约等于单次耗时）
+
+每个请求的内容互不相同：QwenService 层的 SingleFlight / 响应缓存会把相同的调用合并成一次，
+那样测到的是合并效果而不是连接池 / 并发上限，所以这里直接压 UpstreamClient.complete
+
+用法：
+    python benchmarks/upstream_concurrency.py --concurrency 8 --delay 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import UpstreamClient
+from stand_in_llm import StandInProfile, start_stand_in
+
+
+def start_upstream(delay: float) -> tuple:
+    """在后台线程启动每个请求固定延迟 delay 秒的替身上游，返回 (server, base_url)"""
+    return start_stand_in(StandInProfile(ttft_ms=delay * 1000, ttft_sigma=0, tokens_per_sec=0))
+
+
+async def run_blocking(base_url: str, concurrency: int) -> float:
+    """旧实现：同步客户端在协程中调用"""
+    from openai import OpenAI
+    client = OpenAI(base_url=base_url, api_key="bench")
+
+    async def one():
+        client.chat.completions.create(
+            model="bench",
+            messages=[{"role": "user", "content": "hi"}],
+            stream=False
+        )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_async(base_url: str, concurrency: int) -> float:
+    """新实现：UpstreamClient 异步客户端，每个请求的消息各不相同"""
+    client = UpstreamClient(api_key="bench", base_url=base_url, max_inflight=concurrency)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        client.complete(
+            model="bench",
+            messages=[{"role": "user", "content": f"hi #{i}"}],
+            endpoint="bench"
+        )
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    assert all(results), "上游返回为空"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游并发压测")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=1.0, help="假上游单次延迟（秒）")
+    args = parser.parse_args()
+
+    server, base_url = start_upstream(args.delay)
+    try:
+        blocking = asyncio.run(run_blocking(base_url, args.concurrency))
+        non_blocking = asyncio.run(run_async(base_url, args.concurrency))
+    finally:
+        server.should_exit = True
+
+    print(f"并发数: {args.concurrency}, 单次上游延迟: {args.delay:.2f}s")
+    print(f"同步客户端（阻塞事件循环）: {blocking:.2f}s")
+    print(f"异步客户端（UpstreamClient）: {non_blocking:.2f}s")
+    print(f"加速比: {blocking / non_blocking:.1f}x")
+
+    # 异步实现的总耗时应接近单次延迟，而不是 N 倍
+    if non_blocking > args.delay * 2:
+        print("失败: 异步客户端未能并发执行上游请求")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+上游熔断器
+上游连续失败后的一段时间内直接拒绝调用，让请求立即走本地兜底，而不是排队等超时
+"""
+
+import os
+import time
+
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝上游调用"""
+
+
+class CircuitBreaker:
+    """
+    closed → open → half_open 三态熔断
+
+    - closed: 正常放行，连续失败 failure_threshold 次后打开
+    - open: 直接拒绝，reset_timeout 秒后进入 half_open
+    - half_open: 只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or int(os.getenv("QWEN_BREAKER_FAILURES", "5"))
+        self.reset_timeout = reset_timeout or float(os.getenv("QWEN_BREAKER_RESET", "30"))
+
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+        self.opened = 0    # 打开次数
+        self.rejected = 0  # 熔断期间被直接拒绝的调用数
+
+    def allow(self) -> bool:
+        """是否放行一次调用；放行后必须调用 record_success / record_failure / release 之一"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probing = False
+
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """调用既不算成功也不算失败（如客户端断开、请求参数错误）"""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
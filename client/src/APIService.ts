@@ -4,7 +4,7 @@
  */
 
 // 使用相对路径，在本地开发时代理到后端，部署时使用同一域名
-const API_BASE_URL = import.meta.env.MODE === 'development'
+export const API_BASE_URL = import.meta.env.MODE === 'development'
     ? 'http://localhost:7860'
     : '';  // 生产环境使用相对路径
 
@@ -3,6 +3,8 @@
  * 模拟真实股票交易规则：涨跌停、K线、分时、手续费等
  */
 
+import { API_BASE_URL } from './APIService';
+
 // ========== 类型定义 ==========
 
 /** 股票基本信息 */
@@ -65,6 +67,9 @@ class StockMarket {
     private timelineData: Map<string, TimeLineData[]> = new Map();
     private updateInterval: number | null = null;
     private listeners: ((stocks: Stock[]) => void)[] = [];
+    private lastServerTick: number = -1;
+    private eventSource: EventSource | null = null;
+    private deltaFields: string[] = [];
 
     constructor() {
         this.initializeStocks();
@@ -177,16 +182,109 @@ class StockMarket {
 
     /** 启动行情更新 */
     startMarket(): void {
-        if (this.updateInterval) return;
+        if (this.updateInterval || this.eventSource) return;
+
+        // 优先订阅服务端行情推送（所有玩家共享），订阅不上时退回轮询
+        if (typeof EventSource !== 'undefined') {
+            this.subscribeToServer();
+        } else {
+            this.startPolling();
+        }
+    }
 
-        // 每3秒更新一次行情
+    /** 订阅服务端推送：snapshot 为完整行情，tick 为只含变动股票的增量 */
+    private subscribeToServer(): void {
+        const source = new EventSource(`${API_BASE_URL}/api/market/stream`);
+        this.eventSource = source;
+
+        source.addEventListener('hello', event => {
+            this.deltaFields = JSON.parse((event as MessageEvent).data).fields;
+        });
+        source.addEventListener('snapshot', event => {
+            this.applyServerMarket(JSON.parse((event as MessageEvent).data));
+        });
+        source.addEventListener('tick', event => {
+            this.applyServerDelta(JSON.parse((event as MessageEvent).data));
+        });
+        source.onerror = () => {
+            // 已连上过则交给浏览器自动重连（重连后会重新收到完整快照），从未连上则改为轮询
+            if (this.lastServerTick < 0 || source.readyState === EventSource.CLOSED) {
+                source.close();
+                this.eventSource = null;
+                this.startPolling();
+            }
+        };
+    }
+
+    /** 每3秒轮询一次服务端行情，服务端不可用时退回本地模拟 */
+    private startPolling(): void {
+        if (this.updateInterval) return;
         this.updateInterval = window.setInterval(() => {
-            this.updatePrices();
+            this.syncFromServer().catch(() => this.updatePrices());
         }, 3000);
     }
 
+    /** 从服务端拉取行情，覆盖本地股票数据 */
+    private async syncFromServer(): Promise<void> {
+        const response = await fetch(`${API_BASE_URL}/api/market`);
+        if (!response.ok) {
+            throw new Error(`行情请求失败: ${response.status}`);
+        }
+        this.applyServerMarket(await response.json());
+    }
+
+    /** 应用服务端的完整行情 */
+    private applyServerMarket(market: { tick: number; stocks: Partial<Stock>[] }): void {
+        if (market.tick === this.lastServerTick) return;
+        const firstSync = this.lastServerTick < 0;
+        this.lastServerTick = market.tick;
+        if (firstSync) {
+            // 首次连上服务端：用服务端日K替换本地生成的历史，保证与实时行情连续
+            this.loadServerKLines().catch(() => undefined);
+        }
+
+        market.stocks.forEach(data => {
+            const stock = data.code ? this.stocks.get(data.code) : undefined;
+            if (!stock) return;
+            Object.assign(stock, data);
+            this.updateTimeline(stock);
+        });
+        this.notifyListeners();
+    }
+
+    /** 应用服务端的增量行情：每行按 hello 下发的字段顺序排列 */
+    private applyServerDelta(delta: { tick: number; stocks: unknown[][] }): void {
+        this.lastServerTick = delta.tick;
+        delta.stocks.forEach(row => {
+            const data: Record<string, unknown> = {};
+            this.deltaFields.forEach((field, i) => { data[field] = row[i]; });
+            const stock = this.stocks.get(data.code as string);
+            if (!stock) return;
+            Object.assign(stock, data);
+            this.updateTimeline(stock);
+        });
+        this.notifyListeners();
+    }
+
+    /** 从服务端拉取每只股票的日K历史 */
+    private async loadServerKLines(): Promise<void> {
+        await Promise.all(Array.from(this.stocks.keys()).map(async code => {
+            const response = await fetch(`${API_BASE_URL}/api/market/history?code=${code}&interval=day`);
+            if (!response.ok) return;
+            const history: { candles: KLineData[] } = await response.json();
+            if (history.candles.length > 0) {
+                this.klineHistory.set(code, history.candles);
+            }
+        }));
+        this.notifyListeners();
+    }
+
     /** 停止行情更新 */
     stopMarket(): void {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
         if (this.updateInterval) {
             clearInterval(this.updateInterval);
             this.updateInterval = null;
@@ -0,0 +1,173 @@
+"""
+对话历史窗口
+按 token 预算（而不是消息条数）截取最近的对话，滑出窗口的轮次在后台折叠进滚动摘要
+"""
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import math
+import re
+
+
+logger = logging.getLogger(__name__)
+
+
+# 中日韩统一表意文字 + 全角标点
+_CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_WORD = re.compile(r'[A-Za-z0-9_]+')
+
+# Qwen 分词器下常用汉字平均约 1.4 字 / token，英文单词约 4 字符 / token
+CJK_TOKENS_PER_CHAR = 0.7
+ASCII_CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本的 token 数（针对中文调优，无需加载分词器）"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    words = _WORD.findall(text)
+    word_tokens = sum(math.ceil(len(w) / ASCII_CHARS_PER_TOKEN) for w in words)
+    word_chars = sum(len(w) for w in words)
+    # 剩余的标点、空白、符号按每 2 个字符 1 个 token 估算
+    other = len(text) - cjk - word_chars - text.count(' ')
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + word_tokens + max(other, 0) / 2)
+
+
+def message_tokens(msg: dict) -> int:
+    return estimate_tokens(str(msg.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """保留文本末尾不超过 budget 个 token 的部分"""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if estimate_tokens(text[mid:]) <= budget:
+            hi = mid
+        else:
+            lo = mid + 1
+    return "…" + text[lo:]
+
+
+def _local_summary(previous: Optional[str], messages: List[dict], limit: int = 200) -> str:
+    """不调用大模型的摘要：每条消息保留开头一小段"""
+    parts = [previous] if previous else []
+    for msg in messages:
+        content = " ".join(str(msg.get("content", "")).split())
+        speaker = "玩家" if msg.get("role") == "player" else "对方"
+        parts.append(f"{speaker}：{content[:30]}{'…' if len(content) > 30 else ''}")
+    summary = "；".join(parts)
+    return summary if len(summary) <= limit else "…" + summary[-limit:]
+
+
+class ConversationWindow:
+    """
+    token 预算窗口 + 滚动摘要
+
+    摘要按 "被折叠的最后一条消息" 的指纹存储（指纹包含会话范围和前一条消息），
+    客户端自行裁剪历史时也能找回之前折叠好的摘要。摘要计算在后台进行，不阻塞请求。
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int,
+        summarizer: Callable[[Optional[str], List[dict]], Awaitable[str]] = None,
+        max_summaries: int = 2048
+    ):
+        self.budget_tokens = budget_tokens
+        self.summarizer = summarizer
+        self.max_summaries = max_summaries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._pending = {}
+
+    def select(self, history: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """从最新的消息往前取，直到用完 token 预算；返回 (窗口内消息, 滑出的消息)"""
+        history = history or []
+        used = 0
+        start = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            cost = message_tokens(history[i])
+            if used + cost > self.budget_tokens and start < len(history):
+                break
+            used += cost
+            start = i
+            if used >= self.budget_tokens:
+                break
+
+        kept = list(history[start:])
+        if kept and used > self.budget_tokens:
+            # 单条消息就超出预算：只保留其末尾
+            last = dict(kept[-1])
+            last["content"] = truncate_to_tokens(
+                str(last.get("content", "")), self.budget_tokens - MESSAGE_OVERHEAD_TOKENS)
+            kept[-1] = last
+        return kept, list(history[:start])
+
+    def build(self, scope: str, history: List[dict]) -> Tuple[List[dict], Optional[str]]:
+        """
+        返回 (窗口内消息, 更早对话的摘要)
+
+        scope 用来区分不同会话（如 NPC + 玩家）；摘要尚未算好时返回已有的旧摘要或 None
+        """
+        kept, dropped = self.select(history)
+        if not dropped:
+            return kept, None
+
+        fingerprints = self._fingerprints(scope, dropped)
+        summary = None
+        covered = -1
+        for i in range(len(dropped) - 1, -1, -1):
+            if fingerprints[i] in self._summaries:
+                summary = self._summaries[fingerprints[i]]
+                self._summaries.move_to_end(fingerprints[i])
+                covered = i
+                break
+
+        unfolded = dropped[covered + 1:]
+        if unfolded:
+            self._schedule_fold(fingerprints[-1], summary, unfolded)
+        return kept, summary
+
+    @staticmethod
+    def _fingerprints(scope: str, messages: List[dict]) -> List[str]:
+        result = []
+        prev = ""
+        for msg in messages:
+            current = f"{msg.get('role', '')}:{msg.get('content', '')}"
+            result.append(hashlib.sha1(f"{scope}|{prev}|{current}".encode("utf-8")).hexdigest())
+            prev = current
+        return result
+
+    def _schedule_fold(self, target: str, previous: Optional[str], messages: List[dict]):
+        if target in self._pending:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._fold(target, previous, messages))
+        except RuntimeError:
+            # 没有事件循环（同步调用场景）：直接做本地摘要
+            self._store(target, _local_summary(previous, messages))
+            return
+        self._pending[target] = task
+        task.add_done_callback(lambda _: self._pending.pop(target, None))
+
+    async def _fold(self, target: str, previous: Optional[str], messages: List[dict]):
+        summary = None
+        if self.summarizer:
+            try:
+                summary = await self.summarizer(previous, messages)
+            except Exception:
+                logger.exception("对话摘要生成失败，改用本地摘要")
+        self._store(target, summary or _local_summary(previous, messages))
+
+    def _store(self, fingerprint: str, summary: str):
+        self._summaries[fingerprint] = summary
+        self._summaries.move_to_end(fingerprint)
+        while len(self._summaries) > self.max_summaries:
+            self._summaries.popitem(last=False)
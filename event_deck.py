@@ -0,0 +1,680 @@
+"""
+职场事件牌库
+事件按 (事件类型, KPI 段, 压力段, 名声段, 同事关系) 分桶，每个桶是一个带权重的牌堆：
+抽牌 O(log n)，同一玩家近期抽过的事件不再出现；AI 生成的事件发出几次后退役，
+后台按各桶的消耗速度优先补充消耗最快的桶
+"""
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import bisect
+import copy
+import itertools
+import logging
+import math
+import os
+import random
+import time
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+
+EVENT_TYPES = ("politics", "bullying", "opportunity", "crisis")
+
+# 各状态的分段边界：低于第一个值为 low，低于第二个值为 mid，否则 high
+BANDS = {
+    "kpi": ((40, 75), 60),
+    "stress": ((30, 70), 20),
+    "reputation": ((-10, 30), 0),
+}
+BAND_NAMES = ("low", "mid", "high")
+# 与任一同事关系不高于该值时视为关系紧张
+STRAINED_RELATIONSHIP = -30
+
+
+def _band(status: dict, name: str) -> str:
+    bounds, default = BANDS[name]
+    try:
+        value = float(status.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return BAND_NAMES[bisect.bisect_right(bounds, value)]
+
+
+def _relations(status: dict) -> str:
+    relationships = status.get("relationships")
+    if isinstance(relationships, dict):
+        values = [v for v in relationships.values() if isinstance(v, (int, float))]
+        if values and min(values) <= STRAINED_RELATIONSHIP:
+            return "strained"
+    return "normal"
+
+
+def state_key(workplace_status: dict) -> Tuple[str, str, str, str]:
+    """职场状态分桶键：(KPI 段, 压力段, 名声段, 同事关系)"""
+    status = workplace_status or {}
+    return _band(status, "kpi"), _band(status, "stress"), _band(status, "reputation"), _relations(status)
+
+
+def _representative_status(key: Tuple[str, str, str, str]) -> dict:
+    """分桶对应的典型状态（补充事件时写进 prompt）"""
+    status = {}
+    for name, band in zip(("kpi", "stress", "reputation"), key):
+        (low, high), _ = BANDS[name]
+        status[name] = {"low": low - 15, "mid": (low + high) // 2, "high": high + 10}[band]
+    if key[3] == "strained":
+        status["relationships"] = {"李同事": STRAINED_RELATIONSHIP - 10}
+    return status
+
+
+class WeightedBag:
+    """
+    带权重的集合（树状数组）
+
+    追加、改权重、按权重抽样都是 O(log n)；权重置 0 即移出抽样范围
+    """
+
+    def __init__(self):
+        self.items: list = []
+        self.weights: List[float] = []
+        self._tree: List[float] = [0.0]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def total(self) -> float:
+        return self._prefix(len(self.items))
+
+    def _prefix(self, i: int) -> float:
+        s = 0.0
+        while i > 0:
+            s += self._tree[i]
+            i -= i & -i
+        return s
+
+    def add(self, item, weight: float) -> int:
+        i = len(self.items) + 1
+        self.items.append(item)
+        self.weights.append(weight)
+        # 新节点覆盖 (i - lowbit(i), i]，其余部分由已有的前缀和求出
+        self._tree.append(weight + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+        return i - 1
+
+    def update(self, index: int, weight: float):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def sample(self, rng: random.Random) -> Optional[int]:
+        total = self.total
+        if total <= 0:
+            return None
+        target = rng.random() * total
+        pos, step = 0, 1 << len(self.items).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        # 浮点误差可能落到权重为 0 的位置，向后找最近的有效项
+        while pos < len(self.items) and self.weights[pos] <= 0:
+            pos += 1
+        return pos if pos < len(self.items) else None
+
+
+@dataclass
+class EventCard:
+    id: str
+    event: dict
+    weight: float
+    uses_left: Optional[int] = None  # None 为常驻（内置事件）
+    dealt: int = 0
+
+
+@dataclass
+class _Pile:
+    bag: WeightedBag = field(default_factory=WeightedBag)
+    titles: Dict[str, str] = field(default_factory=dict)  # 标题 → 牌 id，用于去重
+    generated: int = 0          # 仍在堆中的 AI 生成事件数
+    retired: int = 0
+    draws: float = 0.0          # 按时间衰减的抽牌次数，衡量消耗速度
+    updated: float = 0.0
+
+    def touch(self, now: float, half_life: float):
+        if self.updated:
+            self.draws *= math.exp(-(now - self.updated) * math.log(2) / half_life)
+        self.updated = now
+
+
+class EventDeck:
+    """
+    按事件类型 + 职场状态分桶的事件牌库
+
+    - draw() 从匹配的桶按权重抽取，跳过该玩家最近抽过的事件；全部抽过时返回 None
+      （上游失败后的 allow_repeat 兜底抽取单独计数，不重复计入命中 / 未命中）
+    - AI 生成的事件发出 card_uses 次后退役，桶内 AI 事件低于 low_water 时加入补充队列，
+      后台按消耗速度从快到慢依次补充
+    """
+
+    def __init__(
+        self,
+        service=None,
+        low_water: int = None,
+        target_size: int = None,
+        card_uses: int = None,
+        history_size: int = None,
+        batch_size: int = 4,
+        max_players: int = 5000,
+        half_life: float = 300.0,
+        seed: int = None
+    ):
+        self.service = service
+        self.low_water = low_water or int(os.getenv("EVENT_DECK_LOW_WATER", "4"))
+        self.target_size = target_size or int(os.getenv("EVENT_DECK_SIZE", "12"))
+        self.card_uses = card_uses or int(os.getenv("EVENT_CARD_USES", "3"))
+        self.history_size = history_size or int(os.getenv("EVENT_HISTORY_SIZE", "20"))
+        self.batch_size = batch_size
+        self.max_players = max_players
+        self.half_life = half_life
+        self.rng = random.Random(seed)
+
+        self._piles: Dict[tuple, _Pile] = {}
+        self._histories: "OrderedDict[str, deque]" = OrderedDict()
+        self._seeds: Dict[tuple, dict] = {}  # 每个桶最近一次出现的玩家信息，用作补充时的 prompt
+        self._wanted: set = set()
+        self._refiller: Optional[asyncio.Task] = None
+
+        self.draws = 0
+        self.hits = 0
+        self.misses = 0
+        self.fallback_hits = 0    # allow_repeat 兜底抽取
+        self.fallback_misses = 0
+        self.repeats_skipped = 0
+        self.generated = 0
+        self.refills = 0
+
+        for card in SEED_EVENTS:
+            self._add_seed(card)
+
+    # ---------- 入库 ----------
+
+    def _pile(self, key: tuple) -> _Pile:
+        pile = self._piles.get(key)
+        if pile is None:
+            pile = self._piles[key] = _Pile()
+        return pile
+
+    def _add_seed(self, spec: dict):
+        """内置事件加入 when 指定的所有分段组合（省略的维度展开为全部分段）"""
+        when = spec.get("when", {})
+        dims = [
+            [when[name]] if name in when else BAND_NAMES
+            for name in ("kpi", "stress", "reputation")
+        ] + [[when["relations"]] if "relations" in when else ("normal", "strained")]
+        weight = spec.get("weight", 1.0)
+        card = EventCard(f"evt_{spec['id']}", spec["event"], weight)
+        for state in itertools.product(*dims):
+            pile = self._pile((spec["event"]["type"],) + state)
+            pile.bag.add(card, weight)
+            pile.titles[spec["event"]["title"]] = card.id
+
+    def add(
+        self,
+        event: dict,
+        event_type: str,
+        workplace_status: dict,
+        weight: float = 1.0,
+        player: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        加入一个 AI 生成的事件，返回牌的 id；同桶已有同名事件时不重复加入，返回已有那张牌的 id
+
+        传入 player 表示这个事件已经发给了该玩家：计入其历史，之后不会再抽给他
+        """
+        if not isinstance(event, dict) or not event.get("title"):
+            return None
+        event_type = event_type if event_type in EVENT_TYPES else event.get("type", "opportunity")
+        key = (event_type,) + state_key(workplace_status)
+        card_id = self._add_generated(key, event, weight) or self._piles[key].titles.get(event["title"])
+        history = self._history(player)
+        if card_id is not None and history is not None:
+            history.append(card_id)
+        return card_id
+
+    def _add_generated(self, key: tuple, event: dict, weight: float = 1.0) -> Optional[str]:
+        pile = self._pile(key)
+        if event["title"] in pile.titles:
+            return None
+        event = {k: v for k, v in event.items() if k != "id"}
+        card = EventCard(f"evt_{uuid.uuid4().hex[:12]}", event, weight, uses_left=self.card_uses)
+        pile.bag.add(card, weight)
+        pile.titles[event["title"]] = card.id
+        pile.generated += 1
+        self.generated += 1
+        return card.id
+
+    # ---------- 抽牌 ----------
+
+    def draw(
+        self,
+        event_type: str,
+        workplace_status: dict,
+        player: Optional[str] = None,
+        player_info: Optional[dict] = None,
+        allow_repeat: bool = False
+    ) -> Optional[dict]:
+        """按权重抽一个事件（返回副本）；该玩家已抽过桶内全部事件时返回 None"""
+        if not allow_repeat:
+            self.draws += 1
+        state = state_key(workplace_status)
+        if event_type not in EVENT_TYPES:
+            event_type = self._pick_type(state)
+        key = (event_type,) + state
+        pile = self._piles.get(key)
+        if player_info:
+            self._seeds[key] = player_info
+
+        history = self._history(player)
+        index = self._sample(pile, history, allow_repeat) if pile else None
+        if allow_repeat:
+            # 兜底抽取：同一请求的正常抽取已经计过消耗速度、触发过补充
+            if index is None:
+                self.fallback_misses += 1
+                return None
+            self.fallback_hits += 1
+        else:
+            if pile is not None:
+                pile.touch(time.monotonic(), self.half_life)
+                pile.draws += 1
+            self._maybe_refill(key)
+            if index is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        card = pile.bag.items[index]
+        card.dealt += 1
+        if card.uses_left is not None:
+            card.uses_left -= 1
+            if card.uses_left <= 0:
+                self._retire(key, pile, index)
+        if history is not None:
+            history.append(card.id)
+        return {**copy.deepcopy(card.event), "id": card.id}
+
+    def _pick_type(self, state: tuple) -> str:
+        """随机事件：按各类型在该状态下的牌堆权重选类型"""
+        weights = [self._piles[(t,) + state].bag.total if (t,) + state in self._piles else 0 for t in EVENT_TYPES]
+        if not any(weights):
+            return self.rng.choice(EVENT_TYPES)
+        return self.rng.choices(EVENT_TYPES, weights=weights)[0]
+
+    def _history(self, player: Optional[str]) -> Optional[deque]:
+        if not player:
+            return None
+        history = self._histories.get(player)
+        if history is None:
+            history = self._histories[player] = deque(maxlen=self.history_size)
+            if len(self._histories) > self.max_players:
+                self._histories.popitem(last=False)
+        else:
+            self._histories.move_to_end(player)
+        return history
+
+    def _sample(self, pile: _Pile, history: Optional[deque], allow_repeat: bool) -> Optional[int]:
+        bag = pile.bag
+        seen = set(history) if history and not allow_repeat else ()
+        # 先拒绝采样：近期历史远小于牌堆时几次内就能抽到
+        for _ in range(8):
+            index = bag.sample(self.rng)
+            if index is None:
+                return None
+            if bag.items[index].id not in seen:
+                return index
+            self.repeats_skipped += 1
+        # 历史占了牌堆的大部分：排除历史后精确抽取
+        candidates = [i for i, card in enumerate(bag.items) if bag.weights[i] > 0 and card.id not in seen]
+        if not candidates:
+            return None
+        return self.rng.choices(candidates, weights=[bag.weights[i] for i in candidates])[0]
+
+    def _retire(self, key: tuple, pile: _Pile, index: int):
+        card = pile.bag.items[index]
+        pile.bag.update(index, 0.0)
+        pile.titles.pop(card.event["title"], None)
+        pile.generated -= 1
+        pile.retired += 1
+        # 退役的牌过半时重建牌堆，避免树状数组里堆积无效项
+        if pile.retired * 2 > len(pile.bag):
+            live = [(c, w) for c, w in zip(pile.bag.items, pile.bag.weights) if w > 0]
+            pile.bag = WeightedBag()
+            for c, w in live:
+                pile.bag.add(c, w)
+            pile.retired = 0
+
+    # ---------- 后台补充 ----------
+
+    def _maybe_refill(self, key: tuple):
+        if self.service is None:
+            return
+        pile = self._piles.get(key)
+        if pile is not None and pile.generated >= self.low_water:
+            return
+        self._wanted.add(key)
+        if self._refiller is None or self._refiller.done():
+            try:
+                self._refiller = asyncio.get_running_loop().create_task(self._refill_loop())
+            except RuntimeError:
+                # 不在事件循环中（如脚本里直接调用）时不补充
+                pass
+
+    def _next_refill(self) -> Optional[tuple]:
+        """待补充的桶中消耗最快的一个"""
+        if not self._wanted:
+            return None
+        now = time.monotonic()
+        for key in self._wanted:
+            if key in self._piles:
+                self._piles[key].touch(now, self.half_life)
+        key = max(self._wanted, key=lambda k: self._piles[k].draws if k in self._piles else 0)
+        self._wanted.discard(key)
+        return key
+
+    async def _refill_loop(self):
+        while True:
+            key = self._next_refill()
+            if key is None:
+                return
+            try:
+                await self._refill(key)
+            except Exception:
+                logger.exception("事件牌库补充失败 %s", key)
+
+    async def _refill(self, key: tuple):
+        """补充到目标数量；上游失败或没有新事件时停止，等下次抽牌再试"""
+        pile = self._pile(key)
+        event_type, state = key[0], key[1:]
+        status = _representative_status(state)
+        while pile.generated < self.target_size:
+            events = await self.service.generate_workplace_events(
+                player_info=self._seeds.get(key, {}),
+                workplace_status=status,
+                event_type=event_type,
+                count=self.batch_size
+            )
+            added = sum(
+                self._add_generated(key, {**event, "type": event_type}) is not None for event in events or []
+            )
+            self.refills += 1
+            if not added:
+                return
+
+    def stats(self) -> dict:
+        piles = self._piles.values()
+        return {
+            "buckets": len(self._piles),
+            "events": sum(sum(1 for w in p.bag.weights if w > 0) for p in piles),
+            "generated_live": sum(p.generated for p in piles),
+            "draws": self.draws,
+            "hits": self.hits,
+            "misses": self.misses,
+            "fallback_hits": self.fallback_hits,
+            "fallback_misses": self.fallback_misses,
+            "repeats_skipped": self.repeats_skipped,
+            "generated": self.generated,
+            "refills": self.refills,
+            "refill_queue": len(self._wanted),
+            "players": len(self._histories),
+        }
+
+
+# ========== 内置事件 ==========
+# when 省略的维度表示任意分段；relations 为 strained 时只在与同事关系紧张时出现
+
+def _choice(text: str, **effects) -> dict:
+    return {"text": text, "effects": effects}
+
+
+SEED_EVENTS: List[dict] = [
+    # ---- 办公室政治 ----
+    {"id": "politics_faction", "event": {
+        "title": "派系拉拢",
+        "description": "张经理私下找到你，暗示如果你支持他的方案，可能会有好处...",
+        "type": "politics",
+        "choices": [
+            _choice("表示支持", kpi=5, reputation=-10, relationship={"张经理": 20}),
+            _choice("保持中立", kpi=0, reputation=5),
+            _choice("婉拒并告密", kpi=-10, reputation=15, relationship={"张经理": -30}),
+        ]}},
+    {"id": "politics_report", "weight": 1.5, "when": {"reputation": "high"}, "event": {
+        "title": "越级汇报",
+        "description": "王老板在电梯里单独问你项目进展，张经理就站在旁边。",
+        "type": "politics",
+        "choices": [
+            _choice("如实汇报并提到经理的贡献", reputation=5, relationship={"张经理": 10}),
+            _choice("趁机展示自己的成果", kpi=5, reputation=10, relationship={"张经理": -20}),
+            _choice("说一切都听经理安排", reputation=-3, relationship={"张经理": 5}),
+        ]}},
+    {"id": "politics_gossip", "event": {
+        "title": "茶水间八卦",
+        "description": "李同事在茶水间压低声音说张经理下个月要被调走，问你站哪边。",
+        "type": "politics",
+        "choices": [
+            _choice("跟着一起八卦", stress=-5, reputation=-5, relationship={"李同事": 10}),
+            _choice("笑笑不接话", reputation=3),
+            _choice("提醒他小心隔墙有耳", reputation=5, relationship={"李同事": -5}),
+        ]}},
+    {"id": "politics_blame_split", "when": {"kpi": "low"}, "weight": 1.5, "event": {
+        "title": "分锅会议",
+        "description": "项目延期，复盘会上大家都在暗示问题出在你负责的模块。",
+        "type": "politics",
+        "choices": [
+            _choice("拿出时间线逐条说明", stress=15, reputation=5),
+            _choice("主动认下一部分责任", kpi=-5, reputation=8, stress=10),
+            _choice("反指测试环节拖后腿", reputation=-8, relationship={"王测试": -25}),
+        ]}},
+    {"id": "politics_cold_war", "when": {"relations": "strained"}, "weight": 2.0, "event": {
+        "title": "被拉出群聊",
+        "description": "你发现项目小群里少了自己，大家最近的讨论你一概不知。",
+        "type": "politics",
+        "choices": [
+            _choice("直接问群主怎么回事", stress=10, reputation=3),
+            _choice("找经理反映协作问题", kpi=3, relationship={"李同事": -10}),
+            _choice("装作不知道，专心干活", stress=15, kpi=5),
+        ]}},
+    {"id": "politics_new_boss", "when": {"stress": "low"}, "event": {
+        "title": "新领导到任",
+        "description": "部门空降了一位新总监，第一次例会就点名让每个人谈谈改进建议。",
+        "type": "politics",
+        "choices": [
+            _choice("认真准备一份改进清单", stress=10, reputation=8, kpi=3),
+            _choice("说几句场面话", reputation=0),
+            _choice("借机吐槽现有流程", reputation=-5, relationship={"张经理": -15}),
+        ]}},
+
+    # ---- 职场霸凌 ----
+    {"id": "bullying_credit", "event": {
+        "title": "功劳被抢",
+        "description": "李同事在会议上把你的方案说成是他的想法，大家都在看着你...",
+        "type": "bullying",
+        "choices": [
+            _choice("当场揭穿", stress=20, reputation=10, relationship={"李同事": -40}),
+            _choice("忍气吞声", stress=30, reputation=-5),
+            _choice("会后私下沟通", stress=10, relationship={"李同事": -10}),
+        ]}},
+    {"id": "bullying_late_night", "event": {
+        "title": "深夜消息轰炸",
+        "description": "晚上十一点，工作群里有人@你：“这个怎么还没弄好？”，后面跟着三个问号。",
+        "type": "bullying",
+        "choices": [
+            _choice("立刻爬起来处理", kpi=5, stress=20),
+            _choice("回复明早第一时间处理", stress=5, reputation=2),
+            _choice("装作没看到", stress=-5, reputation=-5),
+        ]}},
+    {"id": "bullying_chores", "when": {"reputation": "low"}, "weight": 1.5, "event": {
+        "title": "杂活专员",
+        "description": "订会议室、取快递、买奶茶……这周的杂活又全落到了你头上。",
+        "type": "bullying",
+        "choices": [
+            _choice("全部接下", stress=15, relationship={"李同事": 5}),
+            _choice("在周会上提议轮值", reputation=5, stress=5, relationship={"李同事": -10}),
+            _choice("找行政要一份分工表", reputation=3, relationship={"赵行政": 10}),
+        ]}},
+    {"id": "bullying_overtime", "when": {"stress": "high"}, "weight": 1.5, "event": {
+        "title": "周五晚的需求",
+        "description": "下班前十分钟，张经理把一个“很简单”的需求丢给你，要求周一上线。",
+        "type": "bullying",
+        "choices": [
+            _choice("周末加班赶完", kpi=10, stress=25),
+            _choice("说明工作量，争取延期", stress=5, relationship={"张经理": -10}),
+            _choice("拉上李同事一起做", kpi=5, stress=10, relationship={"李同事": -15}),
+        ]}},
+    {"id": "bullying_mock", "when": {"relations": "strained"}, "weight": 2.0, "event": {
+        "title": "阴阳怪气",
+        "description": "你一进门，李同事就大声说：“哟，我们的大功臣来了。”周围有人在偷笑。",
+        "type": "bullying",
+        "choices": [
+            _choice("笑着回一句“过奖”", stress=5, reputation=5),
+            _choice("当众让他把话说清楚", stress=15, reputation=3, relationship={"李同事": -20}),
+            _choice("向 HR 反映", reputation=-3, relationship={"赵行政": 5, "李同事": -30}),
+        ]}},
+    {"id": "bullying_intern", "when": {"kpi": "low", "reputation": "low"}, "event": {
+        "title": "背锅实习生",
+        "description": "线上出了问题，有人在群里说“可能是新人改的配置”，但那天你根本没碰过。",
+        "type": "bullying",
+        "choices": [
+            _choice("贴出操作记录自证", reputation=10, stress=10),
+            _choice("私聊说明，不在群里争", stress=15),
+            _choice("沉默", reputation=-10, stress=20),
+        ]}},
+
+    # ---- 机会 ----
+    {"id": "opportunity_promotion", "when": {"kpi": "high"}, "weight": 2.0, "event": {
+        "title": "晋升机会",
+        "description": "公司有一个管理岗位空缺，你被列入候选名单！",
+        "type": "opportunity",
+        "choices": [
+            _choice("积极争取", stress=20, kpi=10),
+            _choice("顺其自然", stress=0),
+            _choice("主动让贤", stress=-10, reputation=5),
+        ]}},
+    {"id": "opportunity_project", "event": {
+        "title": "新项目招人",
+        "description": "公司要启动一个重点项目，王老板说可以自愿报名。",
+        "type": "opportunity",
+        "choices": [
+            _choice("马上报名", kpi=8, stress=15, reputation=5),
+            _choice("先问问项目前景", reputation=2),
+            _choice("手头太忙，不参加", stress=-5),
+        ]}},
+    {"id": "opportunity_cross_team", "event": {
+        "title": "跨部门协作",
+        "description": "隔壁部门的负责人来借人做一个两周的短项目，点名想要你。",
+        "type": "opportunity",
+        "choices": [
+            _choice("答应下来", reputation=8, stress=10, relationship={"张经理": -5}),
+            _choice("先征求经理意见", reputation=3, relationship={"张经理": 10}),
+            _choice("以手头工作为由推掉", stress=-5),
+        ]}},
+    {"id": "opportunity_training", "when": {"stress": "low"}, "event": {
+        "title": "外训名额",
+        "description": "部门有一个去总部参加培训的名额，张经理问你有没有兴趣。",
+        "type": "opportunity",
+        "choices": [
+            _choice("欣然接受", kpi=5, reputation=5, relationship={"张经理": 10}),
+            _choice("推荐李同事去", reputation=5, relationship={"李同事": 15}),
+            _choice("婉拒，想多陪陪家人", stress=-10),
+        ]}},
+    {"id": "opportunity_raise", "when": {"kpi": "high", "reputation": "high"}, "weight": 2.0, "event": {
+        "title": "谈薪窗口",
+        "description": "年度调薪开始了，HR 说这周可以和经理单独沟通预期。",
+        "type": "opportunity",
+        "choices": [
+            _choice("准备数据据理力争", stress=10, kpi=5),
+            _choice("按公司标准就好", stress=-5),
+            _choice("拿外部 offer 谈判", reputation=-5, stress=20, relationship={"张经理": -10}),
+        ]}},
+    {"id": "opportunity_mentor", "when": {"kpi": "mid"}, "event": {
+        "title": "前辈指点",
+        "description": "王测试看你最近很拼，主动提出每周抽半小时帮你复盘。",
+        "type": "opportunity",
+        "choices": [
+            _choice("认真准备每次复盘", kpi=8, stress=5, relationship={"王测试": 20}),
+            _choice("有空就去", kpi=3, relationship={"王测试": 5}),
+            _choice("客气地拒绝", relationship={"王测试": -5}),
+        ]}},
+    {"id": "opportunity_rescue", "when": {"stress": "high", "kpi": "low"}, "event": {
+        "title": "救场机会",
+        "description": "客户演示前一小时，主讲人突然请假，张经理环顾一圈看向了你。",
+        "type": "opportunity",
+        "choices": [
+            _choice("硬着头皮上", kpi=15, stress=25, reputation=10),
+            _choice("推荐更熟悉的同事", reputation=3),
+            _choice("说自己没准备好", reputation=-5, relationship={"张经理": -10}),
+        ]}},
+
+    # ---- 危机 ----
+    {"id": "crisis_layoff", "when": {"kpi": "low"}, "weight": 2.0, "event": {
+        "title": "裁员传闻",
+        "description": "公司在传下个月要优化一批人，名单里据说有绩效靠后的同事。",
+        "type": "crisis",
+        "choices": [
+            _choice("加班冲业绩", kpi=15, stress=25),
+            _choice("悄悄更新简历", stress=-5, reputation=-3),
+            _choice("找经理探口风", stress=10, relationship={"张经理": 5}),
+        ]}},
+    {"id": "crisis_outage", "event": {
+        "title": "线上事故",
+        "description": "凌晨两点，告警群炸了，你负责的服务响应时间飙升。",
+        "type": "crisis",
+        "choices": [
+            _choice("立刻上线排查", kpi=10, stress=20),
+            _choice("叫醒值班同事一起处理", kpi=5, stress=10, relationship={"李同事": -5}),
+            _choice("先回滚，第二天再查", kpi=3, stress=5),
+        ]}},
+    {"id": "crisis_complaint", "when": {"reputation": "low"}, "weight": 1.5, "event": {
+        "title": "客户投诉",
+        "description": "客户把投诉邮件直接抄送给了王老板，点名说你的回复“敷衍”。",
+        "type": "crisis",
+        "choices": [
+            _choice("立即电话致歉并跟进", stress=15, reputation=5),
+            _choice("找经理一起出面", stress=5, relationship={"张经理": -5}),
+            _choice("回邮件解释来龙去脉", stress=10, reputation=-3),
+        ]}},
+    {"id": "crisis_burnout", "when": {"stress": "high"}, "weight": 2.5, "event": {
+        "title": "身体报警",
+        "description": "连续加班后你开始头晕心悸，体检报告上多了几个向上的箭头。",
+        "type": "crisis",
+        "choices": [
+            _choice("请几天病假", stress=-30, kpi=-10),
+            _choice("咬牙坚持", stress=15, kpi=5),
+            _choice("跟经理谈减少工作量", stress=-15, relationship={"张经理": -5}),
+        ]}},
+    {"id": "crisis_leak", "event": {
+        "title": "文件外泄",
+        "description": "一份内部报价单出现在竞争对手手里，最后的修改人显示是你。",
+        "type": "crisis",
+        "choices": [
+            _choice("配合调查并提供记录", stress=20, reputation=5),
+            _choice("怀疑有人冒用账号", stress=15, relationship={"李同事": -10}),
+            _choice("先找经理商量", stress=10, relationship={"张经理": 5}),
+        ]}},
+    {"id": "crisis_feud", "when": {"relations": "strained"}, "weight": 2.0, "event": {
+        "title": "矛盾公开化",
+        "description": "你和李同事的争执在周会上爆发，王老板皱着眉让你们会后去他办公室。",
+        "type": "crisis",
+        "choices": [
+            _choice("主动承认自己的问题", reputation=5, stress=10, relationship={"李同事": 15}),
+            _choice("摆事实讲道理", stress=15, relationship={"李同事": -10}),
+            _choice("请行政帮忙调岗", stress=-10, reputation=-5, relationship={"赵行政": 5}),
+        ]}},
+]
@@ -0,0 +1,374 @@
+"""
+玩家行动意图引擎
+第一层：把规则表里的动词、物品和场景中的 NPC 名编译成 Aho-Corasick 自动机，一次扫描完成匹配，
+常见行动（扔东西、打人、工作、摸鱼、搭话）在本地微秒级解析；
+第二层：置信度不足的行动（没有识别出动词、多个意图冲突、否定句、目标不明确 ...）交给大模型判断
+"""
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+import os
+import random
+import time
+
+
+# ========== 多模式匹配 ==========
+
+class AhoCorasick:
+    """多模式串匹配自动机；patterns 为 {模式串: 附带数据}，构建一次后可反复扫描"""
+
+    def __init__(self, patterns: Dict[str, object]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]
+        for word, payload in patterns.items():
+            if word:
+                self._insert(word, payload)
+        self._build()
+
+    def _insert(self, word: str, payload):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(word), payload))
+
+    def _build(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in self._goto[state].items():
+                pending.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """依次给出所有命中 (起点, 终点, 附带数据)，含相互重叠的命中"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, payload in out[state]:
+                yield i + 1 - length, i + 1, payload
+
+    def leftmost_longest(self, text: str) -> List[Tuple[int, int, object]]:
+        """
+        互不重叠的命中，优先最靠左、其次最长
+
+        "打印机" 覆盖住其中的 "打"，"打招呼" 不会被当成攻击
+        """
+        matches = sorted(self.iter(text), key=lambda m: (m[0], m[0] - m[1]))
+        result, end = [], 0
+        for match in matches:
+            if match[0] >= end:
+                result.append(match)
+                end = match[1]
+        return result
+
+
+# ========== 规则表 ==========
+
+@dataclass(frozen=True)
+class IntentRule:
+    name: str
+    verbs: Tuple[str, ...]
+    target: str = "none"      # npc: 必须指向 NPC / optional: 可以有 NPC / none: 无目标
+
+
+INTENT_RULES: Tuple[IntentRule, ...] = (
+    IntentRule("throw", ("砸", "扔", "投", "丢", "甩", "泼", "砸向", "扔向", "丢向", "甩向", "泼向", "扔给"), target="npc"),
+    IntentRule("attack", ("打", "揍", "踢", "踹", "扇", "打人", "殴打", "攻击", "推倒", "挥拳", "一拳"), target="npc"),
+    IntentRule("work", ("工作", "代码", "写", "做", "完成", "加班", "开发", "改bug", "修bug", "打卡", "打印", "复印", "整理"), target="none"),
+    IntentRule("slack", ("摸鱼", "休息", "偷懒", "刷手机", "玩手机", "睡觉", "发呆", "喝咖啡"), target="none"),
+    IntentRule("talk", ("说", "问", "聊", "告诉", "打招呼", "打电话", "请教", "汇报", "道歉", "夸"), target="optional"),
+)
+
+# 含单字动词但意思完全不同的常见词：命中时整个词跳过（按最左最长匹配，会盖住其中的单字动词）
+EXCLUDED_COMPOUNDS = (
+    "打开", "打扫", "打算", "打听", "打包", "打扮", "打量", "打扰", "打折", "打车", "打游戏", "打哈欠", "打瞌睡",
+    "投诉", "投票", "投资", "投入", "投简历", "投稿",
+    "丢人", "丢脸", "丢三落四", "甩锅", "泼冷水", "扔掉", "扔垃圾",
+    "做鬼脸", "做梦", "做白日梦", "做饭",
+    "说不定", "问题",
+)
+
+# 否定词紧挨在动词前时（"不扔"、"别打"）规则无法判断真实意图
+NEGATIONS = ("不", "别", "没", "不要", "不想", "没有", "假装")
+
+# 不在场景物品列表里也能拿起来扔的随身物品
+HANDHELD_OBJECTS = ("水杯", "杯子", "文件", "键盘", "鼠标", "订书机", "笔", "手机", "书")
+
+DEFAULT_THROWN_OBJECT = "水杯"
+
+# 置信度扣分项
+PENALTY_CONFLICT = 0.45       # 出现多个不同意图
+PENALTY_NEGATION = 0.6        # 动词前有否定词
+PENALTY_IMPLIED_TARGET = 0.35  # 需要目标但没点名，只能猜第一个 NPC
+PENALTY_BARE_VERB = 0.5       # 只命中单字动词（"打"、"投"、"做"）且没有点名 NPC：单字太容易误判，一定交给大模型
+PENALTY_IMPLIED_OBJECT = 0.1   # 扔东西没说扔什么
+PENALTY_LONG = 0.25           # 描述很长，往往带有规则覆盖不到的条件或细节
+LONG_ACTION_CHARS = 24
+
+
+def _static_patterns() -> Dict[str, list]:
+    patterns: Dict[str, list] = {}
+    for rule in INTENT_RULES:
+        for verb in rule.verbs:
+            patterns.setdefault(verb.lower(), []).append(("verb", rule.name))
+    for word in EXCLUDED_COMPOUNDS:
+        patterns.setdefault(word, []).insert(0, ("excluded", word))
+    for word in NEGATIONS:
+        patterns.setdefault(word, []).append(("negation", word))
+    for obj in HANDHELD_OBJECTS:
+        patterns.setdefault(obj, []).append(("object", obj))
+    return patterns
+
+
+def _npc_aliases(visible_npcs: List[str]) -> Dict[str, str]:
+    """NPC 全名，以及不会混淆时的职位简称（"张经理" → "经理"）"""
+    aliases: Dict[str, str] = {}
+    short: Dict[str, List[str]] = {}
+    for name in visible_npcs:
+        aliases[name] = name
+        if len(name) >= 3:
+            short.setdefault(name[1:], []).append(name)
+    for alias, names in short.items():
+        if len(names) == 1 and alias not in aliases:
+            aliases[alias] = names[0]
+    return aliases
+
+
+@dataclass
+class Resolution:
+    """一次本地解析结果；confident 为 False 时应交给大模型"""
+    intent: Optional[str]
+    confidence: float
+    result: dict
+    confident: bool
+    reasons: Tuple[str, ...] = ()
+
+
+class IntentEngine:
+    """
+    本地行动解析 + 统计
+
+    场景里的物品 / NPC 会变化，按 (物品, NPC) 组合缓存编译好的自动机；
+    同一场景的请求只在第一次编译
+    """
+
+    def __init__(self, threshold: float = None, max_scenes: int = 64):
+        self.threshold = threshold if threshold is not None else float(os.getenv("ACTION_LOCAL_CONFIDENCE", "0.6"))
+        self.max_scenes = max_scenes
+        self._static = _static_patterns()
+        self._scenes: "OrderedDict[Tuple, AhoCorasick]" = OrderedDict()
+        self.total = 0
+        self.local = 0
+        self.escalated = 0
+        self.llm_resolved = 0
+        self.llm_failed = 0
+        self.by_intent: Dict[str, int] = {}
+        self._match_seconds = 0.0
+
+    def _automaton(self, visible_objects: List[str], visible_npcs: List[str]) -> AhoCorasick:
+        key = (tuple(visible_objects), tuple(visible_npcs))
+        automaton = self._scenes.get(key)
+        if automaton is not None:
+            self._scenes.move_to_end(key)
+            return automaton
+        patterns = {word: list(payloads) for word, payloads in self._static.items()}
+        for obj in visible_objects:
+            patterns.setdefault(obj.lower(), []).insert(0, ("object", obj))
+        for alias, name in _npc_aliases(visible_npcs).items():
+            patterns.setdefault(alias.lower(), []).insert(0, ("npc", name))
+        automaton = AhoCorasick(patterns)
+        self._scenes[key] = automaton
+        if len(self._scenes) > self.max_scenes:
+            self._scenes.popitem(last=False)
+        return automaton
+
+    def resolve(self, action: str, visible_objects: List[str] = (), visible_npcs: List[str] = ()) -> Resolution:
+        """本地解析一个行动，并计入统计"""
+        started = time.perf_counter()
+        visible_objects, visible_npcs = list(visible_objects or []), list(visible_npcs or [])
+        text = (action or "").strip().lower()
+
+        verbs: List[Tuple[str, str]] = []  # (命中的动词, 意图)
+        objects: List[str] = []
+        npcs: List[str] = []
+        negated = False
+        previous_end, previous_kind = -1, None
+        for start, end, payloads in self._automaton(visible_objects, visible_npcs).leftmost_longest(text):
+            kind, value = payloads[0]
+            if kind == "verb":
+                verbs.append((text[start:end], value))
+                # "不" 与动词之间最多隔一个字（"不想扔"、"别去打"）
+                if previous_kind == "negation" and start - previous_end <= 1:
+                    negated = True
+            elif kind == "object" and value not in objects:
+                objects.append(value)
+            elif kind == "npc" and value not in npcs:
+                npcs.append(value)
+            previous_end, previous_kind = end, kind
+
+        resolution = self._score(action, text, verbs, objects, npcs, negated, visible_npcs)
+        self._match_seconds += time.perf_counter() - started
+        self.total += 1
+        if resolution.confident:
+            self.local += 1
+            self.by_intent[resolution.intent or "generic"] = self.by_intent.get(resolution.intent or "generic", 0) + 1
+        else:
+            self.escalated += 1
+        return resolution
+
+    def _score(self, action, text, verbs, objects, npcs, negated, visible_npcs) -> Resolution:
+        if not verbs:
+            return Resolution(None, 0.0, build_result(None, action, [], [], visible_npcs), False, ("no_verb",))
+
+        intents = list(dict.fromkeys(name for _, name in verbs))
+        intent = intents[0]
+        rule = next(r for r in INTENT_RULES if r.name == intent)
+        confidence = 1.0
+        reasons = []
+        if len(intents) > 1:
+            confidence -= PENALTY_CONFLICT
+            reasons.append("conflict")
+        if negated:
+            confidence -= PENALTY_NEGATION
+            reasons.append("negation")
+        if rule.target == "npc" and not npcs and visible_npcs:
+            confidence -= PENALTY_IMPLIED_TARGET
+            reasons.append("implied_target")
+        if not npcs and all(len(verb) == 1 for verb, name in verbs if name == intent):
+            confidence -= PENALTY_BARE_VERB
+            reasons.append("bare_verb")
+        if intent == "throw" and not objects:
+            confidence -= PENALTY_IMPLIED_OBJECT
+            reasons.append("implied_object")
+        if len(text) > LONG_ACTION_CHARS:
+            confidence -= PENALTY_LONG
+            reasons.append("long")
+
+        confidence = round(max(confidence, 0.0), 2)
+        result = build_result(intent, action, objects, npcs, visible_npcs)
+        return Resolution(intent, confidence, result, confidence >= self.threshold, tuple(reasons))
+
+    def record_escalation(self, resolved: bool):
+        """记录升级到大模型后的结果（False 表示大模型失败，仍使用本地结果）"""
+        if resolved:
+            self.llm_resolved += 1
+        else:
+            self.llm_failed += 1
+
+    def stats(self) -> dict:
+        return {
+            "total": self.total,
+            "local": self.local,
+            "escalated": self.escalated,
+            "llm_resolved": self.llm_resolved,
+            "llm_failed": self.llm_failed,
+            "local_ratio": round(self.local / self.total, 3) if self.total else None,
+            "avg_match_us": round(self._match_seconds / self.total * 1e6, 1) if self.total else None,
+            "threshold": self.threshold,
+            "intents": dict(self.by_intent),
+            "compiled_scenes": len(self._scenes),
+        }
+
+
+# ========== 结果生成 ==========
+
+def build_result(intent: Optional[str], action: str, objects: List[str], npcs: List[str], visible_npcs: List[str]) -> dict:
+    """按意图生成动画序列、NPC 反应和状态变化（格式与大模型返回的一致）"""
+    target = npcs[0] if npcs else (visible_npcs[0] if visible_npcs else None)
+    animations: List[dict] = []
+    npc_reactions: Dict[str, str] = {}
+    state_changes = {"mood": 0, "stress": 0, "work_progress": 0, "relationships": {}}
+    feasible = True
+    dialogue = None
+
+    if intent == "throw":
+        thrown_object = objects[0] if objects else DEFAULT_THROWN_OBJECT
+        if target:
+            description = f"你拿起{thrown_object}狠狠地砸向了{target}！"
+            animations = [
+                {"type": "throw", "object": thrown_object, "target": target, "duration": 500},
+                {"type": "hit", "target": target, "delay": 500},
+                {"type": "debris", "object": thrown_object, "delay": 600},
+                {"type": "hurt", "target": target, "delay": 600}
+            ]
+            for npc in visible_npcs:
+                if npc != target:
+                    npc_reactions[npc] = random.choice(["gather", "flee", "shock"])
+            npc_reactions[target] = "hurt"
+            state_changes = {"mood": -30, "stress": +50, "work_progress": -20, "relationships": {target: -50}}
+            dialogue = f"{target}捂着头大喊：你疯了吗！"
+        else:
+            feasible = False
+            description = "你找不到攻击目标。"
+
+    elif intent == "attack":
+        if npcs:
+            target = npcs[0]
+            description = f"你冲向{target}挥出了拳头！"
+            animations = [
+                {"type": "charge", "target": target, "duration": 300},
+                {"type": "hurt", "target": target, "delay": 300}
+            ]
+            for npc in visible_npcs:
+                if npc != target:
+                    npc_reactions[npc] = "gather"
+            npc_reactions[target] = "hurt"
+            state_changes = {"mood": -40, "stress": +60, "relationships": {target: -80}}
+            dialogue = f"{target}倒退几步，震惊地看着你。"
+        else:
+            feasible = False
+            description = "你挥舞着拳头，但没有打中任何人。"
+
+    elif intent == "work":
+        description = "你专注地开始工作..."
+        animations = [{"type": "work", "duration": 2000}]
+        state_changes = {"mood": -5, "stress": +10, "work_progress": +15}
+
+    elif intent == "slack":
+        description = "你偷偷摸起了鱼..."
+        animations = [{"type": "idle", "variant": "phone", "duration": 2000}]
+        state_changes = {"mood": +10, "stress": -10, "work_progress": -5}
+        # 可能被发现
+        if random.random() < 0.3:
+            watcher = random.choice(visible_npcs) if visible_npcs else "张经理"
+            npc_reactions[watcher] = "notice"
+            dialogue = f"{watcher}似乎注意到了你在摸鱼..."
+
+    elif intent == "talk":
+        if npcs:
+            target = npcs[0]
+            description = f"你走向{target}开始交谈。"
+            animations = [{"type": "walk", "target": target, "duration": 500}]
+            npc_reactions[target] = "talk"
+        else:
+            description = "你自言自语了几句。"
+
+    else:
+        description = f"你尝试{action}..."
+        animations = [{"type": "generic", "duration": 1000}]
+
+    return {
+        "feasible": feasible,
+        "description": description,
+        "animations": animations,
+        "npc_reactions": npc_reactions,
+        "state_changes": state_changes,
+        "dialogue": dialogue
+    }
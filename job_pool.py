@@ -0,0 +1,175 @@
+"""
+求职职位预生成池
+按简历分桶（学历 × 专业大类 × 经验段）预先生成职位，打开招聘看板时直接从池中取
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+
+EDUCATION_LEVELS = ["博士", "硕士", "本科", "大专"]
+
+MAJOR_FAMILIES = {
+    "tech": ["计算机", "软件", "信息", "电子", "通信", "数据", "人工智能", "网络", "自动化"],
+    "finance": ["金融", "经济", "会计", "财务", "统计", "审计"],
+    "business": ["市场", "营销", "管理", "工商", "人力", "电商", "物流"],
+    "design": ["设计", "艺术", "美术", "动画", "视觉", "建筑"],
+    "humanities": ["中文", "新闻", "传播", "外语", "英语", "法学", "法律", "教育", "历史"],
+}
+
+
+def _education_bucket(education) -> str:
+    education = str(education or "本科")
+    for level in EDUCATION_LEVELS:
+        if level in education:
+            return level
+    return "其他"
+
+
+def _major_bucket(major) -> str:
+    major = str(major or "计算机")
+    for family, keywords in MAJOR_FAMILIES.items():
+        if any(word in major for word in keywords):
+            return family
+    return "other"
+
+
+def _experience_bucket(experience) -> str:
+    try:
+        years = float(experience)
+    except (TypeError, ValueError):
+        years = 0
+    if years < 1:
+        return "0"
+    if years < 3:
+        return "1-3"
+    if years < 5:
+        return "3-5"
+    return "5+"
+
+
+def resume_bucket(player_resume: dict) -> Tuple[str, str, str]:
+    """简历分桶键：(学历, 专业大类, 经验段)"""
+    return (
+        _education_bucket(player_resume.get("education")),
+        _major_bucket(player_resume.get("major")),
+        _experience_bucket(player_resume.get("experience")),
+    )
+
+
+class JobListingPool:
+    """
+    按简历分桶的职位池
+
+    - take() 命中时立即返回池中职位，低于低水位时在后台异步补充
+    - 冷桶（数量不足）返回 None，由调用方走实时生成；实时调用结束后调用方须调用 live_finished()，
+      该桶的预热在此时才开始，避免一次未命中同时打出两次上游调用
+    """
+
+    def __init__(
+        self,
+        service,
+        target_size: int = None,
+        low_water: int = None,
+        batch_size: int = 15
+    ):
+        self.service = service
+        self.target_size = target_size or int(os.getenv("JOB_POOL_SIZE", "45"))
+        self.low_water = low_water or int(os.getenv("JOB_POOL_LOW_WATER", "15"))
+        self.batch_size = batch_size
+
+        self._pools: Dict[tuple, deque] = {}
+        self._seeds: Dict[tuple, dict] = {}  # 每个桶最近一次出现的简历，用作补充时的 prompt
+        self._refilling: Dict[tuple, asyncio.Task] = {}
+        self._live: Dict[tuple, int] = {}  # 每个桶在途的实时生成数
+
+        self.hits = 0
+        self.misses = 0
+
+    def take(self, player_resume: dict, count: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        从池中取 count 个职位（缺省为一批的数量）
+
+        池中不足时返回 None，调用方走实时生成，结束后必须调用 live_finished()
+        """
+        if not count or count <= 0:
+            count = self.batch_size
+        key = resume_bucket(player_resume)
+        self._seeds[key] = player_resume
+        pool = self._pools.setdefault(key, deque())
+
+        if len(pool) < count:
+            self.misses += 1
+            self._live[key] = self._live.get(key, 0) + 1
+            return None
+
+        jobs = [pool.popleft() for _ in range(count)]
+        self.hits += 1
+        if len(pool) < self.low_water and not self._live.get(key):
+            self._schedule_refill(key)
+        return jobs
+
+    def live_finished(self, player_resume: dict):
+        """take() 未命中后的实时生成已结束；该桶没有其他在途的实时生成时开始预热"""
+        key = resume_bucket(player_resume)
+        remaining = self._live.get(key, 0) - 1
+        if remaining > 0:
+            self._live[key] = remaining
+            return
+        self._live.pop(key, None)
+        if len(self._pools.get(key, ())) < self.low_water:
+            self._schedule_refill(key)
+
+    def size(self, player_resume: dict) -> int:
+        """简历所在桶当前的职位数"""
+        return len(self._pools.get(resume_bucket(player_resume), ()))
+
+    def _schedule_refill(self, key: tuple):
+        if key in self._refilling:
+            return
+        task = asyncio.create_task(self._refill(key))
+        self._refilling[key] = task
+        task.add_done_callback(lambda _: self._refilling.pop(key, None))
+
+    async def _refill(self, key: tuple):
+        """补充到目标数量；上游失败时停止，等下次取用再试"""
+        pool = self._pools[key]
+        while len(pool) < self.target_size:
+            try:
+                # 不与实时请求合并，否则池中会混入玩家刚看过的同一批职位；
+                # 失败时不改用模拟职位，也就不计入降级指标（没有玩家请求因此拿到模拟数据）
+                jobs = await self.service.generate_job_listings(
+                    player_info=self._seeds[key],
+                    count=self.batch_size,
+                    coalesce=False,
+                    fallback=False
+                )
+            except Exception:
+                logger.exception("职位池补充失败 %s", key)
+                return
+
+            fresh = [job for job in jobs or [] if isinstance(job, dict)]
+            if not fresh:
+                return
+            for job in fresh:
+                # 不同批次的 id 可能重复，入池时重新编号
+                job["id"] = f"job_{uuid.uuid4().hex[:12]}"
+                pool.append(job)
+
+    def stats(self) -> dict:
+        """池状态（供状态接口展示）"""
+        return {
+            "buckets": len(self._pools),
+            "listings": sum(len(pool) for pool in self._pools.values()),
+            "refilling": len(self._refilling),
+            "live": sum(self._live.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,295 @@
+"""
+上游大模型异步客户端
+基于 AsyncOpenAI + 连接池，避免同步调用阻塞 uvicorn 事件循环
+"""
+
+from dataclasses import dataclass
+from openai import (
+    APIConnectionError, APIStatusError, AsyncOpenAI, DefaultAsyncHttpxClient, RateLimitError, Timeout
+)
+from typing import AsyncIterator, Dict, List
+import asyncio
+import httpx
+import os
+import time
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from conversation_window import estimate_tokens, message_tokens
+from metrics import UPSTREAM_CALLS, UPSTREAM_LATENCY, UPSTREAM_TOKENS, UPSTREAM_TTFT, upstream_outcome
+from tracing import record_span, span
+
+
+DEFAULT_BASE_URL = 'https://api-inference.modelscope.cn/v1'
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """调用超过了接口的截止时间（含排队时间）"""
+
+
+@dataclass
+class CallPolicy:
+    """单个接口的调用策略"""
+    deadline: float = None      # 截止时间（秒）；流式调用指首个 token 的截止时间
+    hedge_after: float = None   # 超过该时间仍未返回时再发一份相同请求，先返回的为准
+
+
+def _is_upstream_failure(exc: BaseException) -> bool:
+    """超时、连接错误、限流和 5xx 计入熔断；请求参数错误等 4xx 不计入"""
+    if isinstance(exc, (asyncio.TimeoutError, APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+
+class UpstreamClient:
+    """
+    OpenAI 兼容接口的异步封装
+
+    - 共享一个 keep-alive 的 httpx 连接池
+    - 用信号量限制同时在途的上游请求数（超出的请求排队等待）
+    - 按接口设置截止时间与对冲请求；上游持续失败时熔断，调用直接抛出 CircuitOpenError
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = None,
+        max_inflight: int = None,
+        max_connections: int = None,
+        timeout: float = None,
+        breaker: CircuitBreaker = None
+    ):
+        self.base_url = base_url or os.getenv('QWEN_BASE_URL', DEFAULT_BASE_URL)
+        self.max_inflight = max_inflight or int(os.getenv('QWEN_MAX_INFLIGHT', '32'))
+        max_connections = max_connections or int(
+            os.getenv('QWEN_MAX_CONNECTIONS', str(self.max_inflight)))
+        timeout = timeout or float(os.getenv('QWEN_TIMEOUT', '60'))
+
+        self.http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=30.0
+            ),
+            timeout=Timeout(timeout, connect=10.0)
+        )
+        self.client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=api_key,
+            http_client=self.http_client,
+            max_retries=1
+        )
+
+        self._semaphore = asyncio.Semaphore(self.max_inflight)
+        self.inflight = 0  # 正在等待上游响应的请求数
+        self.queued = 0    # 因达到并发上限而排队的请求数
+
+        self.breaker = breaker or CircuitBreaker()
+        self.policies: Dict[str, CallPolicy] = {}
+        self.deadline_exceeded: Dict[str, int] = {}
+        self.hedged = 0      # 发出的对冲请求数
+        self.hedge_wins = 0  # 对冲请求先于原请求返回的次数
+
+    def configure(self, endpoint: str, deadline: float = None, hedge_after: float = None):
+        self.policies[endpoint] = CallPolicy(deadline=deadline, hedge_after=hedge_after or None)
+
+    async def _acquire(self):
+        self.queued += 1
+        try:
+            with span("upstream.queue"):
+                await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.inflight += 1
+
+    def _release(self):
+        self.inflight -= 1
+        self._semaphore.release()
+
+    def _admit(self, endpoint: str) -> CallPolicy:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"上游熔断中，{endpoint or '调用'} 直接走本地兜底")
+        return self.policies.get(endpoint) or CallPolicy()
+
+    def _settle(self, exc: BaseException = None):
+        """把一次调用的结果记入熔断器"""
+        if exc is None:
+            self.breaker.record_success()
+        elif _is_upstream_failure(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    def _deadline_error(self, endpoint: str, deadline: float) -> DeadlineExceeded:
+        self.deadline_exceeded[endpoint] = self.deadline_exceeded.get(endpoint, 0) + 1
+        return DeadlineExceeded(f"{endpoint} 超过截止时间 {deadline:g}s")
+
+    @staticmethod
+    def _observe(endpoint: str, mode: str, started: float, exc: BaseException = None):
+        endpoint = endpoint or "unknown"
+        UPSTREAM_CALLS.inc(endpoint=endpoint, outcome=upstream_outcome(exc))
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, mode=mode)
+
+    @staticmethod
+    def _count_tokens(endpoint: str, usage, messages: List[dict], text: str):
+        """记录 token 用量；上游没有返回 usage 时按本地估算"""
+        endpoint = endpoint or "unknown"
+        if usage is not None and usage.prompt_tokens is not None:
+            prompt, completion = usage.prompt_tokens, usage.completion_tokens or 0
+        else:
+            prompt, completion = sum(message_tokens(m) for m in messages), estimate_tokens(text)
+        UPSTREAM_TOKENS.inc(prompt, endpoint=endpoint, kind="prompt")
+        UPSTREAM_TOKENS.inc(completion, endpoint=endpoint, kind="completion")
+
+    async def complete(self, model: str, messages: List[dict], endpoint: str = None, **kwargs) -> str:
+        """非流式调用，返回完整文本"""
+        started = time.perf_counter()
+        try:
+            policy = self._admit(endpoint)
+        except CircuitOpenError as e:
+            self._observe(endpoint, "complete", started, e)
+            raise
+        call = (
+            self._hedged(policy.hedge_after, endpoint, model, messages, **kwargs)
+            if policy.hedge_after else self._complete_once(endpoint, model, messages, **kwargs)
+        )
+        try:
+            with span("upstream.call", endpoint=endpoint, deadline=policy.deadline):
+                if policy.deadline:
+                    try:
+                        text = await asyncio.wait_for(call, policy.deadline)
+                    except asyncio.TimeoutError:
+                        raise self._deadline_error(endpoint, policy.deadline) from None
+                else:
+                    text = await call
+        except BaseException as e:
+            self._settle(e)
+            self._observe(endpoint, "complete", started, e)
+            raise
+        self._settle()
+        self._observe(endpoint, "complete", started)
+        return text
+
+    async def _complete_once(self, endpoint: str, model: str, messages: List[dict], **kwargs) -> str:
+        await self._acquire()
+        try:
+            with span("upstream.generate", model=model) as current:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=False,
+                    **kwargs
+                )
+                if current is not None and response.usage is not None:
+                    current.set(prompt_tokens=response.usage.prompt_tokens,
+                                completion_tokens=response.usage.completion_tokens)
+        finally:
+            self._release()
+        text = response.choices[0].message.content or ""
+        self._count_tokens(endpoint, response.usage, messages, text)
+        return text
+
+    async def _hedged(self, delay: float, endpoint: str, model: str, messages: List[dict], **kwargs) -> str:
+        """原请求 delay 秒内未返回时发出一份相同的对冲请求，取先成功的结果"""
+        primary = asyncio.ensure_future(self._complete_once(endpoint, model, messages, **kwargs))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self.hedged += 1
+                pending.add(asyncio.ensure_future(self._complete_once(endpoint, model, messages, **kwargs)))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, model: str, messages: List[dict], endpoint: str = None, **kwargs) -> AsyncIterator[str]:
+        """流式调用，逐段产出增量文本；截止时间约束的是首个 token"""
+        observed = time.perf_counter()
+        try:
+            policy = self._admit(endpoint)
+        except CircuitOpenError as e:
+            self._observe(endpoint, "stream", observed, e)
+            raise
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def before_deadline(awaitable):
+            if not policy.deadline:
+                return await awaitable
+            remaining = policy.deadline - (loop.time() - started)
+            try:
+                return await asyncio.wait_for(awaitable, max(remaining, 0))
+            except asyncio.TimeoutError:
+                raise self._deadline_error(endpoint, policy.deadline) from None
+
+        acquired = False
+        response = None
+        try:
+            await before_deadline(self._acquire())
+            acquired = True
+            response = await before_deadline(self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                **kwargs
+            ))
+            chunks = response.__aiter__()
+            first = True
+            parts, usage = [], None
+            while True:
+                try:
+                    chunk = await (before_deadline(chunks.__anext__()) if first else chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first:
+                        UPSTREAM_TTFT.observe(time.perf_counter() - observed, endpoint=endpoint or "unknown")
+                        record_span("upstream.first_token", observed, endpoint=endpoint)
+                    first = False
+                    parts.append(delta)
+                    yield delta
+        except BaseException as e:
+            self._settle(e)
+            self._observe(endpoint, "stream", observed, e)
+            # 生成器里不能跨 yield 持有 span，结束时补记整段
+            record_span("upstream.stream", observed, error=f"{type(e).__name__}: {e}", endpoint=endpoint)
+            raise
+        else:
+            self._settle()
+            self._observe(endpoint, "stream", observed)
+            self._count_tokens(endpoint, usage, messages, "".join(parts))
+            record_span("upstream.stream", observed, endpoint=endpoint, chunks=len(parts))
+        finally:
+            # 消费方提前退出（客户端断开 / 超过截止时间）时也要关闭响应，把连接还给连接池
+            if response is not None:
+                await response.close()
+            if acquired:
+                self._release()
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "breaker": self.breaker.stats(),
+            "deadline_exceeded": dict(self.deadline_exceeded),
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
+    async def aclose(self):
+        """关闭连接池"""
+        await self.client.close()
@@ -0,0 +1,522 @@
+"""
+大模型输出解析
+增量扫描模型输出的 JSON，配合流式接口边生成边解析
+"""
+
+from collections import deque
+from typing import Callable, List, Tuple
+import json
+import re
+
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+_OPENERS = {"object": "{", "array": "[", "any": "{["}
+_CLOSERS = {"{": "}", "[": "]"}
+
+_FIRST_OPENER = {kind: re.compile(f"[{re.escape(chars)}]") for kind, chars in _OPENERS.items()}
+_SEEK = {kind: re.compile(f"[{re.escape(chars)}<]") for kind, chars in _OPENERS.items()}
+_STRUCTURE = re.compile(r'[{}\[\]"<]')
+_MEMBER_STRUCTURE = re.compile(r'[{}\[\]"<,]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_REPAIR_STRUCTURE = re.compile(r'[{}\[\]",]')
+_DECODER = json.JSONDecoder()
+
+
+class JsonFieldExtractor:
+    """
+    增量提取顶层 JSON 对象的字段
+
+    每次 feed 一段增量文本，返回本次新完成的 (字段名, 值) 列表。
+    扫描交给 JsonExtractor（字符串、<think> 块都能正确跳过）；只看第一个对象，
+    它配对后不是合法 JSON 时 done 为 True、value 为 None，由调用方按普通文本处理。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self._completed = []
+        self._scanner = JsonExtractor("object", on_member=self._member, restart=False)
+
+    @property
+    def done(self) -> bool:
+        return self._scanner.done
+
+    @property
+    def value(self):
+        """完整解析出的对象；还没闭合或不是合法 JSON 时为 None"""
+        return self._scanner.value
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        """追加一段文本，返回新完成的字段"""
+        if self.done:
+            return []
+        self.text += chunk
+        self._scanner.feed(chunk)
+        completed, self._completed = self._completed, []
+        return completed
+
+    @property
+    def rest(self) -> str:
+        """对象闭合之后剩余的文本"""
+        return self._scanner.rest
+
+    def _member(self, raw: str):
+        try:
+            member = json.loads("{" + raw + "}")
+        except ValueError:
+            return
+        for key, value in member.items():
+            self.fields[key] = value
+            self._completed.append((key, value))
+
+
+class JsonArrayItemExtractor:
+    """
+    增量提取顶层 JSON 数组的元素
+
+    每次 feed 一段增量文本，返回本次新闭合的数组元素。
+    扫描交给 JsonExtractor：字符串、<think> 块里的括号不算数，
+    说明文字里配对后不是合法 JSON 的 [...] 会被跳过，继续找真正的数组。
+    """
+
+    def __init__(self):
+        self.items = []
+        self._completed = []
+        self._scanner = JsonExtractor("array", on_member=self._member)
+
+    @property
+    def done(self) -> bool:
+        return self._scanner.done
+
+    def feed(self, chunk: str) -> list:
+        """追加一段文本，返回新完成的元素"""
+        if self.done:
+            return []
+        self._scanner.feed(chunk)
+        completed, self._completed = self._completed, []
+        return completed
+
+    def _member(self, raw: str):
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            return
+        self.items.append(item)
+        self._completed.append(item)
+
+
+def _partial_tag_len(text: str, tag: str) -> int:
+    """text 末尾与 tag 开头重合的最长长度（标签可能被拆在两个 chunk 里）"""
+    for n in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:n]):
+            return n
+    return 0
+
+
+class DialogueTrailerSplitter:
+    """
+    拆分 "对话正文 + 末尾 JSON 标注" 形式的流式输出
+
+    正文一到达就可以下发；从 '{' 开始的内容暂存并增量解析，
+    标注对象闭合后放入 meta。<think>...</think> 块直接丢弃。
+    """
+
+    def __init__(self):
+        self.dialogue = ""
+        self.meta = None
+
+        self._pending = ""
+        self._in_think = False
+        self._trailer = None
+
+    def feed(self, chunk: str) -> str:
+        """追加一段文本，返回可以立即下发的正文"""
+        text = self._pending + chunk
+        self._pending = ""
+        out = []
+
+        while text:
+            if self._in_think:
+                end = text.find(THINK_CLOSE)
+                if end < 0:
+                    keep = _partial_tag_len(text, THINK_CLOSE)
+                    self._pending = text[len(text) - keep:] if keep else ""
+                    break
+                text = text[end + len(THINK_CLOSE):]
+                self._in_think = False
+                continue
+
+            if self._trailer is not None and self.meta is None:
+                self._trailer.feed(text)
+                if not self._trailer.done:
+                    break
+                text = self._trailer.rest
+                span = self._trailer.text[:len(self._trailer.text) - len(text)]
+                if self._trailer.fields and self._trailer.value is not None:
+                    self.meta = self._trailer.fields
+                else:
+                    # 正文里的普通花括号，不是标注
+                    out.append(span)
+                    self._trailer = None
+                continue
+
+            think = text.find(THINK_OPEN)
+            brace = text.find("{") if self.meta is None else -1
+            stops = [i for i in (think, brace) if i >= 0]
+            if not stops:
+                keep = _partial_tag_len(text, THINK_OPEN)
+                out.append(text[:len(text) - keep])
+                self._pending = text[len(text) - keep:] if keep else ""
+                break
+
+            stop = min(stops)
+            out.append(text[:stop])
+            if stop == think:
+                self._in_think = True
+                text = text[stop + len(THINK_OPEN):]
+            else:
+                self._trailer = JsonFieldExtractor()
+                text = text[stop:]
+
+        emitted = "".join(out)
+        self.dialogue += emitted
+        return emitted
+
+    def finish(self) -> str:
+        """
+        输出结束，返回需要补发的正文
+
+        被截断的标注若已解析出部分字段则照常使用，否则按正文处理
+        """
+        leftover = ""
+        if self._trailer is not None and self.meta is None:
+            if self._trailer.fields:
+                self.meta = self._trailer.fields
+            else:
+                leftover = self._trailer.text
+        if not self._in_think:
+            leftover += self._pending
+        self._pending = ""
+        self.dialogue += leftover
+        return leftover
+
+
+def strip_think(text: str) -> str:
+    """去掉 <think>...</think> 块（未闭合的思考块一直丢弃到末尾）"""
+    if THINK_OPEN not in text:
+        return text
+    out = []
+    pos = 0
+    while True:
+        start = text.find(THINK_OPEN, pos)
+        if start < 0:
+            out.append(text[pos:])
+            break
+        out.append(text[pos:start])
+        end = text.find(THINK_CLOSE, start + len(THINK_OPEN))
+        if end < 0:
+            break
+        pos = end + len(THINK_CLOSE)
+    return "".join(out)
+
+
+class JsonExtractor:
+    """
+    单遍提取模型输出中的第一个 JSON 值（对象或数组）
+
+    - 括号配对扫描，同一遍里跳过 <think> 块；完整字符串和流式增量都适用
+    - 用正则在结构字符之间跳跃，字符串内容不逐字处理；候选 JSON 按片段累积，不反复拼接缓冲区
+    - 说明文字中的普通括号（配对后不是合法 JSON）会被跳过，继续向后找
+    - 输出被截断时，finish() 会尝试补全（见 repair_json）
+    - 传入 on_member 时，顶层容器的每个成员（数组元素 / "键": 值）一结束就以原文回调，供流式逐项处理
+    - restart=False 时只看第一个候选：它不是合法 JSON 就直接结束（value 为 None），不再向后找
+    """
+
+    def __init__(
+        self,
+        kind: str = "object",
+        partial_items: bool = True,
+        on_member: Callable[[str], None] = None,
+        restart: bool = True
+    ):
+        self.kind = kind  # "object" / "array" / "any"
+        self.partial_items = partial_items
+        self.value = None
+        self.done = False
+        self.rest = ""  # 值闭合之后剩余的文本
+
+        self._seek = _SEEK[kind]
+        self._pending = ""   # 可能被拆在两个 chunk 里的 <think> / </think> 标签
+        self._parts = None   # 当前候选 JSON 已扫描的片段；None 表示还没遇到开括号
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._in_think = False
+        self._on_member = on_member
+        self._structure = _MEMBER_STRUCTURE if on_member else _STRUCTURE
+        self._member = None  # 当前顶层成员已扫描的片段
+        self._retry = restart
+
+    def feed(self, chunk: str) -> bool:
+        """追加一段文本，返回是否已经取到完整的 JSON 值"""
+        if self.done:
+            return True
+
+        text = self._pending + chunk
+        self._pending = ""
+        end = len(text)
+        seg = 0   # 当前候选在 text 中的片段起点
+        mseg = 0  # 当前顶层成员在 text 中的起点
+        i = 0
+        while i < end:
+            if self._in_think:
+                close = text.find(THINK_CLOSE, i)
+                if close < 0:
+                    keep = _partial_tag_len(text, THINK_CLOSE)
+                    self._pending = text[end - keep:] if keep else ""
+                    return False
+                i = seg = close + len(THINK_CLOSE)
+                self._in_think = False
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL.search(text, i)
+                if match is None:
+                    break
+                i = match.start()
+                if text[i] == '\\':
+                    self._escape = True
+                else:
+                    self._in_string = False
+                i += 1
+                continue
+
+            match = (self._seek if self._parts is None else self._structure).search(text, i)
+            if match is None:
+                break
+            i = match.start()
+            ch = text[i]
+
+            if ch == '<':
+                if text.startswith(THINK_OPEN, i):
+                    if self._parts is not None:
+                        self._flush(text, seg, mseg, i)
+                    self._in_think = True
+                    i += len(THINK_OPEN)
+                elif THINK_OPEN.startswith(text[i:]):
+                    # 可能是被拆开的 <think>，留到下一段
+                    self._pending = text[i:]
+                    end = i
+                else:
+                    i += 1
+                continue
+
+            if self._parts is None:
+                self._parts = []
+                self._stack = [ch]
+                seg = i
+                if self._on_member:
+                    self._member = []
+                    mseg = i + 1
+            elif ch == '"':
+                self._in_string = True
+            elif ch == ',':
+                if len(self._stack) == 1:
+                    self._end_member(text, seg, mseg, i)
+                    mseg = i + 1
+            elif ch in '{[':
+                self._stack.append(ch)
+            elif _CLOSERS[self._stack[-1]] != ch:
+                if not self._retry:
+                    return self._give_up(text, i)
+                text, end, seg, i = self._restart(text, seg, end)
+                mseg = 0
+                continue
+            else:
+                self._stack.pop()
+                if not self._stack:
+                    span = "".join(self._parts) + text[seg:i + 1]
+                    try:
+                        self.value = json.loads(span)
+                    except ValueError:
+                        if not self._retry:
+                            return self._give_up(text, i)
+                        text, end, seg, i = self._restart(text, seg, end)
+                        mseg = 0
+                        continue
+                    if self._on_member:
+                        self._end_member(text, seg, mseg, i)
+                    self.done = True
+                    self.rest = text[i + 1:]
+                    self._parts = None
+                    self._pending = ""
+                    return True
+            i += 1
+
+        if self._parts is not None and not self._in_think:
+            self._flush(text, seg, mseg, end)
+        return False
+
+    def _flush(self, text: str, seg: int, mseg: int, upto: int):
+        """把 text[seg:upto] 记入当前候选（以及当前成员）"""
+        self._parts.append(text[seg:upto])
+        if self._member is not None:
+            self._member.append(text[max(seg, mseg):upto])
+
+    def _end_member(self, text: str, seg: int, mseg: int, upto: int):
+        """顶层成员在 upto 处结束：回调成员原文，开始记录下一个成员"""
+        if self._member is None:
+            return
+        raw = "".join(self._member) + text[max(seg, mseg):upto]
+        self._member = []
+        if raw.strip():
+            self._on_member(raw)
+
+    def _give_up(self, text: str, i: int) -> bool:
+        """restart=False：第一个候选在 i 处确定不是合法 JSON，结束扫描"""
+        self.done = True
+        self.value = None
+        self.rest = text[i + 1:]
+        self._parts = None
+        self._member = None
+        self._pending = ""
+        return True
+
+    def _restart(self, text: str, seg: int, end: int):
+        """当前候选不是合法 JSON，从它的第二个字符重新扫描"""
+        rest = ("".join(self._parts) + text[seg:end])[1:]
+        self._parts = None
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._member = None
+        return rest, len(rest), 0, 0
+
+    def finish(self):
+        """输出结束：返回解析到的值，截断的 JSON 尝试补全，失败返回 None"""
+        if not self.done and self._parts is not None:
+            fragment = "".join(self._parts)
+            if not self._in_think:
+                fragment += self._pending
+            self.value = repair_json(fragment, self.partial_items)
+            self.done = self.value is not None
+        return self.value
+
+
+def repair_json(fragment: str, partial_items: bool = True):
+    """
+    补全被截断的 JSON：闭合未结束的字符串和括号
+
+    从末尾往前尝试几个截断点（刚闭合的值、逗号处），丢弃写了一半的键或字面量，
+    返回第一个能解析的结果；都失败返回 None。
+    partial_items=False 时只在顶层截断，即丢弃写了一半的数组元素 / 字段值。
+    """
+    fragment = fragment.rstrip()
+    # closing[-1] 是闭合当前所有括号所需的后缀，截断点直接记录这个不可变字符串
+    closing = [""]
+    cuts = deque(maxlen=16)  # (截断位置, 括号深度, 闭合后缀)
+    in_string = False
+    escape = False
+
+    i = 0
+    while True:
+        if in_string:
+            match = _STRING_SPECIAL.search(fragment, i)
+            if match is None:
+                break
+            i = match.start()
+            if fragment[i] == '\\':
+                if i + 1 >= len(fragment):
+                    escape = True
+                    break
+                i += 2
+                continue
+            in_string = False
+            cuts.append((i + 1, len(closing) - 1, closing[-1]))
+            i += 1
+            continue
+
+        match = _REPAIR_STRUCTURE.search(fragment, i)
+        if match is None:
+            break
+        i = match.start()
+        ch = fragment[i]
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            closing.append(_CLOSERS[ch] + closing[-1])
+            if len(closing) == 2:
+                cuts.append((i + 1, 1, closing[-1]))
+        elif ch in '}]':
+            if len(closing) == 1 or closing[-1][0] != ch:
+                return None
+            closing.pop()
+            cuts.append((i + 1, len(closing) - 1, closing[-1]))
+        else:
+            cuts.append((i, len(closing) - 1, closing[-1]))
+        i += 1
+
+    # 首选：原样闭合（字符串写到一半的直接补上引号）
+    tail = fragment
+    if in_string:
+        if escape:
+            tail = tail[:-1]
+        tail += '"'
+    candidates = [(tail, len(closing) - 1, closing[-1])]
+    candidates += reversed(cuts)
+
+    for text, depth, suffix in candidates:
+        if isinstance(text, int):
+            text = fragment[:text]
+        if not partial_items and depth > 1:
+            continue
+        text = text.rstrip().rstrip(',:')
+        try:
+            return json.loads(text + suffix)
+        except ValueError:
+            continue
+    return None
+
+
+def extract_json(text: str, kind: str = "object", partial_items: bool = True) -> Tuple[object, bool]:
+    """
+    从完整的模型输出中提取 JSON（kind: object / array / any），返回 (值, 是否经过截断补全)
+
+    常见情况（第一个开括号就是目标 JSON）直接用 json 的 raw_decode 一次解析；
+    开括号之前的 <think> 块直接跳过；说明文字里有括号或输出被截断时，再交给 JsonExtractor 扫描。
+    只跳过字符串之外的 <think> 块，字符串值里的 "<think>" 原样保留。解析失败时值为 None
+    """
+    text = text or ""
+    pos = 0
+    while True:
+        match = _FIRST_OPENER[kind].search(text, pos)
+        if match is None:
+            return None, False
+        # 开括号之前的 <think> 块整块跳过（此时还不在 JSON 里，不存在字符串的问题）
+        think = text.find(THINK_OPEN, pos, match.start())
+        if think < 0:
+            break
+        close = text.find(THINK_CLOSE, think + len(THINK_OPEN))
+        if close < 0:
+            return None, False
+        pos = close + len(THINK_CLOSE)
+    start = match.start()
+    try:
+        return _DECODER.raw_decode(text, start)[0], False
+    except ValueError:
+        pass
+    extractor = JsonExtractor(kind, partial_items)
+    complete = extractor.feed(text[start:])
+    value = extractor.finish()
+    return value, value is not None and not complete
+
+
+def parse_json(text: str, kind: str = "object", partial_items: bool = True):
+    """从完整的模型输出中提取 JSON，失败返回 None（见 extract_json）"""
+    return extract_json(text, kind, partial_items)[0]
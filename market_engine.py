@@ -0,0 +1,538 @@
+"""
+服务端行情引擎
+所有玩家共享同一个市场：每个 tick 用 NumPy 一次性推进全部股票和基金，
+tick / 1m / 5m / 日 K 线在各自的环形缓冲区里增量维护；行情快照每个 tick 只编码一次，所有请求共用；
+订阅者通过 SSE 收到增量帧（只含有变动的品种），每帧只编码一次，所有连接共用同一份 bytes
+"""
+
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+
+# 与前端 StockMarket.ts 的股票列表一致
+STOCKS: List[Tuple[str, str, str, float]] = [
+    ("TECH001", "云计算科技", "科技", 88.50),
+    ("TECH002", "芯片半导", "科技", 156.20),
+    ("TECH003", "人工智能", "科技", 234.80),
+    ("TECH004", "新能源车", "科技", 445.00),
+    ("FINA001", "工商银行", "金融", 4.85),
+    ("FINA002", "平安保险", "金融", 42.30),
+    ("FINA003", "招商银行", "金融", 32.15),
+    ("CONS001", "贵州茅台", "消费", 1688.00),
+    ("CONS002", "五粮液", "消费", 142.50),
+    ("CONS003", "海天味业", "消费", 38.90),
+    ("MEDI001", "恒瑞医药", "医药", 43.20),
+    ("MEDI002", "药明康德", "医药", 68.50),
+    ("ENER001", "宁德时代", "新能源", 198.00),
+    ("ENER002", "隆基绿能", "新能源", 22.80),
+]
+
+# 各板块的单 tick 波动率（板块因子 / 个股特有）
+SECTOR_VOLATILITY: Dict[str, Tuple[float, float]] = {
+    "科技": (0.004, 0.006),
+    "金融": (0.002, 0.003),
+    "消费": (0.003, 0.004),
+    "医药": (0.003, 0.005),
+    "新能源": (0.005, 0.007),
+}
+
+# 基金：初始净值 + 各板块持仓权重，净值随持仓股票的涨跌变化
+FUNDS: List[Tuple[str, str, float, Dict[str, float]]] = [
+    ("FUND001", "稳健理财A", 1.0000, {"金融": 0.7, "消费": 0.3}),
+    ("FUND002", "科技成长混合", 1.2500, {"科技": 0.8, "新能源": 0.2}),
+    ("FUND003", "大健康精选", 0.9800, {"医药": 0.6, "消费": 0.4}),
+]
+
+# K 线周期 → (环形缓冲区容量, 环境变量)；tick 为逐 tick 价格，day 为模拟交易日
+INTERVALS: Dict[str, Tuple[int, str]] = {
+    "tick": (4800, "MARKET_HISTORY_TICKS"),
+    "1m": (1440, "MARKET_HISTORY_MINUTES"),
+    "5m": (2016, "MARKET_HISTORY_5M"),
+    "day": (365, "MARKET_HISTORY_DAYS"),
+}
+BACKFILL_DAILY_VOLATILITY = 0.025  # 启动时回填的日 K 波动率
+
+LIMIT_RATIO = 0.10        # 涨跌停幅度
+REOPEN_PROBABILITY = 0.05  # 封板后每个 tick 开板的概率
+LOT = 100                 # 一手 = 100 股
+
+# 增量帧中每行的字段顺序（订阅时在 hello 消息里下发一次）
+DELTA_FIELDS = ["code", "price", "high", "low", "volume", "amount", "change", "changePercent", "isLimitUp", "isLimitDown"]
+FUND_DELTA_FIELDS = ["code", "nav", "change"]
+
+
+class RingBuffer:
+    """定长环形缓冲区：每行一个时间点（行的形状任意），写满后覆盖最旧的行"""
+
+    def __init__(self, capacity: int, shape, dtype=np.float64):
+        self.capacity = capacity
+        shape = (shape,) if isinstance(shape, int) else tuple(shape)
+        self.data = np.zeros((capacity,) + shape, dtype=dtype)
+        self.count = 0  # 累计写入行数
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, row):
+        self.data[self.count % self.capacity] = row
+        self.count += 1
+
+    def last(self) -> np.ndarray:
+        """最近写入的一行（视图，可原地修改）"""
+        return self.data[(self.count - 1) % self.capacity]
+
+    def latest(self, n: int = None) -> np.ndarray:
+        """按时间顺序返回最近 n 行（副本）"""
+        size = len(self)
+        n = size if n is None else min(n, size)
+        if n <= 0:
+            return self.data[:0].copy()
+        end = self.count % self.capacity
+        indices = (np.arange(end - n, end)) % self.capacity
+        return self.data[indices]
+
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+
+
+class CandleSeries:
+    """
+    一个周期的 K 线（所有品种共用一组数组）
+
+    每个 tick 增量更新：进入新周期时追加一根，否则只更新最后一根的最高 / 最低 / 收盘 / 成交量；
+    查询就是对环形缓冲区取最近若干行，无需从逐 tick 数据重新聚合
+    """
+
+    def __init__(self, capacity: int, symbols: int):
+        self.bars = RingBuffer(capacity, (5, symbols))
+        self.times = RingBuffer(capacity, 1)  # 每根 K 线的开始时间（秒）
+        self._key = None
+
+    def __len__(self) -> int:
+        return len(self.bars)
+
+    def update(self, key, timestamp: float, price: np.ndarray, volume: np.ndarray):
+        if key != self._key:
+            self._key = key
+            self.bars.append(np.stack([price, price, price, price, volume]))
+            self.times.append(timestamp)
+            return
+        bar = self.bars.last()
+        np.maximum(bar[HIGH], price, out=bar[HIGH])
+        np.minimum(bar[LOW], price, out=bar[LOW])
+        bar[CLOSE] = price
+        bar[VOLUME] += volume
+
+    def append(self, timestamp: float, bars: np.ndarray, key=None):
+        """直接追加完整的 K 线（回填历史用），bars 形状为 (5, 品种数)"""
+        self._key = key
+        self.bars.append(bars)
+        self.times.append(timestamp)
+
+    def query(self, symbol: int, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """某个品种最近 limit 根 K 线：(开始时间数组, (limit, 5) 的 OHLCV 数组)"""
+        return self.times.latest(limit)[:, 0], self.bars.latest(limit)[:, :, symbol]
+
+
+class MarketEngine:
+    """
+    全局唯一的市场模拟
+
+    - step() 一次推进所有品种：对数收益 = 板块因子 + 个股噪声，涨跌停封板 / 开板，成交量随波动放大
+    - 每 ticks_per_day 个 tick 为一个交易日，收盘后以收盘价作为昨收重新计算涨跌停价
+    - snapshot_json() 每个 tick 只编码一次，请求再多也只有一次序列化开销
+    """
+
+    def __init__(
+        self,
+        tick_seconds: float = None,
+        ticks_per_day: int = None,
+        backfill_days: int = None,
+        seed: int = None
+    ):
+        self.tick_seconds = tick_seconds or float(os.getenv("MARKET_TICK_SECONDS", "3"))
+        self.ticks_per_day = ticks_per_day or int(os.getenv("MARKET_TICKS_PER_DAY", "240"))
+        if backfill_days is None:
+            backfill_days = int(os.getenv("MARKET_BACKFILL_DAYS", "60"))
+        if seed is None and os.getenv("MARKET_SEED"):
+            seed = int(os.getenv("MARKET_SEED"))
+        self.rng = np.random.default_rng(seed)
+
+        self.codes = [code for code, _, _, _ in STOCKS]
+        self.names = [name for _, name, _, _ in STOCKS]
+        self.sectors = [sector for _, _, sector, _ in STOCKS]
+        self.sector_names = list(SECTOR_VOLATILITY)
+        self.sector_index = np.array([self.sector_names.index(s) for s in self.sectors])
+        self.factor_vol = np.array([SECTOR_VOLATILITY[s][0] for s in self.sector_names])
+        self.idio_vol = np.array([SECTOR_VOLATILITY[s][1] for s in self.sectors])
+        n = len(STOCKS)
+
+        # 基金持仓矩阵：每只基金在各股票上的权重（板块权重在板块内均分）
+        self.fund_codes = [code for code, _, _, _ in FUNDS]
+        self.fund_names = [name for _, name, _, _ in FUNDS]
+        self.holdings = np.zeros((len(FUNDS), n))
+        for i, (_, _, _, weights) in enumerate(FUNDS):
+            for sector, weight in weights.items():
+                members = [j for j, s in enumerate(self.sectors) if s == sector]
+                self.holdings[i, members] = weight / len(members)
+        self.fund_base_nav = np.array([nav for _, _, nav, _ in FUNDS])
+
+        base = np.array([price for _, _, _, price in STOCKS])
+        self.base_price = base
+        self.prev_close = base.copy()
+        self.price = np.round(base * (1 + self.rng.uniform(-0.02, 0.02, n)), 2)
+        self.open = self.price.copy()
+        self.high = self.price.copy()
+        self.low = self.price.copy()
+        self.volume = self.rng.integers(10000, 60000, n).astype(np.float64)  # 手
+        self.amount = self.volume * LOT * self.price
+        self.limit_up = np.round(self.prev_close * (1 + LIMIT_RATIO), 2)
+        self.limit_down = np.round(self.prev_close * (1 - LIMIT_RATIO), 2)
+        self.locked_up = np.zeros(n, dtype=bool)
+        self.locked_down = np.zeros(n, dtype=bool)
+        self.fund_prev_nav = self.fund_base_nav.copy()
+        self.fund_nav = self._fund_nav()
+
+        self.tick = 0
+        self.day = 1
+        self.updated_at = datetime.now()
+        self._index = {code: i for i, code in enumerate(self.codes)}
+        self.candles: Dict[str, CandleSeries] = {
+            interval: CandleSeries(int(os.getenv(env, str(capacity))), n)
+            for interval, (capacity, env) in INTERVALS.items()
+        }
+        self._backfill(backfill_days)
+        self._record(np.zeros(n))
+
+        self._snapshot: Optional[bytes] = None
+        self._snapshot_tick = -1
+        self._task: Optional[asyncio.Task] = None
+        self.step_seconds = 0.0
+        self.snapshots_encoded = 0
+        self.snapshots_served = 0
+
+        # 推送：最近若干帧 (基准 tick, tick, SSE 编码后的 bytes)，基准为 None 表示完整快照
+        self._frames: Deque[Tuple[Optional[int], int, bytes]] = deque(
+            maxlen=int(os.getenv("MARKET_STREAM_BACKLOG", "32"))
+        )
+        self._frame_ready = asyncio.Event()
+        self._published_tick = self.tick
+        self._published_day = self.day
+        self._published_price = self.price.copy()
+        self._published_volume = self.volume.copy()
+        self._published_locks = self.locked_up | self.locked_down
+        self._published_nav = self.fund_nav.copy()
+        self._hello = _sse_bytes("hello", json.dumps(
+            {"fields": DELTA_FIELDS, "fundFields": FUND_DELTA_FIELDS}, separators=(",", ":")
+        ).encode("utf-8"))
+        self.subscribers = 0
+        self.frames_published = 0
+        self.frame_bytes = 0
+        self.delta_rows = 0
+        self.stream_resyncs = 0
+
+    def _fund_nav(self) -> np.ndarray:
+        return np.round(self.fund_base_nav * (self.holdings @ (self.price / self.base_price)), 4)
+
+    def _record(self, tick_volume: np.ndarray):
+        """把本 tick 的价格 / 成交量计入各周期的 K 线（每个周期一次向量运算）"""
+        now = time.time()
+        keys = {"tick": self.tick, "1m": int(now // 60), "5m": int(now // 300)}
+        for interval, key in keys.items():
+            self.candles[interval].update(key, now, self.price, tick_volume)
+        # 日 K 直接取当日行情（开盘价含跳空，成交量为当日累计）
+        day = self.candles["day"]
+        day.update(self.day, now, self.price, tick_volume)
+        day.bars.last()[:] = (self.open, self.high, self.low, self.price, self.volume)
+
+    def _backfill(self, days: int):
+        """生成启动前 days 个交易日的日 K（随机游走，最后一天收盘价为当前昨收）"""
+        if days <= 0:
+            return
+        n = len(self.codes)
+        growth = 1 + np.clip(self.rng.normal(0.0005, BACKFILL_DAILY_VOLATILITY, (days, n)), -LIMIT_RATIO, LIMIT_RATIO)
+        # 第 t 天收盘价 = 昨收 / 之后各天涨幅的累乘
+        after = np.vstack([np.cumprod(growth[::-1], axis=0)[::-1][1:], np.ones((1, n))])
+        closes = self.prev_close / after
+        opens = closes / growth
+        spread = self.rng.uniform(0.0, 0.02, (2, days, n))
+        highs = np.maximum(opens, closes) * (1 + spread[0])
+        lows = np.minimum(opens, closes) * (1 - spread[1])
+        volumes = self.rng.integers(20000, 120000, (days, n)).astype(np.float64)
+        bars = np.round(np.stack([opens, highs, lows, closes, volumes], axis=1), 2)
+        start = time.time() - days * 86400
+        for i in range(days):
+            self.candles["day"].append(start + i * 86400, bars[i])
+
+    # ---------- 模拟 ----------
+
+    def step(self):
+        """推进一个 tick（所有品种一次向量运算）"""
+        started = time.perf_counter()
+        n = len(self.codes)
+        if self.tick and self.tick % self.ticks_per_day == 0:
+            self._new_day()
+
+        factor = self.rng.normal(0.0, self.factor_vol)[self.sector_index]
+        returns = factor + self.rng.normal(0.0, self.idio_vol, n)
+
+        # 封板的股票小概率开板，否则保持不动
+        locked = self.locked_up | self.locked_down
+        reopen = locked & (self.rng.random(n) < REOPEN_PROBABILITY)
+        self.locked_up &= ~reopen
+        self.locked_down &= ~reopen
+        moving = ~(self.locked_up | self.locked_down)
+
+        price = np.where(moving, self.price * np.exp(returns), self.price)
+        hit_up = moving & (price >= self.limit_up)
+        hit_down = moving & (price <= self.limit_down)
+        price = np.round(np.clip(price, self.limit_down, self.limit_up), 2)
+        self.locked_up |= hit_up
+        self.locked_down |= hit_down
+
+        # 成交量：基础量随涨跌幅放大，封板时成交清淡
+        tick_volume = np.floor(
+            self.rng.lognormal(5.5, 0.4, n) * (1 + 80 * np.abs(returns)) * np.where(moving, 1.0, 0.2)
+        )
+        self.price = price
+        self.high = np.maximum(self.high, price)
+        self.low = np.minimum(self.low, price)
+        self.volume += tick_volume
+        self.amount += tick_volume * LOT * price
+        self.fund_nav = self._fund_nav()
+
+        self.tick += 1
+        self.updated_at = datetime.now()
+        self._record(tick_volume)
+        self.step_seconds += time.perf_counter() - started
+
+    def _new_day(self):
+        """收盘：收盘价作为昨收，重新计算涨跌停价，开盘价在昨收 ±2% 内跳空"""
+        n = len(self.codes)
+        self.day += 1
+        self.prev_close = self.price.copy()
+        self.fund_prev_nav = self.fund_nav.copy()
+        self.limit_up = np.round(self.prev_close * (1 + LIMIT_RATIO), 2)
+        self.limit_down = np.round(self.prev_close * (1 - LIMIT_RATIO), 2)
+        self.locked_up[:] = False
+        self.locked_down[:] = False
+        self.price = np.round(self.prev_close * (1 + self.rng.uniform(-0.02, 0.02, n)), 2)
+        self.open = self.price.copy()
+        self.high = self.price.copy()
+        self.low = self.price.copy()
+        self.volume = np.zeros(n)
+        self.amount = np.zeros(n)
+
+    # ---------- 后台推进 ----------
+
+    def start(self):
+        """在当前事件循环中启动定时推进（重复调用无副作用）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick_seconds
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # 事件循环被长时间阻塞时补齐错过的 tick，但一次最多补一个交易日
+            behind = min(int((time.monotonic() - next_tick) // self.tick_seconds) + 1, self.ticks_per_day)
+            for _ in range(behind):
+                self.step()
+            self.publish()
+            next_tick += behind * self.tick_seconds
+            if next_tick < time.monotonic():
+                next_tick = time.monotonic() + self.tick_seconds
+
+    # ---------- 快照 ----------
+
+    def snapshot(self) -> dict:
+        change = self.price - self.prev_close
+        change_percent = change / self.prev_close * 100
+        fund_change = (self.fund_nav - self.fund_prev_nav) / self.fund_prev_nav * 100
+        rows = zip(
+            self.codes, self.names, self.sectors,
+            self.price.tolist(), self.open.tolist(), self.high.tolist(), self.low.tolist(),
+            self.prev_close.tolist(), self.volume.tolist(), self.amount.tolist(),
+            change.tolist(), change_percent.tolist(),
+            self.limit_up.tolist(), self.limit_down.tolist(),
+            self.locked_up.tolist(), self.locked_down.tolist(),
+        )
+        stocks = [
+            {
+                "code": code, "name": name, "sector": sector,
+                "price": price, "open": open_, "high": high, "low": low, "close": close,
+                "volume": int(volume), "amount": round(amount, 2),
+                "change": round(chg, 2), "changePercent": round(pct, 2),
+                "limitUp": limit_up, "limitDown": limit_down,
+                "isLimitUp": is_up, "isLimitDown": is_down,
+            }
+            for (code, name, sector, price, open_, high, low, close, volume, amount,
+                 chg, pct, limit_up, limit_down, is_up, is_down) in rows
+        ]
+        funds = [
+            {"code": code, "name": name, "nav": nav, "change": round(chg, 2)}
+            for code, name, nav, chg in zip(self.fund_codes, self.fund_names, self.fund_nav.tolist(), fund_change.tolist())
+        ]
+        return {
+            "stocks": stocks,
+            "funds": funds,
+            "tick": self.tick,
+            "day": self.day,
+            "timestamp": self.updated_at.isoformat()
+        }
+
+    def snapshot_json(self) -> bytes:
+        """当前 tick 的行情 JSON（同一 tick 内的所有请求共用同一份编码结果）"""
+        if self._snapshot_tick != self.tick or self._snapshot is None:
+            self._snapshot = json.dumps(self.snapshot(), ensure_ascii=False).encode("utf-8")
+            self._snapshot_tick = self.tick
+            self.snapshots_encoded += 1
+        self.snapshots_served += 1
+        return self._snapshot
+
+    # ---------- 推送 ----------
+
+    def snapshot_frame(self) -> bytes:
+        """完整快照的 SSE 消息（复用同一 tick 的快照编码）"""
+        return _sse_bytes("snapshot", self.snapshot_json(), self.tick)
+
+    def publish(self):
+        """
+        把上次发布以来的变化编码成一帧并唤醒所有订阅者
+
+        同一交易日内只下发价格 / 成交量 / 封板状态有变化的品种，每个品种一行定长数组；
+        跨交易日时开盘价 / 昨收 / 涨跌停价全部改变，直接下发完整快照
+        """
+        if self.tick == self._published_tick:
+            return
+        locks = self.locked_up | self.locked_down
+        if self.day != self._published_day:
+            base, frame = None, self.snapshot_frame()
+        else:
+            base = self._published_tick
+            changed = np.flatnonzero(
+                (self.price != self._published_price)
+                | (self.volume != self._published_volume)
+                | (locks != self._published_locks)
+            )
+            change = self.price[changed] - self.prev_close[changed]
+            rows = zip(
+                [self.codes[i] for i in changed], self.price[changed].tolist(),
+                self.high[changed].tolist(), self.low[changed].tolist(),
+                self.volume[changed].astype(np.int64).tolist(), np.round(self.amount[changed], 2).tolist(),
+                np.round(change, 2).tolist(), np.round(change / self.prev_close[changed] * 100, 2).tolist(),
+                self.locked_up[changed].tolist(), self.locked_down[changed].tolist(),
+            )
+            funds = np.flatnonzero(self.fund_nav != self._published_nav)
+            fund_change = (self.fund_nav[funds] - self.fund_prev_nav[funds]) / self.fund_prev_nav[funds] * 100
+            payload = {
+                "tick": self.tick,
+                "base": base,
+                "stocks": [list(row) for row in rows],
+                "funds": [
+                    [self.fund_codes[i], nav, chg]
+                    for i, nav, chg in zip(funds.tolist(), self.fund_nav[funds].tolist(), np.round(fund_change, 2).tolist())
+                ],
+            }
+            frame = _sse_bytes("tick", json.dumps(payload, separators=(",", ":")).encode("utf-8"), self.tick)
+            self.delta_rows += len(changed)
+        self._frames.append((base, self.tick, frame))
+        self._published_tick = self.tick
+        self._published_day = self.day
+        self._published_price = self.price.copy()
+        self._published_volume = self.volume.copy()
+        self._published_locks = locks
+        self._published_nav = self.fund_nav.copy()
+        self.frames_published += 1
+        self.frame_bytes += len(frame)
+        # 唤醒当前所有等待者，后来的订阅者等待新的 Event
+        ready, self._frame_ready = self._frame_ready, asyncio.Event()
+        ready.set()
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """
+        单个订阅者的消息流：先发字段表和完整快照，之后按序发送增量帧
+
+        所有订阅者共用 _frames 里已编码好的帧；连接太慢、落后超出积压窗口时改发一次完整快照重新同步
+        """
+        self.subscribers += 1
+        try:
+            seen = self.tick
+            yield self._hello + self.snapshot_frame()
+            while True:
+                if not self._frames or self._frames[-1][1] <= seen:
+                    await self._frame_ready.wait()
+                    continue
+                pending = [frame for frame in self._frames if frame[1] > seen]
+                if pending[0][0] in (None, seen):
+                    seen = pending[-1][1]
+                    yield b"".join(data for _, _, data in pending)
+                else:
+                    self.stream_resyncs += 1
+                    seen = self.tick
+                    yield self.snapshot_frame()
+        finally:
+            self.subscribers -= 1
+
+    def history(self, code: str, interval: str, limit: int = None) -> Optional[dict]:
+        """某只股票某个周期最近 limit 根 K 线；代码不存在时返回 None"""
+        symbol = self._index.get(code)
+        if symbol is None:
+            return None
+        series = self.candles[interval]
+        times, bars = series.query(symbol, limit or len(series))
+        opens, highs, lows, closes = (np.round(bars[:, i], 2).tolist() for i in (OPEN, HIGH, LOW, CLOSE))
+        volumes = bars[:, VOLUME].astype(np.int64).tolist()
+        return {
+            "code": code,
+            "name": self.names[symbol],
+            "interval": interval,
+            "tick": self.tick,
+            "candles": [
+                {"time": int(t * 1000), "open": o, "high": h, "low": l, "close": c, "volume": v}
+                for t, o, h, l, c, v in zip(times.tolist(), opens, highs, lows, closes, volumes)
+            ]
+        }
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "tick": self.tick,
+            "day": self.day,
+            "symbols": len(self.codes),
+            "funds": len(self.fund_codes),
+            "history": {interval: len(series) for interval, series in self.candles.items()},
+            "history_bytes": sum(s.bars.data.nbytes + s.times.data.nbytes for s in self.candles.values()),
+            "avg_step_us": round(self.step_seconds / self.tick * 1e6, 1) if self.tick else None,
+            "snapshots_encoded": self.snapshots_encoded,
+            "snapshots_served": self.snapshots_served,
+            "stream": {
+                "subscribers": self.subscribers,
+                "frames_published": self.frames_published,
+                "avg_frame_bytes": round(self.frame_bytes / self.frames_published) if self.frames_published else None,
+                "avg_delta_rows": round(self.delta_rows / self.frames_published, 1) if self.frames_published else None,
+                "resyncs": self.stream_resyncs,
+            },
+        }
+
+
+def _sse_bytes(event: str, data: bytes, event_id: int = None) -> bytes:
+    """编码一条 SSE 消息（data 为不含换行的 JSON）"""
+    head = f"event: {event}\n" + (f"id: {event_id}\n" if event_id is not None else "")
+    return head.encode("utf-8") + b"data: " + data + b"\n\n"
@@ -0,0 +1,245 @@
+"""
+运行指标
+进程内的计数器 / 直方图，以 Prometheus 文本格式输出（/api/metrics），无需额外依赖
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import bisect
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# 大模型调用从几十毫秒（缓存、本地兜底）到几十秒（长输出）都有
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数（非累计）..., 总数], 总和
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key in sorted(self._counts):
+            counts = self._counts[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(self._sums[key])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Collected(_Metric):
+    """抓取时才从各组件的 stats() 读取的指标"""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...],
+                 collect: Callable[[], Iterable[Tuple[Tuple, float]]]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            samples = list(self.collect())
+        except Exception:
+            logger.exception("指标采集失败 (%s)", self.name)
+            return []
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in samples
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 重复注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def collect(self, name: str, help: str, kind: str, labelnames: Tuple[str, ...],
+                collect: Callable[[], Iterable[Tuple[Tuple, float]]]):
+        """注册抓取时计算的指标；collect 返回 [(标签值元组, 数值)]，重复注册时替换"""
+        self._metrics.pop(name, None)
+        self._register(_Collected(name, help, kind, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP 请求数", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（流式响应到最后一个字节）", ("method", "route"))
+
+UPSTREAM_CALLS = REGISTRY.counter(
+    "llm_upstream_calls_total", "上游大模型调用数", ("endpoint", "outcome"))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "llm_upstream_duration_seconds", "上游调用总耗时（含排队）", ("endpoint", "mode"))
+UPSTREAM_TTFT = REGISTRY.histogram(
+    "llm_upstream_ttft_seconds", "流式上游调用的首 token 时间（含排队）", ("endpoint",))
+UPSTREAM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "上游 token 用量（上游未返回 usage 时为本地估算）", ("endpoint", "kind"))
+
+FALLBACKS = REGISTRY.counter(
+    "llm_fallbacks_total", "改用本地模拟数据 / 备用内容的次数", ("operation",))
+PARSE_FAILURES = REGISTRY.counter(
+    "llm_parse_failures_total", "模型输出无法解析或校验失败的次数", ("operation",))
+
+BATCH_ITEMS = REGISTRY.counter(
+    "batch_items_total", "/api/batch 子请求数（不经过 HTTP 中间件，单独统计）", ("type", "status"))
+
+
+def record_fallback(operation: str):
+    FALLBACKS.inc(operation=operation)
+
+
+def record_parse_failure(operation: str):
+    PARSE_FAILURES.inc(operation=operation)
+
+
+def upstream_outcome(exc: Optional[BaseException]) -> str:
+    """上游调用结果分类（按类名判断，避免本模块依赖 openai / 熔断器）"""
+    if exc is None:
+        return "ok"
+    name = type(exc).__name__
+    if name == "CircuitOpenError":
+        return "circuit_open"
+    if name in ("DeadlineExceeded", "TimeoutError", "APITimeoutError"):
+        return "timeout"
+    if name in ("CancelledError", "GeneratorExit"):
+        return "cancelled"
+    if name == "RateLimitError":
+        return "rate_limited"
+    return "error"
+
+
+class MetricsMiddleware:
+    """
+    记录每个路由的请求数与耗时
+
+    纯 ASGI 实现：在最后一个 body 分片发出时计时，流式响应统计的是完整耗时；
+    按路由模板（如 /api/session/{session_id}）而不是实际路径聚合，避免标签爆炸
+    """
+
+    def __init__(self, app, skip: Tuple[str, ...] = ("/api/metrics",)):
+        self.app = app
+        self.skip = skip
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        done = False
+
+        def finish():
+            nonlocal done
+            if done:
+                return
+            done = True
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(method=scope["method"], route=path, status=status)
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=scope["method"], route=path)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
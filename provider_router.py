@@ -0,0 +1,238 @@
+"""
+多后端路由
+QwenService / ClaudeService 统一成同一个接口，按各后端每个操作的滚动延迟和错误率选择当前最快的健康后端
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import random
+import time
+
+from tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+
+class Provider(ABC):
+    """
+    后端接口
+
+    每个操作返回 None 或抛出异常都视为失败（由路由器换下一个后端），
+    不在内部退回模拟数据，否则路由器无法感知故障
+    """
+
+    name = "provider"
+
+    def is_available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def chat_with_npc(
+        self,
+        npc_name: str,
+        npc_profile: dict,
+        player_message: str,
+        conversation_history: List[dict] = None,
+        player_info: dict = None,
+        workplace_status: dict = None
+    ) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def generate_tasks(self, player_info: dict, current_time: str = "09:00") -> Optional[dict]:
+        ...
+
+
+class QwenProvider(Provider):
+    name = "qwen"
+
+    def __init__(self, service):
+        self.service = service
+
+    def is_available(self) -> bool:
+        return self.service.is_available()
+
+    async def chat_with_npc(
+        self,
+        npc_name: str,
+        npc_profile: dict,
+        player_message: str,
+        conversation_history: List[dict] = None,
+        player_info: dict = None,
+        workplace_status: dict = None
+    ) -> Optional[dict]:
+        messages = self.service._build_npc_messages(
+            npc_name, npc_profile, player_message,
+            conversation_history, player_info, workplace_status)
+        return await self.service._fetch_npc_reply(messages)
+
+    async def generate_tasks(self, player_info: dict, current_time: str = "09:00") -> Optional[dict]:
+        return await self.service._cached_tasks(player_info, current_time)
+
+
+class ClaudeProvider(Provider):
+    name = "claude"
+
+    def __init__(self, service):
+        self.service = service
+
+    def is_available(self) -> bool:
+        return self.service.is_available()
+
+    async def chat_with_npc(
+        self,
+        npc_name: str,
+        npc_profile: dict,
+        player_message: str,
+        conversation_history: List[dict] = None,
+        player_info: dict = None,
+        workplace_status: dict = None
+    ) -> Optional[dict]:
+        # ClaudeService 的 prompt 不使用职场状态
+        system_prompt, messages = self.service._build_npc_prompt(
+            npc_name, npc_profile, player_message, conversation_history, player_info)
+        return await self.service._fetch_npc_reply(system_prompt, messages)
+
+    async def generate_tasks(self, player_info: dict, current_time: str = "09:00") -> Optional[dict]:
+        return await self.service._fetch_tasks(player_info, current_time)
+
+
+class _OperationStats:
+    """单个 (后端, 操作) 的滚动统计"""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)  # 成功调用的耗时（秒）
+        self.outcomes = deque(maxlen=window)   # True 成功 / False 失败
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.calls = 0
+
+    def record(self, latency: float, ok: bool):
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            self.last_failure = time.monotonic()
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ProviderRouter:
+    """
+    延迟感知的多后端路由
+
+    - 每个后端、每个操作各自记录最近 window 次调用的耗时与成败
+    - 健康后端按 p50 从快到慢排序；样本不足 min_samples 的后端排在最前以积累数据
+    - 连续失败 max_consecutive_failures 次或错误率超过 max_error_rate 视为不健康，
+      cooldown 秒后放行一次探测；不健康的后端仍排在最后，作为最终兜底
+    - 单次调用失败立即换下一个后端，故障期间无需重启即可切换
+    - explore_rate 的概率把一个较慢的健康后端提到最前，保持其延迟数据新鲜
+    """
+
+    def __init__(
+        self,
+        providers: List[Provider],
+        window: int = 200,
+        min_samples: int = 5,
+        max_error_rate: float = 0.5,
+        max_consecutive_failures: int = 3,
+        cooldown: float = 30.0,
+        explore_rate: float = 0.05
+    ):
+        self.providers = providers
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        self.explore_rate = explore_rate
+        self._stats: Dict[tuple, _OperationStats] = {}
+        self.failovers = 0
+
+    def _get_stats(self, provider: Provider, operation: str) -> _OperationStats:
+        key = (provider.name, operation)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _OperationStats(self.window)
+        return stats
+
+    def _healthy(self, stats: _OperationStats) -> bool:
+        if stats.consecutive_failures >= self.max_consecutive_failures:
+            return False
+        return len(stats.outcomes) < self.min_samples or stats.error_rate <= self.max_error_rate
+
+    def rank(self, operation: str) -> List[Provider]:
+        """本次调用的后端尝试顺序"""
+        healthy, probes, unhealthy = [], [], []
+        now = time.monotonic()
+        for provider in self.providers:
+            if not provider.is_available():
+                continue
+            stats = self._get_stats(provider, operation)
+            if self._healthy(stats):
+                healthy.append(provider)
+            elif now - stats.last_failure >= self.cooldown:
+                probes.append(provider)
+            else:
+                unhealthy.append(provider)
+
+        def speed(provider):
+            stats = self._get_stats(provider, operation)
+            if len(stats.latencies) < self.min_samples:
+                return -1.0
+            return stats.percentile(0.5)
+
+        healthy.sort(key=speed)
+        if len(healthy) > 1 and random.random() < self.explore_rate:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        # 冷却期满的后端先探测一次：成功则恢复健康，失败则重新计时
+        return probes + healthy + unhealthy
+
+    async def call(self, operation: str, *args, **kwargs) -> Optional[object]:
+        """按排序依次尝试各后端，返回第一个成功的结果；全部失败返回 None"""
+        for attempt, provider in enumerate(self.rank(operation)):
+            if attempt:
+                self.failovers += 1
+            stats = self._get_stats(provider, operation)
+            started = time.monotonic()
+            try:
+                with span(f"provider.{provider.name}", operation=operation):
+                    result = await getattr(provider, operation)(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("%s.%s 调用失败，换下一个后端: %s", provider.name, operation, e)
+                result = None
+            stats.record(time.monotonic() - started, result is not None)
+            if result is not None:
+                return result
+        return None
+
+    def stats(self) -> dict:
+        """各后端、各操作的 p50 / p95 延迟（毫秒）、错误率与健康状态"""
+        result = {"failovers": self.failovers, "providers": {}}
+        for (name, operation), stats in self._stats.items():
+            p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+            result["providers"].setdefault(name, {})[operation] = {
+                "calls": stats.calls,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "error_rate": round(stats.error_rate, 3),
+                "healthy": self._healthy(stats),
+            }
+        return result
@@ -3,30 +3,93 @@ Qwen3 大模型服务
 使用 ModelScope API 提供 AI 对话和任务生成功能
 """
 
-from openai import OpenAI
+from conversation_window import ConversationWindow
+from job_pool import resume_bucket
+from llm_client import UpstreamClient
+from llm_parser import (
+    DialogueTrailerSplitter, JsonArrayItemExtractor, strip_think
+)
+from metrics import record_fallback, record_parse_failure
+from prompt_templates import (
+    INTERVIEW_CONTEXT, INTERVIEW_SAMPLE_ANSWER, JOB_LISTING_CONTEXT, JOB_LISTING_PREFIX, NPC_PLAYER,
+    PromptLibrary, interview_company_kind, interview_prefix, npc_prefix
+)
+from response_cache import ResponseCache, bucket
+from single_flight import SingleFlight
+from structured_output import OUTPUT_SPECS, StructuredOutputs, validate_output
+from tracing import span, traced
 from typing import List, Optional
-import json
-import re
+import asyncio
+import logging
 import os
 
 
+logger = logging.getLogger(__name__)
+
+
 class QwenService:
     """Qwen3 API 服务封装"""
 
-    def __init__(self):
+    def __init__(self, base_url: str = None, max_inflight: int = None):
         # 从环境变量读取 API key，如果不存在则使用默认值
         api_key = os.getenv('MODELSCOPE_API_KEY', 'ms-afd08d8f-34cf-4d75-9aa4-6387d6c34a96')
 
-        self.client = OpenAI(
-            base_url='https://api-inference.modelscope.cn/v1',
+        # 异步客户端：连接池复用 + 并发上限，不阻塞事件循环
+        self.client = UpstreamClient(
             api_key=api_key,
+            base_url=base_url,
+            max_inflight=max_inflight
         )
         self.model = 'Qwen/Qwen3-235B-A22B-Instruct-2507'
 
+        # 各接口的截止时间（秒，含排队时间；流式接口指首个 token），超时即走本地兜底。
+        # 均短于前端 60s 的请求超时，上游卡住时玩家能尽快看到降级结果
+        self.client.configure('npc_chat', deadline=15)
+        self.client.configure('conversation_summary', deadline=20)
+        self.client.configure('interview_question', deadline=25)
+        self.client.configure('interview_next_question', deadline=15)
+        self.client.configure('interview_sample_answer', deadline=30)
+        self.client.configure('job_listings', deadline=45)
+        self.client.configure('tasks', deadline=20)
+        self.client.configure('workplace_event', deadline=20)
+        self.client.configure('workplace_events', deadline=45)
+        # 行动判断是玩家操作后的即时反馈，等不了太久
+        self.client.configure('player_action', deadline=8)
+        # 短调用可选对冲：QWEN_HEDGE_DELAY 秒内未返回时再发一份，先返回的为准（0 关闭）
+        self.client.configure(
+            'interview_analyze',
+            deadline=8,
+            hedge_after=float(os.getenv('QWEN_HEDGE_DELAY', '0'))
+        )
+
+        # prompt 模板：静态前缀只编译一次，便于上游命中前缀缓存
+        self.prompts = PromptLibrary()
+
+        # 对话历史按 token 预算截取，滑出窗口的轮次在后台折叠为摘要
+        self.npc_window = ConversationWindow(800, summarizer=self._summarize_history)
+        self.interview_window = ConversationWindow(1200, summarizer=self._summarize_history)
+        self.analysis_window = ConversationWindow(500)
+
+        # 相同 prompt 键的并发调用合并为一次上游请求
+        self.flight = SingleFlight()
+
+        # 重复度高的接口走响应缓存（条目上限 + 各接口 TTL / 宽限期 / 备选数）
+        self.cache = ResponseCache(
+            max_entries=int(os.getenv('LLM_CACHE_SIZE', '512')),
+            flight=self.flight
+        )
+        self.cache.configure('workplace_event', ttl=600, stale_ttl=1800, variants=4)
+        self.cache.configure('tasks', ttl=1800, stale_ttl=3600, variants=3)
+        self.cache.configure('interview_analyze', ttl=3600, stale_ttl=3600, variants=1)
+
+        # 结构化输出：schema 校验，失败时本地修复 + 至多一次定向重问
+        self.outputs = StructuredOutputs(self.client, self.model)
+
     def is_available(self) -> bool:
         """检查 API 是否可用"""
         return self.client is not None
 
+    @traced("qwen.chat_with_npc")
     async def chat_with_npc(
         self,
         npc_name: str,
@@ -50,96 +113,179 @@ class QwenService:
         Returns:
             包含响应内容、情绪、关系变化的字典
         """
-        # 构建系统提示 - 增加职场真实性
-        system_prompt = f"""你是一个职场模拟游戏中的 NPC，名叫"{npc_name}"。
-
-【角色设定】
-- 职位：{npc_profile.get('position', '员工')}
-- 性格：{npc_profile.get('personality', '普通')}
-- 说话风格：{npc_profile.get('speaking_style', '正常')}
-- 派系倾向：{npc_profile.get('faction', '无')}
-
-【游戏背景】
-这是一个真实的职场沙盒游戏，包含：
-- 办公室政治：派系斗争、站队、拉拢、排挤
-- 职场晋升：KPI考核、绩效评估、升职竞争
-- 职场阴暗面：抢功、甩锅、背后议论、职场霸凌
-- 人际关系：好感度影响对话态度和帮助意愿
+        messages = self._build_npc_messages(
+            npc_name, npc_profile, player_message,
+            conversation_history, player_info, workplace_status)
 
-【玩家信息】
-{self._format_player_info(player_info, workplace_status)}
-
-【回复要求】
-1. 保持角色性格一致，要符合真实职场
-2. 根据玩家的职场状态（KPI、压力、好感度）调整态度
-3. 可以适当：
-   - 透露办公室政治信息
-   - 暗示站队利弊
-   - 表达对玩家的真实看法（可以是负面的）
-   - 如果好感度低，可以冷淡或敷衍
-4. 回复要简洁自然，像真实职场对话（2-4句话）
-5. 在回复末尾用 JSON 格式标注：
-   {{"emotion": "happy|neutral|angry|sad|surprised|contempt|jealous", "relationship_change": -10到+10}}
-   
-【重要】不要在思考过程中输出 <think> 标签，直接输出对话内容。"""
+        try:
+            reply = await self._fetch_npc_reply(messages)
+            if reply:
+                return reply
+        except Exception:
+            logger.exception("Qwen API 错误 (chat_with_npc)")
+        return self._mock_npc_response(npc_name, player_info, workplace_status)
+
+    async def _fetch_npc_reply(self, messages: List[dict]) -> Optional[dict]:
+        """NPC 对话的上游调用，上游异常照常抛出，空回复返回 None"""
+        response_text = await self.client.complete(
+            endpoint="npc_chat",
+            model=self.model,
+            messages=messages,
+            max_tokens=300,
+            temperature=0.8
+        )
+
+        # 与流式接口共用同一个解析器：去掉思考标签，拆出末尾的情绪/关系标注
+        with span("parse.npc_reply"):
+            splitter = DialogueTrailerSplitter()
+            splitter.feed(response_text)
+            splitter.finish()
+            if not splitter.dialogue.strip():
+                return None
+            meta = self._npc_meta(splitter)
+
+        return {
+            "npc_response": splitter.dialogue.strip(),
+            **meta
+        }
+
+    async def chat_with_npc_stream(
+        self,
+        npc_name: str,
+        npc_profile: dict,
+        player_message: str,
+        conversation_history: List[dict] = None,
+        player_info: dict = None,
+        workplace_status: dict = None
+    ):
+        """
+        NPC 对话 - 流式版本
+
+        对话正文逐段产出 ("delta", 文本)；末尾的情绪/关系标注被扣下增量解析，
+        最后产出 ("done", 与 chat_with_npc 相同结构的完整结果)
+        """
+        messages = self._build_npc_messages(
+            npc_name, npc_profile, player_message,
+            conversation_history, player_info, workplace_status)
+
+        splitter = DialogueTrailerSplitter()
+        sent_any = False
+        try:
+            async for delta in self.client.stream(
+                endpoint="npc_chat",
+                model=self.model,
+                messages=messages,
+                max_tokens=300,
+                temperature=0.8
+            ):
+                text = splitter.feed(delta)
+                if not sent_any:
+                    text = text.lstrip()  # 开头的空白不单独下发
+                if text:
+                    sent_any = True
+                    yield "delta", text
+            text = splitter.finish()
+            if text.strip():
+                yield "delta", text
+        except Exception:
+            logger.exception("Qwen API 错误 (chat_with_npc_stream)")
+
+        if not splitter.dialogue.strip():
+            # 上游失败且尚未输出任何正文：改用模拟回复
+            result = self._mock_npc_response(npc_name, player_info, workplace_status)
+            yield "delta", result["npc_response"]
+            yield "done", result
+            return
+
+        meta = self._npc_meta(splitter)
+        yield "done", {
+            "npc_response": splitter.dialogue.strip(),
+            **meta
+        }
+
+    @traced("prompt.npc")
+    def _build_npc_messages(
+        self,
+        npc_name: str,
+        npc_profile: dict,
+        player_message: str,
+        conversation_history: List[dict] = None,
+        player_info: dict = None,
+        workplace_status: dict = None
+    ) -> List[dict]:
+        """构建 NPC 对话的消息列表"""
+        # 构建系统提示：NPC 通用规则 + 角色设定为静态前缀，玩家信息放在末尾
+        system_prompt = self.prompts.render(
+            "chat_with_npc",
+            (npc_name,),
+            lambda: npc_prefix(npc_name, npc_profile),
+            NPC_PLAYER.format(player_info=self._format_player_info(player_info, workplace_status))
+        )
 
         # 构建消息列表
         messages = [{"role": "system", "content": system_prompt}]
 
         if conversation_history:
-            for msg in conversation_history[-6:]:  # 保留最近6条
+            player_name = (player_info or {}).get('name', '')
+            recent, summary = self.npc_window.build(
+                f"npc|{npc_name}|{player_name}", conversation_history)
+            if summary:
+                messages.append({"role": "system", "content": f"【更早的对话摘要】\n{summary}"})
+            for msg in recent:
                 role = "user" if msg.get("role") == "player" else "assistant"
                 messages.append(
                     {"role": role, "content": msg.get("content", "")})
 
         messages.append({"role": "user", "content": player_message})
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=300,
-                temperature=0.8,
-                stream=False
-            )
+        return messages
 
-            response_text = response.choices[0].message.content
+    async def _summarize_history(self, previous: Optional[str], messages: List[dict]) -> str:
+        """把滑出窗口的对话折叠进滚动摘要（由 ConversationWindow 在后台调用）"""
+        lines = []
+        for msg in messages:
+            role = msg.get("role", "")
+            speaker = "玩家" if role == "player" else ("对方" if role == "assistant" else role)
+            lines.append(f"{speaker}：{msg.get('content', '')}")
 
-            # 清理可能的思考标签
-            response_text = re.sub(r'<think>.*?</think>',
-                                   '', response_text, flags=re.DOTALL)
-            response_text = response_text.strip()
+        prompt = f"""把【已有摘要】和【新增对话】合并成一段不超过120字的中文摘要。
+保留人物关系、承诺、冲突和关键事实，只输出摘要正文。
 
-            # 解析情绪和关系变化
-            emotion = "neutral"
-            relationship_change = 0
+【已有摘要】
+{previous or '无'}
 
-            json_match = re.search(r'\{[^}]+\}', response_text)
-            if json_match:
-                try:
-                    meta = json.loads(json_match.group())
-                    emotion = meta.get("emotion", "neutral")
-                    relationship_change = int(
-                        meta.get("relationship_change", 0))
-                    # 限制范围
-                    relationship_change = max(-10,
-                                              min(10, relationship_change))
-                    # 移除 JSON 部分
-                    response_text = response_text.replace(
-                        json_match.group(), "").strip()
-                except:
-                    pass
-
-            return {
-                "npc_response": response_text,
-                "emotion": emotion,
-                "relationship_change": relationship_change
-            }
+【新增对话】
+{chr(10).join(lines)}"""
 
-        except Exception as e:
-            print(f"Qwen API 错误: {e}")
-            return self._mock_npc_response(npc_name, player_info, workplace_status)
+        text = await self.client.complete(
+            endpoint="conversation_summary",
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=200,
+            temperature=0.3
+        )
+        return strip_think(text).strip()
 
+    def _npc_meta(self, splitter: DialogueTrailerSplitter) -> dict:
+        """取出 NPC 回复末尾的标注；缺失或格式不对时记一次解析失败，使用中性默认值"""
+        if splitter.meta:
+            try:
+                return self._normalize_npc_meta(splitter.meta)
+            except (TypeError, ValueError):
+                pass
+        record_parse_failure("npc_chat")
+        return {"emotion": "neutral", "relationship_change": 0}
+
+    def _normalize_npc_meta(self, meta: dict) -> dict:
+        """规范化 NPC 回复末尾的情绪/关系标注"""
+        relationship_change = int(meta.get("relationship_change", 0))
+        return {
+            "emotion": meta.get("emotion", "neutral"),
+            # 限制范围
+            "relationship_change": max(-10, min(10, relationship_change))
+        }
+
+    @traced("qwen.generate_interview_question")
     async def generate_interview_question(
         self,
         player_info: dict,
@@ -156,12 +302,63 @@ class QwenService:
         if not self.client:
             return self._mock_interview_question()
 
+        # ====== 仅分析模式 ======
+        if action == 'analyze':
+            try:
+                result = await self._cached_interview_analysis(round_info, conversation_history)
+                if result:
+                    return result
+            except Exception:
+                logger.exception("面试点评生成失败")
+                return { "analysis": "（沉思...）", "question": "", "sample_answer": "", "type": "", "display_type": "" }
+
+        # ====== 完整模式 (旧逻辑) ======
+        messages = self._build_interview_messages(
+            player_info, company_info, job_info, round_info, conversation_history)
+
+        try:
+            result = await self.outputs.generate(
+                "interview_question",
+                messages,
+                max_tokens=1000,
+                temperature=0.9  # 提高温度增加多样性
+            )
+            if result is not None:
+                return result
+
+        except Exception:
+            logger.exception("Qwen API 错误 (generate_interview_question)")
+            
+        return self._fallback_interview_question()
+
+    async def _cached_interview_analysis(self, round_info: dict, conversation_history: List[dict]) -> Optional[dict]:
+        """经过响应缓存的点评，只取最近一轮对话；失败返回 None（上游异常照常抛出）"""
         interviewer_role = round_info.get('interviewerRole', '面试官')
         is_pressure = round_info.get('isPressure', False)
+        # 只需最近一轮对话用于分析，按 token 预算截取
+        last_exchange, _ = self.analysis_window.select(conversation_history)
+        cache_inputs = {
+            "role": interviewer_role,
+            "pressure": bool(is_pressure),
+            "exchange": [
+                [msg.get("role") == "player", " ".join(str(msg.get("content", "")).split())]
+                for msg in last_exchange
+            ]
+        }
+        return await self.cache.get_or_fetch(
+            "interview_analyze",
+            cache_inputs,
+            lambda: self._fetch_interview_analysis(interviewer_role, is_pressure, last_exchange)
+        )
 
-        # ====== 仅分析模式 ======
-        if action == 'analyze':
-            prompt = f"""
+    async def _fetch_interview_analysis(
+        self,
+        interviewer_role: str,
+        is_pressure: bool,
+        last_exchange: List[dict]
+    ) -> Optional[dict]:
+        """仅分析模式的上游调用，解析失败返回 None"""
+        prompt = f"""
 你是一位严厉的{interviewer_role}。请点评候选人刚才的回答。
 当前是否压力面试：{'是' if is_pressure else '否'}。
 【要求】
@@ -174,39 +371,38 @@ class QwenService:
 {{ "analysis": "你的点评内容" }}
 直接输出JSON。
 """
-            messages = [{"role": "system", "content": prompt}]
-            if conversation_history:
-                # 只需最近的一轮对话用于分析
-                last_exchange = conversation_history[-2:]
-                for msg in last_exchange:
-                     role = "user" if msg.get("role") == "player" else "assistant"
-                     messages.append({"role": role, "content": msg.get("content", "")})
-
-            try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=200, # 只需要很少token
-                    temperature=0.8,
-                    stream=False
-                )
-                txt = response.choices[0].message.content
-                txt = re.sub(r'<think>.*?</think>', '', txt, flags=re.DOTALL)
-                match = re.search(r'\{[\s\S]+\}', txt)
-                if match:
-                    res = json.loads(match.group())
-                    return {
-                        "analysis": res.get("analysis", "（点头记录）"),
-                        "question": "",
-                        "sample_answer": "",
-                        "type": "",
-                        "display_type": ""
-                    }
-            except Exception as e:
-                print(f"Analysis error: {e}")
-                return { "analysis": "（沉思...）", "question": "", "sample_answer": "", "type": "", "display_type": "" }
+        messages = [{"role": "system", "content": prompt}]
+        for msg in last_exchange:
+            role = "user" if msg.get("role") == "player" else "assistant"
+            messages.append({"role": role, "content": msg.get("content", "")})
+
+        res = await self.outputs.generate(
+            "interview_analyze",
+            messages,
+            max_tokens=200, # 只需要很少token
+            temperature=0.8
+        )
+        if res is None:
+            return None
+        return {
+            "analysis": res["analysis"],
+            "question": "",
+            "sample_answer": "",
+            "type": "",
+            "display_type": ""
+        }
 
-        # ====== 完整模式 (旧逻辑) ======
+    @traced("prompt.interview")
+    def _build_interview_messages(
+        self,
+        player_info: dict,
+        company_info: dict,
+        job_info: dict,
+        round_info: dict,
+        conversation_history: List[dict] = None,
+        question_only: bool = False
+    ) -> List[dict]:
+        """构建面试消息列表：完整模式（分析+提问+示例），或流水线模式下只生成题目"""
         # 分析历史对话，提取已问过的问题类型
         history_summary = ""
         asked_topics = []
@@ -221,229 +417,55 @@ class QwenService:
 
 【重要】不要重复上述问题类型，换一个全新的角度提问！"""
 
-        # 分析玩家之前的回答，用于生成改进版示例
-        last_player_answer = ""
-        answer_improvement_hint = ""
-        if conversation_history:
-            for msg in reversed(conversation_history):
-                if msg.get("role") == "player":
-                    last_player_answer = msg.get("content", "")
-                    break
-            
-            if last_player_answer:
-                # 关键改进：把玩家的上次回答直接告诉 AI
-                answer_improvement_hint = f"""
-【玩家上次的回答内容】
-"{last_player_answer}"
-
-【示例回答生成要求 - 非常重要！】
-玩家刚才的回答可能不够完整。你需要生成一个**改进版**的示例回答：
-1. **不要**重复玩家已经说过的内容
-2. **在玩家回答的基础上扩展**，添加以下内容：
-   - 具体的数据和数字（如：提升了30%的性能、管理5人团队）
-   - 真实的项目案例细节
-   - 解决问题的具体方法和成果
-   - 体现个人成长和反思
-3. 示例回答应该是一个**完整的、高质量的回答**，不是追问或评论
-4. 帮助玩家理解如何把简短回答扩展成详细回答"""
-
-        # 根据面试轮次选择问题风格
         round_num = round_info.get('round', 1)
         interviewer_role = round_info.get('interviewerRole', '面试官')
-        is_pressure = round_info.get('isPressure', False)
-        
-        # 专业面试技巧指导（使用抽象指令而非具体例子，防止模型抄袭）
-        interviewing_techniques = """
-【面试官的高级技巧】
-1. **深度追问**：不要满足于表面的答案。使用"Why", "How", "What else" 挖掘细节。如果候选人提到用了某个技术，问他为什么不用替代方案，底层原理是什么。
-2. **场景假设**：不要问"你会不会..."，而要问"现在发生了...你会怎么做？"。构建具体的、带有冲突的业务场景。
-3. **压力测试**：直接指出候选人简历或回答中的逻辑矛盾。用怀疑的语气提问。
-4. **行为面试**：挖掘过去的具体行为实例（STAR法则），关注候选人的真实行动和结果，而不是理论。
-5. **价值观探测**：通过两难选择（如：进度vs质量，个人vs团队）来探测候选人的真实优先级。
-"""
-
-        role_specific_questions = ""
-        if interviewer_role == "HR":
-            role_specific_questions = """
-【HR关注点】
-- 重点考察：稳定性、薪资性价比、文化匹配度、情商。
-- 提问策略：挖掘离职的真实原因（任何理由都要质疑一下），考察对加班/出差的态度，测试其抗压能力和沟通技巧。不要问通用的"你有什么缺点"，要结合具体工作习惯来问。
-"""
-        elif interviewer_role == "技术面试官":
-            role_specific_questions = """
-【技术面试官关注点】
-- 重点考察：技术深度、广度、解决问题的思路、学习能力。
-- 提问策略：抓住简历上的一个技术点死磕到底，直到候选人答不上来为止。考察系统设计能力（高并发、高可用）。关注对新技术的看法，要求说明技术选型的思考过程。
-"""
-        elif interviewer_role == "部门主管" or is_pressure:
-            role_specific_questions = """
-【主管/压力面关注点】
-- 重点考察：宏观视野、项目管理、抗压能力、商业意识。
-- 提问策略：质疑候选人的过往成就（"这不都是别人的功劳吗？"），给出不可能完成的任务看反应，考察对行业趋势的理解。必须非常犀利，不留情面。
-"""
-
-        # 根据轮次设定侧重点
-        round_focus = ""
-        if round_num == 1:
-            round_focus = """
-【当前是第一轮面试 - 侧重基础与核实】
-- 重点考察：基础知识是否扎实、简历内容是否真实、沟通能力是否达标。
-- 提问方向：
-  1. 简历上提到的技能点的基础原理
-  2. 以前项目的具体职责和产出
-  3. 离职原因和求职动机
-- 风格：相对平和，但要确认有没有撒谎
-"""
-        else:
-            round_focus = """
-【当前是第二轮/终面 - 侧重深度与潜力】
-- 重点考察：解决复杂问题的能力、技术深度、系统设计思维、文化契合度。
-- 提问方向：
-  1. 开放性的系统设计问题（如：如何设计高并发系统）
-  2. 追问项目中最难的技术难点，深挖底层
-  3. 考察抗压能力和临场反应
-  4. 价值观和职业规划的深层匹配
-- 风格：更加犀利、更有挑战性，不要问太基础的问题
-"""
-
-        # 根据公司类型定制风格
+        is_pressure = bool(round_info.get('isPressure', False))
         company_type = company_info.get('type', '')
-        company_desc = company_info.get('description', '')
-        company_context_prompt = ""
-        
-        if "初创" in company_type or "Startup" in company_type or "天使" in company_type:
-            company_context_prompt = """
-【公司特定背景 - 初创公司/创业团队】
-- ⚠️ 核心痛点：人少事多，变化快，资源少。
-- 面试官心态：我们需要"即插即用"的特种兵，不仅要技术好，还要能抗压、能加班、能接受所有事情都不完善的状态。
-- 提问倾向：
-  * 考察多面手能力（"前端后端运维你能否一肩挑？"）
-  * 考察对混乱的容忍度（"如果我们只有目标没有文档，全靠口头沟通，你能干活吗？"）
-  * 考察创业激情和加班意愿（"996对我们是常态，你家里人支持吗？"）
-"""
-        elif "大厂" in company_type or "集团" in company_type or "上市" in company_type or "500强" in company_type:
-            company_context_prompt = """
-【公司特定背景 - 大厂/上市公司】
-- ⚠️ 核心痛点：流程复杂，协同困难，造轮子多。
-- 面试官心态：我们需要"螺丝钉"但要有大局观，看重规范、文档、方法论和跨部门协作。
-- 提问倾向：
-  * 考察流程规范（"你的代码如何保证可维护性？Code Review流程是怎样的？"）
-  * 考察协作能力（"产品经理的需求如果不合理，你会怎么推回去？"）
-  * 考察深度和造轮子（"为什么不用开源库而要自己写这个组件？底层原理是什么？"）
-"""
-        elif "国企" in company_type or "事业单位" in company_type:
-            company_context_prompt = """
-【公司特定背景 - 国企/稳定性企业】
-- ⚠️ 核心痛点：稳定压倒一切，层级森严。
-- 面试官心态：我们需要踏实肯干、听话、不惹事的人，技术不用最顶尖但要稳。
-- 提问倾向：
-  * 考察文字功底和汇报能力
-  * 考察稳定性（"你能在这个岗位干5年以上吗？"）
-  * 考察对加班/奉献的看法
-"""
-        else:
-            company_context_prompt = """
-【公司特定背景 - 中型成长企业】
-- 注重实效和业务落地，要求技术能快速转化为业务价值。
-- 关注解决实际问题的能力，而不是过分追求理论。
-"""
-
-        # 压力面试专用提示
-        pressure_instruction = ""
-        if is_pressure:
-            pressure_instruction = """
-【🔥 压力面试模式 - 必须要非常有压迫感！】
-你需要扮演一个**非常挑剔、甚至带有攻击性**的面试官。
-- **态度**：冷淡、怀疑、不耐烦、直接打断。
-- **常用话术**：
-  * "我不觉得这个项目有什么难点，这不就是CRUD吗？"
-  * "你说了半天由于时间关系我打断一下，你直接告诉我结果。"
-  * "你的简历上说精通这个，但我看你的回答很肤浅啊。"
-  * "如果是这样的话，我觉得你可能不太适合我们这个岗位。"
-- **目标**：击穿候选人的心理防线，看他在被否定时是否还能逻辑清晰地反驳。
-"""
-
-        # 系统提示词构建
-        system_prompt = f"""你是一个经验丰富、眼光犀利的面试官。你的目标是通过精心设计的问题，看穿候选人的真实水平和性格。
-
-【面试背景】
-- 公司: {company_info.get('name', '某公司')} ({company_type})
-- 职位: {job_info.get('title', '应聘岗位')}
-- 面试轮次: 第 {round_num} 轮
-- 面试官身份: {interviewer_role}
-- 压力面试: {"是" if is_pressure else "否"}
-
-{round_focus}
-{company_context_prompt}
-{pressure_instruction}
-
-【生成要求 - 拒绝平庸】
-1. **场景化提问**：不要干巴巴地问"你有什么缺点"。要结合具体工作场景！
-   - ❌ 差："你遇到过什么困难？"
-   - ✅ 好："假设明天就要上线了，突然发现一个严重Bug，但是修复在这个Bug可能会导致数据丢失，而不修复会影响用户体验，这时候只有你一个人在，你会怎么做？"
-2. **结合公司属性**：必须参考上方的【公司特定背景】，问出符合公司调性的问题。如果是初创公司就问抗压，大厂就问流程。
-3. **针对性追问**：参考【候选人信息】，针对简历里的疑点进行提问。如果简历很完美，就找茬。
-4. **问题长度**：问题必须包含**背景描述**和**具体情境**，长度不少于50字，让问题听起来像真人在说话，有语气和情绪。
-
-【候选人信息】
-- 姓名: {player_info.get('name', '求职者')}
-- 年龄: {player_info.get('age', 25)}岁
-- 学历: {player_info.get('education', '本科')} - {player_info.get('school', '某大学')}
-- 专业: {player_info.get('major', '计算机')}
-- 工作经验: {player_info.get('experience', 0)}年
-- 技能: {', '.join(player_info.get('skills', []))}
-- 项目经历: {', '.join(player_info.get('projects', [])[:2]) if player_info.get('projects') else '无'}
-{history_summary}
-
-【生成要求】
-1. **回顾与点评**：首先，针对【玩家上次的回答内容】（如果有），生成一段简短、犀利的点评（analysis）。
-   - 如果是压力面，要挑刺、质疑或者冷嘲热讽。
-   - 如果是普通面，要指出回答中的亮点或不足。
-2. **新问题**：根据当前背景和历史对话，生成一个**全新的**面试问题。
-3. **绝对不要**问与历史相似的问题！每次都要换一个完全不同的方向。
-4. **生成示例回答**：
-   - 必须是候选人（玩家）的回答，而不是面试官的问题！
-   - **即使在压力面，也要回答得不卑不亢、有理有据**。
-   - **必须包含具体数据**（如：QPS提升50%，由3人扩充到10人团队）。
-   - **必须包含具体场景**（如：在双11大促期间...）。
-
-【返回格式】
-{{
-    "analysis": "面试官对上一轮回答的点评（1-2句话，要符合人设）",
-    "question": "面试官的新问题（包含场景描述）",
-    "sample_answer": "给玩家参考的高质量回答（数据详实、逻辑严密）",
-    "type": "technical|behavioral|personal|stress",
-    "display_type": "问题分类名(如: 架构设计)"
-}}
 
-不要输出思考过程，直接输出 JSON。"""
+        # 轮次 / 公司类型 / 压力面决定静态前缀，其余候选人与面试信息放在后缀
+        round_key = "first" if round_num == 1 else "later"
+        company_kind = interview_company_kind(company_type)
+        suffix = INTERVIEW_CONTEXT.format(
+            company_name=company_info.get('name', '某公司'),
+            company_type=company_type,
+            job_title=job_info.get('title', '应聘岗位'),
+            round_num=round_num,
+            interviewer_role=interviewer_role,
+            pressure="是" if is_pressure else "否",
+            name=player_info.get('name', '求职者'),
+            age=player_info.get('age', 25),
+            education=player_info.get('education', '本科'),
+            school=player_info.get('school', '某大学'),
+            major=player_info.get('major', '计算机'),
+            experience=player_info.get('experience', 0),
+            skills=', '.join(player_info.get('skills', [])),
+            projects=', '.join(player_info.get('projects', [])[:2]) if player_info.get('projects') else '无',
+            history_summary=history_summary
+        )
+        system_prompt = self.prompts.render(
+            "interview_next_question" if question_only else "interview_question",
+            (round_key, company_kind, is_pressure),
+            lambda: interview_prefix(round_key, company_kind, is_pressure, question_only),
+            suffix
+        )
 
         messages = [{"role": "system", "content": system_prompt}]
         if conversation_history:
-            for msg in conversation_history[-4:]:
+            recent, summary = self.interview_window.build(
+                f"interview|{company_info.get('name', '')}|{job_info.get('title', '')}|{player_info.get('name', '')}",
+                conversation_history
+            )
+            if summary:
+                messages.append({"role": "system", "content": f"【更早的面试对话摘要】\n{summary}"})
+            for msg in recent:
                 role = "user" if msg.get("role") == "player" else "assistant"
                 messages.append({"role": role, "content": msg.get("content", "")})
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=1000,
-                temperature=0.9,  # 提高温度增加多样性
-                stream=False
-            )
+        return messages
 
-            response_text = response.choices[0].message.content
-            response_text = re.sub(r'<think>.*?</think>', '', response_text, flags=re.DOTALL)
-            
-            json_match = re.search(r'\{[\s\S]+\}', response_text)
-            if json_match:
-                return json.loads(json_match.group())
-                
-        except Exception as e:
-            print(f"Qwen API 错误 (generate_interview_question): {e}")
-            
-        # 备用问题 - 也添加多样性
+    def _fallback_interview_question(self) -> dict:
+        """备用问题 - 也添加多样性"""
+        record_fallback("interview_question")
         import random
         fallback_questions = [
             ("请简单介绍一下你自己。", "自我介绍", "personal"),
@@ -471,116 +493,255 @@ class QwenService:
         conversation_history: List[dict] = None
     ):
         """
-        流式生成面试问题 - 防止超时
-        使用与非流式版本相同的prompt，但返回异步生成器
+        面试流水线 - 点评与下一题并发生成，示例回答在题目之后单独生成
+
+        关键路径只有一次简短的"只出题"调用，且题目与示例回答都逐 token 流式生成：
+        1. 点评（仅当玩家已经回答过）与出题同时发出
+        2. question / type / display_type 在上游输出中一生成完就产出；
+           题目校验通过后开始生成示例回答（校验修正过的字段会以最终值再产出一次）
+        3. 示例回答逐段产出 ("sample_answer_delta", 文本)，生成完毕产出 ("sample_answer", 全文)
+        4. analysis 按到达顺序产出，最后产出 ("done", 完整结果)
         """
-        # 直接调用非流式版本，封装成流式响应
-        # 这样可以复用所有逻辑，同时防止超时
+        result = {"analysis": "", "question": "", "sample_answer": "", "type": "", "display_type": ""}
+        history = conversation_history or []
+        question_keys = ("question", "type", "display_type")
+        sent = {}
+
+        # 子任务的流式片段和最终结果都汇入同一个队列：(来源, 字段名, 值)，字段名为 None 表示该子任务结束
+        events = asyncio.Queue()
+        tasks = {}
+
+        def start(source: str, coro):
+            async def run():
+                try:
+                    value = await coro
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("面试流水线子任务失败 (%s)", source)
+                    value = None
+                events.put_nowait((source, None, value))
+            tasks[source] = asyncio.ensure_future(run())
+
+        def on_question_field(key, value):
+            if key in question_keys and isinstance(value, str) and value.strip():
+                events.put_nowait(("question", key, value.strip()))
+
+        start("question", self._fetch_next_question(
+            player_info, company_info, job_info, round_info, history, on_field=on_question_field))
+        if any(msg.get("role") == "player" for msg in history):
+            start("analysis", self._cached_interview_analysis(round_info, history))
+
         try:
-            result = await self.generate_interview_question(
-                player_info=player_info,
-                company_info=company_info,
-                job_info=job_info,
-                round_info=round_info,
-                conversation_history=conversation_history
-            )
-            # 将结果转为JSON字符串返回
-            yield json.dumps(result, ensure_ascii=False)
-        except Exception as e:
-            print(f"流式生成失败: {e}")
-            # 返回备用问题
-            fallback = {
-                "question": "你为什么想加入我们公司？",
-                "sample_answer": "贵公司的发展前景和企业文化让我非常感兴趣...",
-                "type": "behavioral",
-                "display_type": "求职动机"
-            }
-            yield json.dumps(fallback, ensure_ascii=False)
+            running = len(tasks)
+            while running:
+                source, key, value = await events.get()
+                if key is not None:
+                    if source == "question":
+                        sent[key] = value
+                    yield key, value
+                    continue
+
+                running -= 1
+                if source == "question":
+                    question = value or self._fallback_interview_question()
+                    for field in question_keys:
+                        result[field] = question[field]
+                        if sent.get(field) != question[field]:
+                            yield field, question[field]
+                    if value:
+                        running += 1
+                        start("sample_answer", self._fetch_sample_answer(
+                            player_info, company_info, job_info, round_info, question["question"],
+                            on_delta=lambda text: events.put_nowait(("sample_answer", "sample_answer_delta", text))))
+                    else:
+                        result["sample_answer"] = question["sample_answer"]
+                        yield "sample_answer", result["sample_answer"]
+                elif source == "analysis":
+                    if value and value.get("analysis"):
+                        result["analysis"] = value["analysis"]
+                        yield "analysis", result["analysis"]
+                elif source == "sample_answer":
+                    if not value:
+                        record_fallback("interview_sample_answer")
+                        value = "建议结合自身经历，使用STAR法则（情境、任务、行动、结果）进行结构化回答。"
+                    result["sample_answer"] = value
+                    yield "sample_answer", value
+        finally:
+            # 客户端断开时不再等待剩余的调用
+            for task in tasks.values():
+                task.cancel()
+
+        yield "done", result
+
+    async def _fetch_next_question(
+        self,
+        player_info: dict,
+        company_info: dict,
+        job_info: dict,
+        round_info: dict,
+        conversation_history: List[dict],
+        on_field=None
+    ) -> Optional[dict]:
+        """流水线模式：流式生成题目（不含点评和示例回答），字段每完成一个就回调 on_field，失败返回 None"""
+        messages = self._build_interview_messages(
+            player_info, company_info, job_info, round_info, conversation_history, question_only=True)
+        result = await self.outputs.generate_stream(
+            "interview_next_question",
+            messages,
+            max_tokens=300,
+            temperature=0.9,
+            on_field=on_field or (lambda key, value: None)
+        )
+        if result is None:
+            return None
+        return {
+            "question": result["question"],
+            "type": result["type"],
+            "display_type": result["display_type"] or "面试问题"
+        }
 
-    async def generate_job_listings(self, player_info: dict, count: int = 15) -> List[dict]:
+    async def _fetch_sample_answer(
+        self,
+        player_info: dict,
+        company_info: dict,
+        job_info: dict,
+        round_info: dict,
+        question: str,
+        on_delta=None
+    ) -> Optional[str]:
+        """流水线模式：针对已生成的题目流式写示例回答（纯文本），正文逐段回调 on_delta，失败返回 None"""
+        system_prompt = INTERVIEW_SAMPLE_ANSWER.format(
+            company_name=company_info.get('name', '某公司'),
+            company_type=company_info.get('type', ''),
+            job_title=job_info.get('title', '应聘岗位'),
+            pressure="是" if round_info.get('isPressure') else "否",
+            education=player_info.get('education', '本科'),
+            major=player_info.get('major', '计算机'),
+            experience=player_info.get('experience', 0),
+            skills=', '.join(player_info.get('skills', []))
+        )
+        # 与 NPC 对话共用同一个增量解析器：思考块不下发，正文一到就转发
+        splitter = DialogueTrailerSplitter()
+        async for delta in self.client.stream(
+            endpoint="interview_sample_answer",
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": question}
+            ],
+            max_tokens=500,
+            temperature=0.8
+        ):
+            text = splitter.feed(delta)
+            if text and on_delta:
+                on_delta(text)
+        text = splitter.finish()
+        if text and on_delta:
+            on_delta(text)
+        return splitter.dialogue.strip() or None
+
+    @traced("qwen.generate_job_listings")
+    async def generate_job_listings(
+        self,
+        player_info: dict,
+        count: int = 15,
+        coalesce: bool = True,
+        fallback: bool = True
+    ) -> Optional[List[dict]]:
         """
         生成求职列表
         
         Args:
             player_info: 玩家信息（姓名、学历、经验、技能等）
             count: 生成数量
+            coalesce: 同一简历分桶的并发请求是否合并为一次上游调用
+            fallback: 上游失败时是否改用模拟职位；为 False 时返回 None（后台预生成用，不计入降级指标）
         """
-        system_prompt = f"""你是一个职场模拟游戏的招聘职位生成器。
-        
-【玩家背景】
-- 姓名: {player_info.get('name', '求职者')}
-- 学历: {player_info.get('education', '本科')}
-- 专业: {player_info.get('major', '计算机')}
-- 经验: {player_info.get('experience', 2)}年
-- 技能: {', '.join(player_info.get('skills', ['JavaScript']))}
-
-【生成要求】
-请生成 {count} 个招聘职位信息。
-这些职位应该围绕玩家背景，但也要有一定的随机性和真实感。
-包含：
-1. 知名大厂、中型企业、初创公司、外企、甚至不靠谱的小公司。
-2. 职位不仅限于技术，也可以有管理、销售、甚至一些奇怪的兼职。
-3. 薪资要符合公司类型和要求。
-4. 包含职位描述、任职要求、公司福利。
+        if coalesce:
+            key = ResponseCache.make_key(
+                "job_listings", {"bucket": resume_bucket(player_info), "count": count})
+            jobs = await self.flight.do(key, lambda: self._fetch_job_listings(player_info, count))
+        else:
+            jobs = await self._fetch_job_listings(player_info, count)
+        if jobs or not fallback:
+            return jobs or None
+        return self._mock_job_listings(count)
 
-【返回格式】
-必须返回一个包含 {count} 个对象的 JSON 数组。
-对象格式：
-{{
-    "id": "job_随机ID",
-    "company": {{
-        "name": "公司名称",
-        "type": "large|mid|startup|foreign|small",
-        "industry": "行业",
-        "size": "公司规模",
-        "reputation": 1-5,
-        "difficulty": 1-5,
-        "salaryLevel": 1-5,
-        "description": "公司简介"
-    }},
-    "position": {{
-        "title": "职位名称",
-        "department": "所属部门",
-        "salaryRange": [最低月薪, 最高月薪],
-        "requirements": ["要求1", "要求2", "要求3"],
-        "benefits": ["福利1", "福利2"],
-        "workType": "onsite|remote|hybrid",
-        "experience": "经验要求(如: 1-3年)",
-        "education": "学历要求(如: 本科)",
-        "headcount": 招聘人数,
-        "urgency": "normal|urgent|asap"
-    }}
-}}
+    async def _fetch_job_listings(self, player_info: dict, count: int) -> Optional[List[dict]]:
+        """求职列表的上游调用，失败返回 None"""
+        try:
+            # 截断的列表补全到最后一个完整的职位，不合格的职位逐个丢弃
+            return await self.outputs.generate(
+                "job_listings",
+                self._build_job_listing_messages(player_info, count),
+                max_tokens=4000,
+                temperature=0.8
+            )
+
+        except Exception:
+            logger.exception("Qwen API 错误 (generate_job_listings)")
+            
+        return None
 
-不要输出思考过程，直接输出 JSON 数组。"""
+    async def generate_job_listings_stream(self, player_info: dict, count: int = 15):
+        """
+        流式生成求职列表
 
+        上游输出的 JSON 数组每闭合一个职位对象就立即产出该对象（按 job_listings 的 schema 校验，
+        不合格的逐个丢弃）；一个职位都没生成出来时改用模拟职位
+        """
+        spec = OUTPUT_SPECS["job_listings"]
+        extractor = JsonArrayItemExtractor()
+        sent = 0
         try:
-            response = self.client.chat.completions.create(
+            async for delta in self.client.stream(
+                endpoint="job_listings",
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"请生成 {count} 个招聘职位"}
-                ],
+                messages=self._build_job_listing_messages(player_info, count),
                 max_tokens=4000,
-                temperature=0.8,
-                stream=False
+                temperature=0.8
+            ):
+                for item in extractor.feed(delta):
+                    jobs, errors, _ = validate_output(spec, [item])
+                    if jobs is None:
+                        logger.warning("流式职位校验失败，已丢弃: %s", errors)
+                        continue
+                    if sent < count:
+                        sent += 1
+                        yield jobs[0]
+        except Exception:
+            logger.exception("Qwen API 错误 (generate_job_listings_stream)")
+
+        if sent == 0:
+            for job in self._mock_job_listings(count):
+                yield job
+
+    @traced("prompt.job_listings")
+    def _build_job_listing_messages(self, player_info: dict, count: int) -> List[dict]:
+        """构建求职列表生成的消息列表"""
+        system_prompt = self.prompts.render(
+            "job_listings",
+            (),
+            lambda: JOB_LISTING_PREFIX,
+            JOB_LISTING_CONTEXT.format(
+                name=player_info.get('name', '求职者'),
+                education=player_info.get('education', '本科'),
+                major=player_info.get('major', '计算机'),
+                experience=player_info.get('experience', 2),
+                skills=', '.join(player_info.get('skills', ['JavaScript'])),
+                count=count
             )
+        )
 
-            response_text = response.choices[0].message.content
-            response_text = re.sub(r'<think>.*?</think>', '', response_text, flags=re.DOTALL)
-            
-            # 查找 JSON 数组
-            json_match = re.search(r'\[[\s\S]+\]', response_text)
-            if json_match:
-                return json.loads(json_match.group())
-                
-        except Exception as e:
-            print(f"Qwen API 错误 (generate_job_listings): {e}")
-            
-        return self._mock_job_listings(count)
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"请生成 {count} 个招聘职位"}
+        ]
 
     def _mock_job_listings(self, count: int) -> List[dict]:
         """模拟职位列表"""
+        record_fallback("job_listings")
         import random
         listings = []
         for i in range(count):
@@ -630,8 +791,26 @@ class QwenService:
 
         return info
 
+    @traced("qwen.generate_tasks")
     async def generate_tasks(self, player_info: dict, current_time: str = "09:00") -> dict:
         """生成每日工作任务"""
+        return await self._cached_tasks(player_info, current_time) or self._mock_tasks()
+
+    async def _cached_tasks(self, player_info: dict, current_time: str) -> Optional[dict]:
+        """经过响应缓存的每日任务，失败返回 None"""
+        cache_inputs = {
+            "position": player_info.get('position', '实习生'),
+            "week": bucket(player_info.get('day', 1), 7, default=1),
+            "hour": str(current_time)[:2]
+        }
+        return await self.cache.get_or_fetch(
+            "tasks",
+            cache_inputs,
+            lambda: self._fetch_tasks(player_info, current_time)
+        )
+
+    async def _fetch_tasks(self, player_info: dict, current_time: str) -> Optional[dict]:
+        """每日任务的上游调用，失败返回 None"""
         system_prompt = f"""你是一个职场模拟游戏的任务生成器。
 
 【玩家信息】
@@ -666,31 +845,22 @@ class QwenService:
 不要输出思考过程，直接输出JSON。"""
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            return await self.outputs.generate(
+                "tasks",
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": "请为今天生成工作任务"}
                 ],
                 max_tokens=800,
-                temperature=0.7,
-                stream=False
+                temperature=0.7
             )
 
-            response_text = response.choices[0].message.content
-            # 清理思考标签
-            response_text = re.sub(r'<think>.*?</think>',
-                                   '', response_text, flags=re.DOTALL)
+        except Exception:
+            logger.exception("Qwen API 错误 (generate_tasks)")
 
-            json_match = re.search(r'\{[\s\S]+\}', response_text)
-            if json_match:
-                return json.loads(json_match.group())
-
-        except Exception as e:
-            print(f"Qwen API 错误: {e}")
-
-        return self._mock_tasks()
+        return None
 
+    @traced("qwen.generate_workplace_event")
     async def generate_workplace_event(
         self,
         player_info: dict,
@@ -705,10 +875,94 @@ class QwenService:
             workplace_status: 职场状态
             event_type: 事件类型 (random/politics/bullying/opportunity)
         """
-        system_prompt = f"""你是职场事件生成器。生成一个真实的职场事件。
+        # 相近的职场状态共享缓存，命中时从多个备选事件中随机返回
+        cache_inputs = {
+            "event_type": event_type,
+            "position": player_info.get('position', '实习生'),
+            "kpi": bucket(workplace_status.get('kpi', 60), 20),
+            "stress": bucket(workplace_status.get('stress', 20), 20),
+            "reputation": bucket(workplace_status.get('reputation', 0), 20)
+        }
+        return await self.cache.get_or_fetch(
+            "workplace_event",
+            cache_inputs,
+            lambda: self._fetch_workplace_event(player_info, workplace_status, event_type)
+        )
+
+    async def _fetch_workplace_event(
+        self,
+        player_info: dict,
+        workplace_status: dict,
+        event_type: str
+    ) -> Optional[dict]:
+        """职场事件的上游调用，失败返回 None"""
+        try:
+            return await self.outputs.generate(
+                "workplace_event",
+                [
+                    {"role": "system", "content": self._workplace_event_prompt(player_info, workplace_status, event_type)},
+                    {"role": "user", "content": f"生成一个{event_type}类型的职场事件"}
+                ],
+                max_tokens=600,
+                temperature=0.9
+            )
+
+        except Exception:
+            logger.exception("Qwen API 错误 (generate_workplace_event)")
+
+        return None
+
+    @traced("qwen.generate_workplace_events")
+    async def generate_workplace_events(
+        self,
+        player_info: dict,
+        workplace_status: dict,
+        event_type: str,
+        count: int = 4
+    ) -> List[dict]:
+        """一次生成多个同类型事件（事件牌库后台补充用），失败返回空列表"""
+        try:
+            events = await self.outputs.generate(
+                "workplace_events",
+                [
+                    {"role": "system", "content": self._workplace_event_prompt(player_info, workplace_status, event_type, count)},
+                    {"role": "user", "content": f"请生成 {count} 个{event_type}类型的职场事件"}
+                ],
+                max_tokens=500 * count,
+                temperature=0.9
+            )
+        except Exception:
+            logger.exception("Qwen API 错误 (generate_workplace_events)")
+            return []
+        return events or []
+
+    def _workplace_event_prompt(self, player_info: dict, workplace_status: dict, event_type: str, count: int = 1) -> str:
+        event_format = """{
+    "title": "事件标题",
+    "description": "事件描述",
+    "type": "politics|bullying|opportunity|crisis",
+    "choices": [
+        {
+            "text": "选项文字",
+            "effects": {
+                "kpi": 变化值,
+                "stress": 变化值,
+                "reputation": 变化值,
+                "relationship": {"npc名": 变化值}
+            }
+        }
+    ]
+}"""
+        if count > 1:
+            task = f"生成 {count} 个互不相同的职场事件（标题、情节都不要重复），每个都有选择、要真实、有后果。"
+            output = f"用 JSON 数组格式返回，每个元素：\n{event_format}"
+        else:
+            task = "生成一个有选择的职场事件，要真实、有后果。"
+            output = f"用 JSON 格式返回：\n{event_format}"
+        return f"""你是职场事件生成器。生成真实的职场事件。
 
 【玩家状态】
-- 职位: {player_info.get('position', '实习生')}
+- 职位: {(player_info or {}).get('position', '实习生')}
 - KPI: {workplace_status.get('kpi', 60)}
 - 压力: {workplace_status.get('stress', 20)}
 - 名声: {workplace_status.get('reputation', 0)}
@@ -716,57 +970,86 @@ class QwenService:
 【事件类型】{event_type}
 
 【要求】
-生成一个有选择的职场事件，要真实、有后果。可以是：
+{task}可以是：
 - 办公室政治（站队、拉拢、打小报告）
 - 职场霸凌（抢功、孤立、言语攻击）
 - 机会事件（晋升、加薪、重要项目）
 - 危机事件（背锅、裁员、投诉）
 
+{output}"""
+
+    @traced("qwen.process_player_action")
+    async def process_player_action(
+        self,
+        action: str,
+        player_info: Optional[dict],
+        workplace_status: Optional[dict],
+        visible_objects: List[str],
+        visible_npcs: List[str]
+    ) -> Optional[dict]:
+        """
+        判断本地规则拿不准的玩家行动，返回动画序列、NPC 反应和状态变化
+
+        只引用场景中存在的 NPC；失败返回 None，由调用方使用本地解析结果
+        """
+        system_prompt = f"""你是职场沙盒游戏的行动裁判。玩家用一句话描述想在办公室里做的事，你判断它是否可行并给出结果。
+
+【玩家信息】
+{self._format_player_info(player_info or {}, workplace_status or {})}
+
+【场景】
+- 可见物品: {'、'.join(visible_objects) or '无'}
+- 可见同事: {'、'.join(visible_npcs) or '无'}
+
+【要求】
+1. 只能涉及上面列出的同事；物品可以是随身小物件
+2. 不现实的行动 feasible 为 false，并在 description 里说明原因
+3. 动画 type 只能是 throw/hit/debris/hurt/charge/work/idle/walk/generic，同事反应只能是 hurt/dodge/gather/flee/shock/notice/talk
+4. 状态变化要符合职场常理：过激行为大幅降低心情和关系，工作提升进度但增加压力
+
 用 JSON 格式返回：
 {{
-    "title": "事件标题",
-    "description": "事件描述",
-    "type": "politics|bullying|opportunity|crisis",
-    "choices": [
-        {{
-            "text": "选项文字",
-            "effects": {{
-                "kpi": 变化值,
-                "stress": 变化值,
-                "reputation": 变化值,
-                "relationship": {{"npc名": 变化值}}
-            }}
-        }}
-    ]
-}}"""
+    "feasible": true,
+    "description": "第二人称的行动描述",
+    "animations": [{{"type": "walk", "target": "同事名", "duration": 500}}],
+    "npc_reactions": {{"同事名": "talk"}},
+    "state_changes": {{"mood": 0, "stress": 0, "work_progress": 0, "relationships": {{"同事名": 0}}}},
+    "dialogue": "同事的一句台词，没有则为 null"
+}}
+
+不要输出思考过程，直接输出JSON。"""
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            result = await self.outputs.generate(
+                "player_action",
+                [
                     {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"生成一个{event_type}类型的职场事件"}
+                    {"role": "user", "content": action}
                 ],
-                max_tokens=600,
-                temperature=0.9,
-                stream=False
+                max_tokens=400,
+                temperature=0.7
             )
-
-            response_text = response.choices[0].message.content
-            response_text = re.sub(r'<think>.*?</think>',
-                                   '', response_text, flags=re.DOTALL)
-
-            json_match = re.search(r'\{[\s\S]+\}', response_text)
-            if json_match:
-                return json.loads(json_match.group())
-
-        except Exception as e:
-            print(f"Qwen API 错误: {e}")
-
-        return None
+        except Exception:
+            logger.exception("Qwen API 错误 (process_player_action)")
+            return None
+        if result is None:
+            return None
+
+        # 去掉模型臆造的同事，避免前端找不到对应角色
+        visible = set(visible_npcs)
+        result["npc_reactions"] = {name: r for name, r in result["npc_reactions"].items() if name in visible}
+        result["animations"] = [
+            {key: value for key, value in animation.items() if value is not None}
+            for animation in result["animations"]
+            if not animation.get("target") or animation["target"] in visible or animation["target"] in visible_objects
+        ]
+        relationships = result["state_changes"].get("relationships", {})
+        result["state_changes"]["relationships"] = {name: v for name, v in relationships.items() if name in visible}
+        return result
 
     def _mock_npc_response(self, npc_name: str, player_info: dict = None, workplace_status: dict = None) -> dict:
         """模拟 NPC 响应（API 不可用时使用）"""
+        record_fallback("npc_chat")
         import random
 
         # 根据职场状态调整响应
@@ -810,6 +1093,7 @@ class QwenService:
 
     def _mock_tasks(self) -> dict:
         """模拟任务生成"""
+        record_fallback("tasks")
         import random
 
         return {
@@ -0,0 +1,148 @@
+"""
+大模型响应缓存
+LRU + TTL，过期后在一段宽限期内先返回旧结果并在后台刷新（stale-while-revalidate）
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import random
+import time
+
+from single_flight import SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+
+def bucket(value, step: int, default: int = 0) -> int:
+    """把连续数值归入宽度为 step 的区间，用于生成缓存键"""
+    try:
+        return int(float(value) // step)
+    except (TypeError, ValueError):
+        return int(default // step)
+
+
+@dataclass
+class CachePolicy:
+    """单个接口的缓存策略"""
+    ttl: float             # 新鲜期（秒）
+    stale_ttl: float = 0   # 过期后仍可返回旧结果的宽限期（秒）
+    variants: int = 1      # 每个键保留的不同结果数，命中时随机返回其一以保持内容多样
+
+
+@dataclass
+class _Entry:
+    variants: List[Tuple[float, object]] = field(default_factory=list)  # (写入时间, 结果)，按写入顺序
+    refreshing: bool = False
+
+
+class ResponseCache:
+    """
+    按接口划分策略的响应缓存
+
+    - 键由接口名 + 归一化后的 prompt 输入哈希得到
+    - 全局条目数上限，超出时按 LRU 淘汰
+    - fetch 返回 None 表示上游失败，不写入缓存
+    - 同一键的并发未命中通过 SingleFlight 合并为一次上游调用
+    """
+
+    def __init__(self, max_entries: int = 512, flight: SingleFlight = None):
+        self.max_entries = max_entries
+        self.flight = flight or SingleFlight()
+        self.policies: Dict[str, CachePolicy] = {}
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._tasks = set()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def configure(self, endpoint: str, ttl: float, stale_ttl: float = 0, variants: int = 1):
+        self.policies[endpoint] = CachePolicy(ttl=ttl, stale_ttl=stale_ttl, variants=variants)
+        self.counters[endpoint] = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+
+    @staticmethod
+    def make_key(endpoint: str, inputs: dict) -> str:
+        raw = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+        return f"{endpoint}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    async def get_or_fetch(
+        self,
+        endpoint: str,
+        inputs: dict,
+        fetch: Callable[[], Awaitable[Optional[object]]]
+    ) -> Optional[object]:
+        """命中则返回缓存结果，否则调用 fetch 并写入缓存"""
+        policy = self.policies[endpoint]
+        counters = self.counters[endpoint]
+        key = self.make_key(endpoint, inputs)
+
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            self._entries.move_to_end(key)
+            # 每个结果单独计算新鲜度：超过宽限期的丢弃，其余的各自判断是否过期
+            entry.variants = [v for v in entry.variants if now - v[0] < policy.ttl + policy.stale_ttl]
+            if len(entry.variants) >= policy.variants:
+                fetched_at, value = random.choice(entry.variants)
+                if now - fetched_at < policy.ttl:
+                    counters["hits"] += 1
+                else:
+                    counters["stale_hits"] += 1
+                # 最旧的结果过期了就在后台刷新，刷新结果替换掉它
+                if now - entry.variants[0][0] >= policy.ttl:
+                    self._revalidate(endpoint, key, entry, fetch)
+                return copy.deepcopy(value)
+
+        counters["misses"] += 1
+        return await self.flight.do(key, lambda: self._fetch_and_store(key, policy, fetch))
+
+    async def _fetch_and_store(self, key: str, policy: CachePolicy, fetch):
+        value = await fetch()
+        if value is not None:
+            self._store(key, policy, value)
+        return value
+
+    def _store(self, key: str, policy: CachePolicy, value):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        entry.variants.append((time.monotonic(), copy.deepcopy(value)))
+        del entry.variants[:-policy.variants]
+
+    def _revalidate(self, endpoint: str, key: str, entry: _Entry, fetch):
+        """后台刷新一个结果，替换掉最旧的那个"""
+        if entry.refreshing:
+            return
+        entry.refreshing = True
+
+        async def refresh():
+            try:
+                value = await self.flight.do(
+                    key, lambda: self._fetch_and_store(key, self.policies[endpoint], fetch))
+                if value is not None:
+                    self.counters[endpoint]["refreshes"] += 1
+            except Exception:
+                logger.exception("缓存后台刷新失败 (%s)", endpoint)
+            finally:
+                entry.refreshing = False
+
+        task = asyncio.create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        """各接口的命中统计"""
+        result = {"entries": len(self._entries), "endpoints": {}}
+        for endpoint, counters in self.counters.items():
+            total = counters["hits"] + counters["stale_hits"] + counters["misses"]
+            result["endpoints"][endpoint] = {
+                **counters,
+                "hit_rate": round((counters["hits"] + counters["stale_hits"]) / total, 3) if total else 0.0
+            }
+        return result
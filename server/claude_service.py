@@ -3,11 +3,19 @@ Claude API 服务
 负责与 Anthropic Claude API 交互，提供 AI 对话和任务生成功能
 """
 
+import logging
 import os
-from typing import List, Optional
-from anthropic import Anthropic
+from typing import List, Optional, Tuple
+from anthropic import AsyncAnthropic
 from dotenv import load_dotenv
 
+from conversation_window import ConversationWindow
+from llm_parser import DialogueTrailerSplitter, extract_json
+from structured_output import OUTPUT_SPECS, validate_output
+
+
+logger = logging.getLogger(__name__)
+
 # 加载环境变量
 load_dotenv()
 
@@ -18,13 +26,17 @@ class ClaudeService:
     def __init__(self):
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
-            print("警告: ANTHROPIC_API_KEY 未设置，AI 功能将使用模拟响应")
+            logger.warning("ANTHROPIC_API_KEY 未设置，AI 功能将使用模拟响应")
             self.client = None
         else:
-            self.client = Anthropic(api_key=api_key)
+            # 异步客户端，不阻塞事件循环
+            self.client = AsyncAnthropic(api_key=api_key, max_retries=1)
 
         self.model = "claude-3-5-sonnet-20241022"  # 使用最新的 Claude 模型
 
+        # 对话历史按 token 预算截取，更早的轮次折叠为本地摘要
+        self.history_window = ConversationWindow(1200)
+
     def is_available(self) -> bool:
         """检查 Claude API 是否可用"""
         return self.client is not None
@@ -53,6 +65,25 @@ class ClaudeService:
         if not self.client:
             return self._mock_npc_response(npc_name)
 
+        system_prompt, messages = self._build_npc_prompt(
+            npc_name, npc_profile, player_message, conversation_history, player_info)
+        try:
+            reply = await self._fetch_npc_reply(system_prompt, messages)
+            if reply:
+                return reply
+        except Exception:
+            logger.exception("Claude API 错误 (chat_with_npc)")
+        return self._mock_npc_response(npc_name)
+
+    def _build_npc_prompt(
+        self,
+        npc_name: str,
+        npc_profile: dict,
+        player_message: str,
+        conversation_history: List[dict] = None,
+        player_info: dict = None
+    ) -> Tuple[str, List[dict]]:
+        """构建 NPC 对话的 system prompt 和消息列表"""
         # 构建系统提示
         system_prompt = f"""你是一个职场模拟游戏中的 NPC，名叫"{npc_name}"。
 
@@ -78,51 +109,45 @@ class ClaudeService:
         # 构建消息列表
         messages = []
         if conversation_history:
-            for msg in conversation_history[-10:]:  # 只保留最近10条
+            recent, summary = self.history_window.build(
+                f"npc|{npc_name}|{(player_info or {}).get('name', '')}", conversation_history)
+            if summary:
+                system_prompt += f"\n【更早的对话摘要】\n{summary}\n"
+            for msg in recent:
                 messages.append({
                     "role": "user" if msg.get("role") == "player" else "assistant",
                     "content": msg.get("content", "")
                 })
 
         messages.append({"role": "user", "content": player_message})
-
+        return system_prompt, messages
+
+    async def _fetch_npc_reply(self, system_prompt: str, messages: List[dict]) -> Optional[dict]:
+        """NPC 对话的上游调用，上游异常照常抛出，空回复返回 None"""
+        response = await self.client.messages.create(
+            model=self.model,
+            max_tokens=500,
+            system=system_prompt,
+            messages=messages
+        )
+
+        # 解析情绪和关系变化（与 Qwen 共用同一个解析器）
+        splitter = DialogueTrailerSplitter()
+        splitter.feed(response.content[0].text)
+        splitter.finish()
+        if not splitter.dialogue.strip():
+            return None
+
+        meta = splitter.meta or {}
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=500,
-                system=system_prompt,
-                messages=messages
-            )
-
-            response_text = response.content[0].text
-
-            # 解析情绪和关系变化
-            emotion = "neutral"
+            relationship_change = int(meta.get("relationship_change", 0))
+        except (TypeError, ValueError):
             relationship_change = 0
-
-            import json
-            import re
-            json_match = re.search(r'\{[^}]+\}', response_text)
-            if json_match:
-                try:
-                    meta = json.loads(json_match.group())
-                    emotion = meta.get("emotion", "neutral")
-                    relationship_change = meta.get("relationship_change", 0)
-                    # 移除 JSON 部分
-                    response_text = response_text.replace(
-                        json_match.group(), "").strip()
-                except:
-                    pass
-
-            return {
-                "npc_response": response_text,
-                "emotion": emotion,
-                "relationship_change": relationship_change
-            }
-
-        except Exception as e:
-            print(f"Claude API 错误: {e}")
-            return self._mock_npc_response(npc_name)
+        return {
+            "npc_response": splitter.dialogue.strip(),
+            "emotion": meta.get("emotion", "neutral"),
+            "relationship_change": relationship_change
+        }
 
     async def generate_tasks(self, player_info: dict, current_time: str = "09:00") -> dict:
         """
@@ -138,6 +163,10 @@ class ClaudeService:
         if not self.client:
             return self._mock_tasks()
 
+        return await self._fetch_tasks(player_info, current_time) or self._mock_tasks()
+
+    async def _fetch_tasks(self, player_info: dict, current_time: str) -> Optional[dict]:
+        """每日任务的上游调用，失败返回 None"""
         system_prompt = f"""你是一个职场模拟游戏的任务生成器。
 
 【玩家信息】
@@ -170,24 +199,20 @@ class ClaudeService:
 """
 
         try:
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model=self.model,
                 max_tokens=1000,
                 system=system_prompt,
                 messages=[{"role": "user", "content": "请为今天生成工作任务"}]
             )
+            # 与 Qwen 使用同一套任务 schema，两个后端的结果结构一致
+            value, _ = extract_json(response.content[0].text, "any")
+            return validate_output(OUTPUT_SPECS["tasks"], value)[0]
 
-            import json
-            import re
-            response_text = response.content[0].text
-            json_match = re.search(r'\{[\s\S]+\}', response_text)
-            if json_match:
-                return json.loads(json_match.group())
-
-        except Exception as e:
-            print(f"Claude API 错误: {e}")
+        except Exception:
+            logger.exception("Claude API 错误 (generate_tasks)")
 
-        return self._mock_tasks()
+        return None
 
     def _mock_npc_response(self, npc_name: str) -> dict:
         """模拟 NPC 响应（API 不可用时使用）"""
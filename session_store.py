@@ -0,0 +1,151 @@
+"""
+服务端会话存储
+客户端只需上传会话 id + 本轮新增内容，对话历史和玩家状态保存在服务端
+"""
+
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+import os
+import time
+import uuid
+
+
+def _text_size(value) -> int:
+    """粗略估算占用字节数（按 UTF-8 长度计）"""
+    return len(str(value).encode("utf-8"))
+
+
+class Session:
+    """单个玩家会话：玩家状态 + 按对话线程划分的历史"""
+
+    __slots__ = ("id", "player_info", "workplace_status", "context", "threads", "last_seen", "size")
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.player_info: dict = {}
+        self.workplace_status: dict = {}
+        self.context: Dict[str, dict] = {}  # 例如面试的公司 / 职位 / 轮次信息
+        self.threads: Dict[str, Deque[Tuple[str, str]]] = {}
+        self.last_seen = time.monotonic()
+        self.size = 0
+
+    def history(self, thread: str) -> List[dict]:
+        """以接口原有的 conversation_history 格式返回某个线程的历史"""
+        return [{"role": role, "content": content} for role, content in self.threads.get(thread, ())]
+
+
+class SessionStore:
+    """
+    有界会话存储
+
+    - 每个线程最多保留 max_turns 条消息（更早的内容已由 ConversationWindow 折叠为摘要）
+    - 会话数超过 max_sessions 或总占用超过 max_bytes 时按 LRU 淘汰
+    - 空闲超过 idle_ttl 秒的会话在访问时清理
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = None,
+        idle_ttl: float = None,
+        max_bytes: int = None,
+        max_turns: int = 40
+    ):
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX", "2000"))
+        self.idle_ttl = idle_ttl or float(os.getenv("SESSION_IDLE_TTL", "1800"))
+        self.max_bytes = max_bytes or int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.max_turns = max_turns
+
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.total_bytes = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def create(self, player_info: dict = None, workplace_status: dict = None) -> Session:
+        session = Session(uuid.uuid4().hex)
+        self._sessions[session.id] = session
+        self.update(session, player_info=player_info, workplace_status=workplace_status)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """取会话并刷新其活跃时间；不存在或已过期时返回 None"""
+        self._expire_idle()
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_seen = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.total_bytes -= session.size
+        return True
+
+    def update(
+        self,
+        session: Session,
+        player_info: dict = None,
+        workplace_status: dict = None,
+        context: Dict[str, dict] = None
+    ):
+        """合并状态增量（只覆盖传入的字段）"""
+        if player_info:
+            session.player_info.update(player_info)
+        if workplace_status:
+            session.workplace_status.update(workplace_status)
+        for name, value in (context or {}).items():
+            if value is not None:
+                session.context[name] = value
+        self._resize(session)
+
+    def append(self, session: Session, thread: str, role: str, content: str):
+        """向线程追加一条消息"""
+        turns = session.threads.get(thread)
+        if turns is None:
+            turns = session.threads[thread] = deque(maxlen=self.max_turns)
+        turns.append((role, str(content or "")))
+        self._resize(session)
+
+    def clear(self, session: Session, thread: str):
+        """清空某个线程的历史"""
+        if session.threads.pop(thread, None) is not None:
+            self._resize(session)
+
+    def _resize(self, session: Session):
+        if self._sessions.get(session.id) is not session:
+            return  # 请求处理期间会话已被淘汰
+        size = _text_size(session.player_info) + _text_size(session.workplace_status) + _text_size(session.context)
+        for thread, turns in session.threads.items():
+            size += len(thread) + sum(_text_size(content) + len(role) for role, content in turns)
+        self.total_bytes += size - session.size
+        session.size = size
+        self._evict()
+
+    def _evict(self):
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self.total_bytes > self.max_bytes
+        ):
+            _, session = self._sessions.popitem(last=False)
+            self.total_bytes -= session.size
+            self.evicted += 1
+
+    def _expire_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        # OrderedDict 按最近访问排序，最旧的在前
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_seen >= deadline:
+                break
+            self._sessions.popitem(last=False)
+            self.total_bytes -= session.size
+            self.expired += 1
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.total_bytes,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
@@ -0,0 +1,54 @@
+"""
+同键请求合并（single-flight）
+同一时刻相同 prompt 键的多个调用只发起一次上游请求，其余调用等待同一个结果
+"""
+
+from typing import Awaitable, Callable, Dict
+import asyncio
+import copy
+
+
+class SingleFlight:
+    """
+    按键合并并发调用
+
+    上游调用运行在独立的 Task 中，调用方通过 asyncio.shield 等待：
+    某个客户端断开（调用方被取消）不会取消共享的上游请求，其余调用方照常拿到结果。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0    # 实际发起的上游调用次数
+        self.coalesced = 0  # 被合并、直接复用在途结果的调用次数
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[object]]):
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            return await asyncio.shield(task)
+
+        self.coalesced += 1
+        result = await asyncio.shield(task)
+        # 跟随者拿到独立副本，避免调用方之间互相修改同一个对象
+        return copy.deepcopy(result)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有调用方都已取消时，标记异常已读取，避免 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,471 @@
+"""
+本地替身大模型服务
+OpenAI 兼容的 /v1/chat/completions（流式 / 非流式），按 prompt 类型返回符合各接口 schema 的内容，
+首 token 延迟、出字速度、错误率、挂起率、JSON 损坏率均可配置，运行中也可以切换
+
+用法：
+    python stand_in_llm.py --port 8900 --profile slow
+    QWEN_BASE_URL=http://127.0.0.1:8900/v1 MODELSCOPE_API_KEY=stand-in python app.py
+
+运行中切换配置（例如压测中途模拟上游变慢）：
+    curl -X PUT localhost:8900/admin/profile -d '{"preset": "flaky"}'
+    curl -X PUT localhost:8900/admin/profile -d '{"ttft_ms": 3000, "malformed_rate": 0.2}'
+"""
+
+from dataclasses import asdict, dataclass, fields, replace
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+import uvicorn
+
+from conversation_window import estimate_tokens, truncate_to_tokens
+
+
+# ========== 延迟与故障配置 ==========
+
+@dataclass
+class StandInProfile:
+    """替身服务的延迟与故障配置（比例均为 0~1 的概率）"""
+    ttft_ms: float = 300          # 首 token 延迟的中位数（毫秒）
+    ttft_sigma: float = 0.3       # 首 token 延迟的对数正态分布 sigma，越大长尾越重
+    tokens_per_sec: float = 60    # 出字速度（0 表示瞬间输出）
+    error_rate: float = 0.0       # 返回 500
+    rate_limit_rate: float = 0.0  # 返回 429
+    stall_rate: float = 0.0       # 挂起 stall_seconds 后才开始响应（模拟上游卡死）
+    stall_seconds: float = 120
+    disconnect_rate: float = 0.0  # 流式输出到一半断开连接
+    malformed_rate: float = 0.0   # JSON 损坏：截断 / 夹带说明文字 / 缺少必填字段
+    think_rate: float = 0.0       # 输出前带一段 <think> 思考过程
+
+    def sample_ttft(self) -> float:
+        """抽样一次首 token 延迟（秒）"""
+        if self.ttft_ms <= 0:
+            return 0.0
+        return self.ttft_ms / 1000 * math.exp(random.gauss(0, self.ttft_sigma))
+
+
+PROFILES: Dict[str, StandInProfile] = {
+    "instant": StandInProfile(ttft_ms=0, ttft_sigma=0, tokens_per_sec=0),
+    "fast": StandInProfile(ttft_ms=150, ttft_sigma=0.2, tokens_per_sec=120),
+    "normal": StandInProfile(),
+    "slow": StandInProfile(ttft_ms=2000, ttft_sigma=0.5, tokens_per_sec=20),
+    "flaky": StandInProfile(
+        ttft_ms=400, ttft_sigma=0.8, tokens_per_sec=40,
+        error_rate=0.1, rate_limit_rate=0.05, stall_rate=0.02, stall_seconds=60,
+        disconnect_rate=0.05, malformed_rate=0.15, think_rate=0.2
+    ),
+    "broken": StandInProfile(ttft_ms=100, error_rate=1.0),
+}
+
+
+# ========== 按 prompt 类型生成内容 ==========
+
+_NPC_LINES = [
+    "这事我劝你别掺和，上次老王就是这么被拉下水的。",
+    "行吧，材料你先放我这儿，下午开会前我过一遍。",
+    "你最近KPI挺好看的嘛，不过别高兴太早，季度末才见真章。",
+    "我手头也一堆事呢，这个你得找你们组长。",
+    "听说上面要调整架构了，你自己多留个心眼。",
+]
+_EMOTIONS = ["happy", "neutral", "angry", "sad", "surprised", "contempt", "jealous"]
+
+_QUESTIONS = [
+    ("讲一个你推动跨部门协作的例子，阻力最大的地方是什么？", "跨部门协作", "behavioral"),
+    ("如果线上服务凌晨大面积超时，你排查的前三步是什么？", "故障排查", "technical"),
+    ("你上一份工作为什么离职？说实话。", "离职原因", "personal"),
+    ("你觉得你的简历里哪一段最水？", "压力测试", "stress"),
+]
+_ANALYSES = [
+    "回答有条理，但数据支撑不够，像是背过的模板。",
+    "例子选得不错，可惜没说清楚你个人的贡献。",
+    "有点答非所问，面试官显然不太满意。",
+]
+_TASK_TITLES = [
+    ("整理季度汇报PPT", "document"), ("和产品对需求评审", "meeting"),
+    ("回复客户投诉邮件", "communication"), ("线上故障紧急处理", "emergency"),
+    ("帮领导订周末的餐厅", "communication"),
+]
+_COMPANIES = [
+    ("字节跳动", "big", "互联网"), ("某国有银行", "state", "金融"),
+    ("星火科技", "startup", "人工智能"), ("华信咨询", "foreign", "咨询"),
+    ("蓝海电商", "mid", "电商"),
+]
+_POSITIONS = ["后端开发工程师", "产品经理", "数据分析师", "运营专员", "前端开发工程师"]
+
+
+def _npc_chat(params: dict) -> Tuple[str, Optional[dict]]:
+    meta = {"emotion": random.choice(_EMOTIONS), "relationship_change": random.randint(-5, 5)}
+    return random.choice(_NPC_LINES), meta
+
+
+def _interview_question(params: dict) -> Tuple[str, Optional[dict]]:
+    question, display, qtype = random.choice(_QUESTIONS)
+    return "", {
+        "analysis": random.choice(_ANALYSES),
+        "question": question,
+        "sample_answer": "按STAR法则：先交代背景和目标，再讲自己的具体行动，最后用数据说明结果。",
+        "type": qtype,
+        "display_type": display,
+    }
+
+
+def _next_question(params: dict) -> Tuple[str, Optional[dict]]:
+    question, display, qtype = random.choice(_QUESTIONS)
+    return "", {"question": question, "type": qtype, "display_type": display}
+
+
+def _interview_analyze(params: dict) -> Tuple[str, Optional[dict]]:
+    return "", {"analysis": random.choice(_ANALYSES)}
+
+
+def _tasks(params: dict) -> Tuple[str, Optional[dict]]:
+    picked = random.sample(_TASK_TITLES, random.randint(3, 5))
+    return "", {
+        "daily_message": "又是元气满满的一天，毕竟工资不会自己涨。",
+        "tasks": [
+            {
+                "id": f"task_{i + 1:03d}",
+                "title": title,
+                "description": f"{title}，今天下班前给到结果。",
+                "difficulty": random.choice(["easy", "medium", "hard"]),
+                "reward": random.choice([50, 100, 200, 300]),
+                "deadline": random.choice(["12:00", "15:00", "18:00"]),
+                "type": task_type,
+            }
+            for i, (title, task_type) in enumerate(picked)
+        ],
+    }
+
+
+_EVENT_TITLES = ["周会上的功劳", "临时加派的需求", "被抄送的投诉", "空降的新领导", "团建费用之争", "半夜的告警", "年终评级"]
+
+
+def _one_event(title: str) -> dict:
+    return {
+        "title": title,
+        "description": f"{title}：你熬夜做的方案被同事在周会上说成是他的主意，领导当场表扬了他。",
+        "type": random.choice(["politics", "bullying", "opportunity", "crisis"]),
+        "choices": [
+            {"text": "会后私下找领导说明情况", "effects": {"kpi": 5, "stress": 10, "reputation": 3, "relationship": {"李同事": -10}}},
+            {"text": "当场补充方案细节", "effects": {"kpi": 3, "stress": 5, "reputation": 5, "relationship": {"李同事": -15}}},
+            {"text": "算了，忍一忍", "effects": {"kpi": 0, "stress": 15, "reputation": -3, "relationship": {}}},
+        ],
+    }
+
+
+def _workplace_event(params: dict) -> Tuple[str, Optional[object]]:
+    if "count" in params:
+        titles = [f"{random.choice(_EVENT_TITLES)}（{uuid.uuid4().hex[:4]}）" for _ in range(params["count"])]
+        return "", [_one_event(title) for title in titles]
+    return "", _one_event(random.choice(_EVENT_TITLES))
+
+
+def _player_action(params: dict) -> Tuple[str, Optional[dict]]:
+    npcs = re.findall(r"可见同事: (.*)", params["system"])
+    npcs = [name for name in (npcs[0].split("、") if npcs else []) if name and name != "无"]
+    target = random.choice(npcs) if npcs else None
+    return "", {
+        "feasible": True,
+        "description": f"你{params['user']}，周围的人都愣了一下。",
+        "animations": [{"type": "walk", "target": target, "duration": 500}] if target else [{"type": "generic", "duration": 1000}],
+        "npc_reactions": {target: "shock"} if target else {},
+        "state_changes": {"mood": 5, "stress": -5, "work_progress": 0, "relationships": {target: -2} if target else {}},
+        "dialogue": f"{target}：你这是在干嘛？" if target else None,
+    }
+
+
+def _job_listings(params: dict) -> Tuple[str, Optional[list]]:
+    jobs = []
+    for i in range(params.get("count", 3)):
+        name, company_type, industry = random.choice(_COMPANIES)
+        low = random.choice([8, 10, 15, 20, 25]) * 1000
+        jobs.append({
+            "id": f"job_{uuid.uuid4().hex[:8]}",
+            "company": {
+                "name": name, "type": company_type, "industry": industry, "size": "1000-5000人",
+                "reputation": random.randint(1, 5), "difficulty": random.randint(1, 5),
+                "salaryLevel": random.randint(1, 5), "description": f"{industry}行业的{name}",
+            },
+            "position": {
+                "title": random.choice(_POSITIONS), "department": "业务部",
+                "salaryRange": [low, low * 2], "requirements": ["本科及以上", "沟通能力强"],
+                "benefits": ["五险一金", "年终奖"], "workType": "onsite", "experience": "1-3年",
+                "education": "本科", "headcount": random.randint(1, 5),
+                "urgency": random.choice(["normal", "urgent"]),
+            },
+        })
+    return "", jobs
+
+
+def _sample_answer(params: dict) -> Tuple[str, Optional[dict]]:
+    return "在上家公司的双11大促前，我负责把订单服务的接口从同步改成消息队列异步处理，压测QPS从800提升到3000，大促当天零故障。这件事让我意识到提前做容量评估的重要性。", None
+
+
+def _summary(params: dict) -> Tuple[str, Optional[dict]]:
+    return "玩家与对方聊了工作安排和部门传闻，对方态度一般，提醒玩家注意站队。", None
+
+
+def _plain(params: dict) -> Tuple[str, Optional[dict]]:
+    return "好的。", None
+
+
+# (类型, 识别规则, 内容生成)，按顺序匹配第一条；重问的 system prompt 里带着格式说明，优先识别
+PROMPT_RULES: List[Tuple[str, Callable[[str, str], bool], Callable[[dict], tuple]]] = [
+    ("summary", lambda system, user: "合并成一段不超过120字" in system + user, _summary),
+    ("job_listings", lambda system, user: "招聘职位生成器" in system or '"salaryRange"' in system, _job_listings),
+    ("tasks", lambda system, user: "任务生成器" in system or '"daily_message"' in system, _tasks),
+    ("workplace_event", lambda system, user: "职场事件生成器" in system or '"choices"' in system, _workplace_event),
+    ("player_action", lambda system, user: "行动裁判" in system or '"animations"' in system, _player_action),
+    ("sample_answer", lambda system, user: "求职辅导" in system, _sample_answer),
+    ("interview_next_question", lambda system, user: "只输出问题本身" in system, _next_question),
+    ("interview_analyze", lambda system, user: "只需点评" in system + user or (system.startswith("把用户给出的内容修正为") and '"question"' not in system), _interview_analyze),
+    ("interview_question", lambda system, user: "面试官" in system or '"question"' in system, _interview_question),
+    ("npc_chat", lambda system, user: "NPC" in system, _npc_chat),
+    ("text", lambda system, user: True, _plain),
+]
+
+_COUNT = re.compile(r'请生成\s*(\d+)\s*个')
+
+
+def classify(messages: List[dict]) -> Tuple[str, dict, Callable[[dict], tuple]]:
+    """根据 system / user 消息识别请求对应的接口类型"""
+    system = "\n".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    user = next((str(m.get("content", "")) for m in reversed(messages) if m.get("role") == "user"), "")
+    params = {"system": system, "user": user}
+    count = _COUNT.search(user)
+    if count:
+        params["count"] = min(int(count.group(1)), 20)
+    for kind, match, generate in PROMPT_RULES:
+        if match(system, user):
+            return kind, params, generate
+    return "text", params, _plain
+
+
+def _break_json(value) -> str:
+    """生成一份损坏的 JSON 文本，覆盖解析器需要处理的几类常见问题"""
+    mode = random.choice(["truncate", "prose", "missing"])
+    if mode == "missing":
+        target = value[0] if isinstance(value, list) and value else value
+        if isinstance(target, dict) and target:
+            target = dict(target)
+            target.pop(random.choice(list(target)))
+            value = [target] + value[1:] if isinstance(value, list) else target
+        return json.dumps(value, ensure_ascii=False)
+    text = json.dumps(value, ensure_ascii=False, indent=2)
+    if mode == "truncate":
+        return text[:max(1, int(len(text) * random.uniform(0.4, 0.9)))]
+    return f"好的，下面是生成结果（{{已按要求}}）：\n```json\n{text}\n```\n以上内容如需调整请告诉我。"
+
+
+def render_reply(messages: List[dict], profile: StandInProfile) -> Tuple[str, str]:
+    """返回 (接口类型, 回复文本)"""
+    kind, params, generate = classify(messages)
+    dialogue, value = generate(params)
+    malformed = random.random() < profile.malformed_rate
+
+    if kind == "npc_chat":
+        trailer = json.dumps(value, ensure_ascii=False)
+        if malformed:
+            trailer = random.choice(["", trailer[:len(trailer) // 2]])
+        text = f"{dialogue}\n{trailer}".rstrip()
+    elif value is not None:
+        text = _break_json(value) if malformed else json.dumps(value, ensure_ascii=False)
+    else:
+        text = dialogue
+
+    if random.random() < profile.think_rate:
+        text = f"<think>先确认一下输出格式，再组织内容。</think>\n{text}"
+    return kind, text
+
+
+# ========== HTTP 接口 ==========
+
+class StandInStats:
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.faults: Dict[str, int] = {}
+
+    def count(self, table: Dict[str, int], key: str):
+        table[key] = table.get(key, 0) + 1
+
+
+def _error(status: int, message: str, error_type: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"error": {"message": message, "type": error_type}})
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason: str = None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _pieces(text: str, size: int = 2) -> List[str]:
+    """按约 1 个 token 切分流式输出（中文约 1.4 字 / token）"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_app(profile: StandInProfile = None) -> FastAPI:
+    app = FastAPI(title="Stand-in LLM")
+    app.state.profile = profile or StandInProfile()
+    app.state.stats = StandInStats()
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stand-in", "object": "model", "owned_by": "local"}]}
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        profile: StandInProfile = app.state.profile
+        stats: StandInStats = app.state.stats
+        messages = body.get("messages") or []
+        model = body.get("model", "stand-in")
+
+        kind, text = render_reply(messages, profile)
+        stats.count(stats.requests, kind)
+
+        if random.random() < profile.stall_rate:
+            stats.count(stats.faults, "stall")
+            await asyncio.sleep(profile.stall_seconds)
+        roll = random.random()
+        if roll < profile.error_rate:
+            stats.count(stats.faults, "error")
+            return _error(500, "stand-in: 模拟上游内部错误", "server_error")
+        if roll < profile.error_rate + profile.rate_limit_rate:
+            stats.count(stats.faults, "rate_limit")
+            return _error(429, "stand-in: 模拟限流", "rate_limit_exceeded")
+
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            text = truncate_to_tokens(text, max_tokens)
+            finish_reason = "length"
+
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = estimate_tokens(text)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        per_token = 1 / profile.tokens_per_sec if profile.tokens_per_sec > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(profile.sample_ttft() + completion_tokens * per_token)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": finish_reason
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }
+
+        disconnect = random.random() < profile.disconnect_rate
+        if disconnect:
+            stats.count(stats.faults, "disconnect")
+
+        async def events():
+            await asyncio.sleep(profile.sample_ttft())
+            yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+            pieces = _pieces(text)
+            cut = random.randrange(len(pieces)) if disconnect and pieces else None
+            owed = 0.0
+            for index, piece in enumerate(pieces):
+                if index == cut:
+                    # 抛出异常让 uvicorn 直接断开连接，客户端看到的是不完整的流
+                    raise ConnectionResetError("stand-in: 模拟流式输出中途断开")
+                # 累积到 10ms 以上再 sleep，避免高出字速度下 sleep 调用本身成为瓶颈
+                owed += per_token
+                if owed >= 0.01:
+                    await asyncio.sleep(owed)
+                    owed = 0.0
+                yield _chunk(completion_id, model, {"content": piece})
+            yield _chunk(completion_id, model, {}, finish_reason)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/admin/profile")
+    async def get_profile():
+        return asdict(app.state.profile)
+
+    @app.put("/admin/profile")
+    async def update_profile(body: dict):
+        """{"preset": "slow"} 切换到预设；其余字段覆盖当前配置中的对应项"""
+        base = app.state.profile
+        preset = body.pop("preset", None)
+        if preset is not None:
+            if preset not in PROFILES:
+                return _error(400, f"未知的预设: {preset}，可选 {sorted(PROFILES)}", "invalid_request_error")
+            base = PROFILES[preset]
+        known = {f.name for f in fields(StandInProfile)}
+        app.state.profile = replace(base, **{k: float(v) for k, v in body.items() if k in known})
+        return asdict(app.state.profile)
+
+    @app.get("/admin/stats")
+    async def get_stats():
+        stats: StandInStats = app.state.stats
+        return {"requests": stats.requests, "faults": stats.faults}
+
+    return app
+
+
+def start_stand_in(profile: StandInProfile = None, port: int = 0) -> Tuple[uvicorn.Server, str]:
+    """在后台线程启动替身服务，返回 (server, base_url)；压测脚本用"""
+    if not port:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+    config = uvicorn.Config(create_app(profile), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地替身大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--profile", default="normal", choices=sorted(PROFILES))
+    parser.add_argument("--seed", type=int, default=None, help="固定随机种子，便于复现")
+    for f in fields(StandInProfile):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    overrides = {
+        f.name: getattr(args, f.name) for f in fields(StandInProfile)
+        if getattr(args, f.name) is not None
+    }
+    profile = replace(PROFILES[args.profile], **overrides)
+    print(f"替身服务: http://{args.host}:{args.port}/v1  配置: {asdict(profile)}")
+    uvicorn.run(create_app(profile), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""
+结构化输出
+各接口的输出 schema 校验；解析或校验失败时先本地修复，再至多一次简短的定向重问
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple, Type
+import logging
+import os
+import re
+
+from openai import BadRequestError
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+from llm_parser import JsonFieldExtractor, extract_json, strip_think
+from metrics import record_parse_failure
+from tracing import span
+
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+_SALARY = re.compile(r'(\d+(?:\.\d+)?)\s*([kK千万wW]?)')
+_SALARY_UNITS = {"k": 1000, "K": 1000, "千": 1000, "万": 10000, "w": 10000, "W": 10000}
+_JSON_MODE_ERROR = re.compile(r'response_format|json_object|json[ _]mode', re.IGNORECASE)
+
+
+def _to_number(value, default=0):
+    """宽松解析数字：兼容 "+5"、"200元"、"约 3 分" 这类写法"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    match = _NUMBER.search(str(value or ""))
+    if not match:
+        return default
+    number = float(match.group())
+    return int(number) if number.is_integer() else number
+
+
+def _one_of(value, allowed: tuple, default: str) -> str:
+    value = str(value or "").strip().lower()
+    return value if value in allowed else default
+
+
+# ========== 输出 schema ==========
+
+class _Output(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class InterviewQuestion(_Output):
+    analysis: str = ""
+    question: str = Field(min_length=1)
+    sample_answer: str = ""
+    type: str = "behavioral"
+    display_type: str = ""
+
+    @field_validator("type", mode="before")
+    @classmethod
+    def _type(cls, v):
+        return _one_of(v, ("technical", "behavioral", "personal", "stress"), "behavioral")
+
+
+class InterviewAnalysis(_Output):
+    analysis: str = Field(min_length=1)
+
+
+class Task(_Output):
+    id: str = ""
+    title: str = Field(min_length=1)
+    description: str = ""
+    difficulty: str = "medium"
+    reward: int = 0
+    deadline: str = ""
+    type: str = "document"
+
+    @field_validator("difficulty", mode="before")
+    @classmethod
+    def _difficulty(cls, v):
+        return _one_of(v, ("easy", "medium", "hard"), "medium")
+
+    @field_validator("reward", mode="before")
+    @classmethod
+    def _reward(cls, v):
+        return int(_to_number(v))
+
+    @field_validator("id", "deadline", mode="before")
+    @classmethod
+    def _text(cls, v):
+        return "" if v is None else str(v)
+
+
+class TaskList(_Output):
+    daily_message: str = ""
+    tasks: List[Task] = Field(min_length=1)
+
+
+class EventEffects(_Output):
+    kpi: float = 0
+    stress: float = 0
+    reputation: float = 0
+    relationship: Dict[str, float] = {}
+
+    @field_validator("kpi", "stress", "reputation", mode="before")
+    @classmethod
+    def _number(cls, v):
+        return _to_number(v)
+
+    @field_validator("relationship", mode="before")
+    @classmethod
+    def _relationship(cls, v):
+        if not isinstance(v, dict):
+            return {}
+        return {str(name): _to_number(change) for name, change in v.items()}
+
+
+class EventChoice(_Output):
+    text: str = Field(min_length=1)
+    effects: EventEffects = EventEffects()
+
+
+class WorkplaceEvent(_Output):
+    title: str = Field(min_length=1)
+    description: str = Field(min_length=1)
+    type: str = "opportunity"
+    choices: List[EventChoice] = Field(min_length=1)
+
+    @field_validator("type", mode="before")
+    @classmethod
+    def _type(cls, v):
+        return _one_of(v, ("politics", "bullying", "opportunity", "crisis"), "opportunity")
+
+
+class JobCompany(_Output):
+    name: str = Field(min_length=1)
+    type: str = "mid"
+    industry: str = ""
+    size: str = ""
+    reputation: int = 3
+    difficulty: int = 3
+    salaryLevel: int = 3
+    description: str = ""
+
+    @field_validator("reputation", "difficulty", "salaryLevel", mode="before")
+    @classmethod
+    def _level(cls, v):
+        return max(1, min(5, int(_to_number(v, 3))))
+
+
+class JobPosition(_Output):
+    title: str = Field(min_length=1)
+    department: str = ""
+    salaryRange: List[int] = Field(min_length=2, max_length=2)
+    requirements: List[str] = []
+    benefits: List[str] = []
+    workType: str = "onsite"
+    experience: str = ""
+    education: str = ""
+    headcount: int = 1
+    urgency: str = "normal"
+
+    @field_validator("salaryRange", mode="before")
+    @classmethod
+    def _salary(cls, v):
+        if isinstance(v, str):
+            # "10k-20k" / "1.5万-2万" 这类写法
+            v = [float(num) * _SALARY_UNITS.get(unit, 1) for num, unit in _SALARY.findall(v)]
+        if isinstance(v, list):
+            return [int(_to_number(x)) for x in v[:2]]
+        return v
+
+    @field_validator("headcount", mode="before")
+    @classmethod
+    def _headcount(cls, v):
+        return max(1, int(_to_number(v, 1)))
+
+
+class JobListing(_Output):
+    id: str = ""
+    company: JobCompany
+    position: JobPosition
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def _id(cls, v):
+        return "" if v is None else str(v)
+
+
+ANIMATION_TYPES = ("throw", "hit", "debris", "hurt", "charge", "work", "idle", "walk", "generic")
+NPC_REACTIONS = ("hurt", "dodge", "gather", "flee", "shock", "notice", "talk")
+
+
+class ActionAnimation(_Output):
+    type: str = "generic"
+    target: Optional[str] = None
+    object: Optional[str] = None
+    duration: int = 1000
+    delay: int = 0
+
+    @field_validator("type", mode="before")
+    @classmethod
+    def _type(cls, v):
+        return _one_of(v, ANIMATION_TYPES, "generic")
+
+    @field_validator("duration", "delay", mode="before")
+    @classmethod
+    def _ms(cls, v):
+        return max(0, min(5000, int(_to_number(v))))
+
+
+class PlayerAction(_Output):
+    feasible: bool = True
+    description: str = Field(min_length=1)
+    animations: List[ActionAnimation] = []
+    npc_reactions: Dict[str, str] = {}
+    state_changes: Dict[str, object] = {}
+    dialogue: Optional[str] = None
+
+    @field_validator("npc_reactions", mode="before")
+    @classmethod
+    def _reactions(cls, v):
+        if not isinstance(v, dict):
+            return {}
+        return {str(name): _one_of(reaction, NPC_REACTIONS, "shock") for name, reaction in v.items()}
+
+    @field_validator("state_changes", mode="before")
+    @classmethod
+    def _changes(cls, v):
+        if not isinstance(v, dict):
+            return {}
+        changes = {key: _to_number(v.get(key)) for key in ("mood", "stress", "work_progress")}
+        relationships = v.get("relationships")
+        changes["relationships"] = {
+            str(name): _to_number(change) for name, change in relationships.items()
+        } if isinstance(relationships, dict) else {}
+        return changes
+
+
+@dataclass
+class OutputSpec:
+    """单个接口的输出约定"""
+    model: Type[BaseModel]
+    kind: str = "object"   # 顶层是对象还是数组（数组时逐项校验）
+    hint: str = ""         # 重问时给模型的简短格式说明
+    wrap: str = None       # 模型直接返回数组时，包进这个字段（如 {"tasks": [...]}）
+
+
+OUTPUT_SPECS: Dict[str, OutputSpec] = {
+    "interview_question": OutputSpec(
+        InterviewQuestion,
+        hint='{"analysis": str, "question": str, "sample_answer": str, '
+             '"type": "technical|behavioral|personal|stress", "display_type": str}'
+    ),
+    "interview_next_question": OutputSpec(
+        InterviewQuestion,
+        hint='{"question": str, "type": "technical|behavioral|personal|stress", "display_type": str}'
+    ),
+    "interview_analyze": OutputSpec(InterviewAnalysis, hint='{"analysis": str}'),
+    "tasks": OutputSpec(
+        TaskList,
+        hint='{"daily_message": str, "tasks": [{"id": str, "title": str, "description": str, '
+             '"difficulty": "easy|medium|hard", "reward": int, "deadline": str, "type": str}]}',
+        wrap="tasks"
+    ),
+    "workplace_event": OutputSpec(
+        WorkplaceEvent,
+        hint='{"title": str, "description": str, "type": "politics|bullying|opportunity|crisis", '
+             '"choices": [{"text": str, "effects": {"kpi": int, "stress": int, "reputation": int, '
+             '"relationship": {"NPC名": int}}}]}'
+    ),
+    "workplace_events": OutputSpec(
+        WorkplaceEvent,
+        kind="array",
+        hint='[{"title": str, "description": str, "type": "politics|bullying|opportunity|crisis", '
+             '"choices": [{"text": str, "effects": {"kpi": int, "stress": int, "reputation": int, '
+             '"relationship": {"NPC名": int}}}]}]'
+    ),
+    "player_action": OutputSpec(
+        PlayerAction,
+        hint='{"feasible": bool, "description": str, "animations": [{"type": str, "target": str, '
+             '"object": str, "duration": int, "delay": int}], "npc_reactions": {"NPC名": str}, '
+             '"state_changes": {"mood": int, "stress": int, "work_progress": int, '
+             '"relationships": {"NPC名": int}}, "dialogue": str|null}'
+    ),
+    "job_listings": OutputSpec(
+        JobListing,
+        kind="array",
+        hint='[{"id": str, "company": {"name": str, "type": str, "industry": str, "size": str, '
+             '"reputation": 1-5, "difficulty": 1-5, "salaryLevel": 1-5, "description": str}, '
+             '"position": {"title": str, "department": str, "salaryRange": [int, int], '
+             '"requirements": [str], "benefits": [str], "workType": str, "experience": str, '
+             '"education": str, "headcount": int, "urgency": str}}]'
+    ),
+}
+
+
+def _errors(exc: ValidationError, limit: int = 5) -> str:
+    parts = []
+    for err in exc.errors()[:limit]:
+        loc = ".".join(str(p) for p in err["loc"]) or "根"
+        parts.append(f"{loc}: {err['msg']}")
+    return "; ".join(parts)
+
+
+def validate_output(spec: OutputSpec, value) -> Tuple[Optional[object], str, bool]:
+    """
+    按 schema 校验并规范化，返回 (结果, 错误说明, 是否做过本地修复)
+
+    数组逐项校验，丢弃不合格的元素；对象缺少外层包装时自动补上
+    """
+    if value is None:
+        return None, "没有找到可解析的 JSON", False
+
+    if spec.kind == "array":
+        if isinstance(value, dict):
+            # 模型把数组包在了某个字段里
+            value = next((v for v in value.values() if isinstance(v, list)), None)
+            if value is None:
+                return None, "应为 JSON 数组", False
+        items, errors = [], []
+        for index, item in enumerate(value):
+            try:
+                items.append(spec.model.model_validate(item).model_dump())
+            except ValidationError as e:
+                errors.append(f"[{index}] {_errors(e, 2)}")
+        if not items:
+            return None, "; ".join(errors[:3]) or "数组为空", False
+        return items, "", bool(errors)
+
+    repaired = False
+    if isinstance(value, list) and spec.wrap:
+        value = {spec.wrap: value}
+        repaired = True
+    if not isinstance(value, dict):
+        return None, "应为 JSON 对象", False
+    try:
+        return spec.model.model_validate(value).model_dump(), "", repaired
+    except ValidationError as e:
+        return None, _errors(e), False
+
+
+class StructuredOutputs:
+    """
+    带 schema 校验的上游调用
+
+    1. 支持 JSON 模式时以 response_format=json_object 请求（数组输出不适用）
+    2. 本地解析 + 截断补全 + schema 规范化
+    3. 仍不合格时，只把原输出和错误说明发给模型做一次简短的定向修正
+    统计每个接口有多少次完整生成被修复挽回，而不是直接丢弃
+    """
+
+    REASK_INPUT_CHARS = 4000
+
+    def __init__(self, client, model: str, json_mode: bool = None):
+        self.client = client
+        self.model = model
+        if json_mode is None:
+            json_mode = os.getenv("QWEN_JSON_MODE", "1") == "1"
+        self.json_mode = json_mode
+        self.json_unsupported: Set[str] = set()  # 已确认不支持 JSON 模式的模型
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, endpoint: str, outcome: str):
+        counters = self.counters.setdefault(
+            endpoint, {"valid": 0, "repaired": 0, "reasked": 0, "failed": 0})
+        counters[outcome] += 1
+
+    async def generate(
+        self,
+        endpoint: str,
+        messages: List[dict],
+        max_tokens: int,
+        temperature: float
+    ) -> Optional[object]:
+        """调用上游并返回通过校验的结果；彻底失败返回 None（上游异常照常抛出）"""
+        spec = OUTPUT_SPECS[endpoint]
+        text = await self._complete(endpoint, spec, messages, max_tokens, temperature)
+        return await self._finish(endpoint, spec, text, max_tokens)
+
+    async def generate_stream(
+        self,
+        endpoint: str,
+        messages: List[dict],
+        max_tokens: int,
+        temperature: float,
+        on_field: Callable[[str, object], None]
+    ) -> Optional[object]:
+        """
+        流式版 generate：顶层对象的字段每生成完一个就调用 on_field(字段名, 原始值)，
+        输出结束后与 generate 一样校验、修复、必要时重问，返回通过校验的结果
+        """
+        spec = OUTPUT_SPECS[endpoint]
+        extractor = JsonFieldExtractor()
+        parts = []
+        async for delta in self.client.stream(
+            endpoint=endpoint,
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        ):
+            parts.append(delta)
+            for key, value in extractor.feed(delta):
+                on_field(key, value)
+        return await self._finish(endpoint, spec, "".join(parts), max_tokens)
+
+    async def _finish(self, endpoint: str, spec: OutputSpec, text: str, max_tokens: int) -> Optional[object]:
+        value, truncated = self._extract(spec, text)
+        with span("parse.validate"):
+            result, errors, repaired = validate_output(spec, value)
+        if result is not None:
+            self._count(endpoint, "repaired" if truncated or repaired else "valid")
+            return result
+
+        with span("structured.reask", errors=errors[:200]):
+            result = await self._reask(endpoint, spec, text, errors, max_tokens)
+        self._count(endpoint, "reasked" if result is not None else "failed")
+        if result is None:
+            record_parse_failure(endpoint)
+            logger.warning("结构化输出校验失败 (%s): %s", endpoint, errors)
+        return result
+
+    @staticmethod
+    def _extract(spec: OutputSpec, text: str):
+        text = text or ""
+        # <think> 块由 extract_json 在扫描时跳过；可能被直接返回成数组的对象也接受数组，交给 validate_output 包装
+        kind = "any" if spec.wrap else spec.kind
+        with span("parse.extract_json", chars=len(text)) as current:
+            value, truncated = extract_json(text, kind, partial_items=spec.kind != "array")
+            if current is not None:
+                current.set(truncated=truncated, found=value is not None)
+        return value, truncated
+
+    @staticmethod
+    def _rejects_json_mode(exc: BadRequestError) -> bool:
+        """400 是否因为 response_format 不被支持（而不是 prompt 过长、参数越界等其他原因）"""
+        body = exc.body if isinstance(exc.body, dict) else {}
+        error = body.get("error") if isinstance(body.get("error"), dict) else body
+        if error.get("param") == "response_format":
+            return True
+        return bool(_JSON_MODE_ERROR.search(f"{exc.message} {error.get('message', '')}"))
+
+    async def _complete(
+        self,
+        endpoint: str,
+        spec: OutputSpec,
+        messages: List[dict],
+        max_tokens: int,
+        temperature: float
+    ) -> str:
+        kwargs = {"endpoint": endpoint, "max_tokens": max_tokens, "temperature": temperature}
+        if self.json_mode and spec.kind == "object" and self.model not in self.json_unsupported:
+            try:
+                return await self.client.complete(
+                    model=self.model,
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    **kwargs
+                )
+            except BadRequestError as e:
+                if not self._rejects_json_mode(e):
+                    raise
+                # 只对这个模型关闭 JSON 模式，之后按普通文本请求
+                logger.warning("模型 %s 不支持 JSON 模式，已关闭: %s", self.model, e)
+                self.json_unsupported.add(self.model)
+        return await self.client.complete(model=self.model, messages=messages, **kwargs)
+
+    async def _reask(self, endpoint: str, spec: OutputSpec, text: str, errors: str, max_tokens: int) -> Optional[object]:
+        """一次简短的定向重问：只发原输出 + 错误说明 + 格式要求，不重发完整 prompt"""
+        text = strip_think(text or "").strip()
+        if not text:
+            return None
+        messages = [
+            {
+                "role": "system",
+                "content": f"把用户给出的内容修正为符合以下格式的 JSON，保留原有内容，只输出 JSON。\n格式：{spec.hint}"
+            },
+            {
+                "role": "user",
+                "content": f"问题：{errors}\n\n内容：\n{text[:self.REASK_INPUT_CHARS]}"
+            }
+        ]
+        try:
+            fixed = await self._complete(endpoint, spec, messages, max_tokens, temperature=0)
+        except Exception:
+            logger.exception("结构化输出重问失败")
+            return None
+        value, _ = self._extract(spec, fixed)
+        return validate_output(spec, value)[0]
+
+    def stats(self) -> dict:
+        """各接口的校验结果统计；rescued = 本地修复 + 重问挽回的生成次数"""
+        result = {}
+        for endpoint, counters in self.counters.items():
+            result[endpoint] = {**counters, "rescued": counters["repaired"] + counters["reasked"]}
+        return result
@@ -0,0 +1,6 @@
+"""测试从仓库根目录导入各模块（项目是平铺的单文件模块，没有安装成包）"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,119 @@
+"""circuit_breaker 的状态转换"""
+
+import asyncio
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _open(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 1
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record_failure()
+    breaker.allow()
+    breaker.record_success()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.failures == 1
+
+
+def test_rejects_until_cooldown_elapses(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    _open(breaker)
+    clock[0] += 9.9
+    assert not breaker.allow()
+    assert breaker.state == "open"
+    clock[0] += 0.1
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    _open(breaker)
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_half_open_probe_failure_reopens_with_new_cooldown(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    _open(breaker)
+    clock[0] += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+    clock[0] += 5
+    assert not breaker.allow()
+    clock[0] += 5
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_half_open_releases_probe_without_verdict(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    _open(breaker)
+    clock[0] += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_half_open_allows_exactly_one_concurrent_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    _open(breaker)
+    clock[0] += 10
+    rejected_before = breaker.rejected
+
+    async def call():
+        if not breaker.allow():
+            return False
+        await asyncio.sleep(0)  # 让出事件循环：探测请求在途时其他调用方同时到达（时钟已固定，不能真的 sleep）
+        breaker.record_success()
+        return True
+
+    async def run():
+        return await asyncio.gather(*(call() for _ in range(20)))
+
+    results = asyncio.run(run())
+    assert results.count(True) == 1
+    assert breaker.rejected - rejected_before == 19
+    assert breaker.state == "closed"
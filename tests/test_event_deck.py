@@ -0,0 +1,46 @@
+"""event_deck 的抽牌计数与玩家历史"""
+
+from event_deck import EventDeck
+
+STATUS = {"kpi": 50, "stress": 30, "reputation": 50}
+
+
+def _exhaust(deck: EventDeck, player: str) -> list:
+    ids = []
+    while True:
+        event = deck.draw("crisis", STATUS, player=player)
+        if event is None:
+            return ids
+        ids.append(event["id"])
+
+
+def test_live_event_joins_player_history():
+    deck = EventDeck(seed=1, history_size=100)
+    seen = _exhaust(deck, "p1")
+    assert len(seen) == len(set(seen)) > 0
+
+    card_id = deck.add({"title": "临时事件", "description": "d", "type": "crisis", "choices": []}, "crisis", STATUS, player="p1")
+    assert card_id and card_id.startswith("evt_")
+    # 刚发给 p1 的事件不会马上再抽给他，其他玩家可以抽到
+    assert deck.draw("crisis", STATUS, player="p1") is None
+    assert card_id in _exhaust(deck, "p2")
+
+
+def test_duplicate_title_reuses_existing_card():
+    deck = EventDeck(seed=1)
+    event = {"title": "临时事件", "description": "d", "type": "crisis", "choices": []}
+    card_id = deck.add(event, "crisis", STATUS)
+    assert deck.add(event, "crisis", STATUS, player="p1") == card_id
+    assert deck.generated == 1
+    assert card_id in deck._history("p1")
+
+
+def test_fallback_draw_counted_separately():
+    deck = EventDeck(seed=1, history_size=100)
+    seen = _exhaust(deck, "p1")
+    assert (deck.hits, deck.misses, deck.draws) == (len(seen), 1, len(seen) + 1)
+
+    event = deck.draw("crisis", STATUS, player="p1", allow_repeat=True)
+    assert event is not None
+    assert (deck.hits, deck.misses, deck.draws) == (len(seen), 1, len(seen) + 1)
+    assert (deck.fallback_hits, deck.fallback_misses) == (1, 0)
@@ -0,0 +1,55 @@
+"""intent_engine 的本地意图解析"""
+
+import pytest
+
+from intent_engine import IntentEngine
+
+NPCS = ["张经理", "李同事", "王前辈"]
+OBJECTS = ["电脑", "桌子", "水杯", "打印机"]
+
+
+@pytest.fixture
+def engine():
+    return IntentEngine(threshold=0.6)
+
+
+@pytest.mark.parametrize("action", ["投诉李同事", "打开电脑", "打扫桌子", "去投票", "甩锅给李同事"])
+def test_compounds_do_not_trigger_single_char_verbs(engine, action):
+    resolution = engine.resolve(action, OBJECTS, NPCS)
+    assert resolution.intent not in ("throw", "attack")
+    assert not resolution.confident
+
+
+@pytest.mark.parametrize("action", ["做个鬼脸", "做鬼脸", "打一下", "投一个", "扔杯子"])
+def test_bare_single_char_verb_escalates(engine, action):
+    resolution = engine.resolve(action, OBJECTS, NPCS)
+    assert resolution.confidence < engine.threshold
+    assert not resolution.confident
+
+
+@pytest.mark.parametrize("action, intent", [
+    ("拿水杯砸向李同事", "throw"),
+    ("把水杯扔向张经理", "throw"),
+    ("打李同事", "attack"),
+    ("揍王前辈一顿", "attack"),
+    ("写代码", "work"),
+    ("用打印机打印文件", "work"),
+    ("偷偷摸鱼", "slack"),
+    ("和王前辈打招呼", "talk"),
+])
+def test_clear_actions_resolve_locally(engine, action, intent):
+    resolution = engine.resolve(action, OBJECTS, NPCS)
+    assert resolution.intent == intent
+    assert resolution.confident
+
+
+def test_throw_result_names_object_and_target(engine):
+    resolution = engine.resolve("拿水杯砸向李同事", OBJECTS, NPCS)
+    assert resolution.result["description"] == "你拿起水杯狠狠地砸向了李同事！"
+    assert resolution.result["npc_reactions"]["李同事"] == "hurt"
+
+
+def test_negated_verb_escalates(engine):
+    resolution = engine.resolve("不想打李同事", OBJECTS, NPCS)
+    assert not resolution.confident
+    assert "negation" in resolution.reasons
@@ -0,0 +1,86 @@
+"""job_pool 的取用与后台补充"""
+
+import asyncio
+
+from job_pool import JobListingPool
+
+
+RESUME = {"education": "本科", "major": "计算机", "experience": 0}
+
+
+class FakeService:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def generate_job_listings(self, player_info, count=15, coalesce=True, fallback=True):
+        self.calls.append({"count": count, "coalesce": coalesce, "fallback": fallback})
+        await asyncio.sleep(0)
+        if self.fail:
+            return None
+        return [{"id": f"job_{i}", "title": "开发"} for i in range(count)]
+
+
+def test_cold_miss_defers_refill_until_live_call_finishes():
+    service = FakeService()
+    pool = JobListingPool(service, target_size=30, low_water=15, batch_size=15)
+
+    async def run():
+        assert pool.take(RESUME, 15) is None
+        await asyncio.sleep(0)
+        assert service.calls == []  # 实时生成在途时不预热
+
+        pool.live_finished(RESUME)
+        await asyncio.gather(*pool._refilling.values())
+
+    asyncio.run(run())
+    assert [call["fallback"] for call in service.calls] == [False, False]
+    assert pool.size(RESUME) == 30
+    assert pool.misses == 1
+
+
+def test_refill_waits_for_every_live_call():
+    service = FakeService()
+    pool = JobListingPool(service, target_size=15, low_water=15, batch_size=15)
+
+    async def run():
+        assert pool.take(RESUME, 15) is None
+        assert pool.take(RESUME, 15) is None
+        pool.live_finished(RESUME)
+        assert not pool._refilling
+        pool.live_finished(RESUME)
+        await asyncio.gather(*pool._refilling.values())
+
+    asyncio.run(run())
+    assert len(service.calls) == 1
+
+
+def test_take_defaults_missing_count_to_batch_size():
+    service = FakeService()
+    pool = JobListingPool(service, target_size=30, low_water=5, batch_size=15)
+
+    async def run():
+        pool.take(RESUME, None)
+        pool.live_finished(RESUME)
+        await asyncio.gather(*pool._refilling.values())
+        return pool.take(RESUME, None)
+
+    jobs = asyncio.run(run())
+    assert len(jobs) == 15
+    assert len({job["id"] for job in jobs}) == 15
+    assert pool.hits == 1
+
+
+def test_failed_refill_stops_without_fallback():
+    service = FakeService(fail=True)
+    pool = JobListingPool(service, target_size=30, low_water=15, batch_size=15)
+
+    async def run():
+        pool.take(RESUME, 15)
+        pool.live_finished(RESUME)
+        await asyncio.gather(*pool._refilling.values())
+
+    asyncio.run(run())
+    assert len(service.calls) == 1
+    assert service.calls[0]["fallback"] is False
+    assert pool.size(RESUME) == 0
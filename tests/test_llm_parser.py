@@ -0,0 +1,63 @@
+"""llm_parser 的增量提取"""
+
+import pytest
+
+from llm_parser import DialogueTrailerSplitter, JsonArrayItemExtractor, JsonFieldExtractor, extract_json
+
+
+def _feed(extractor, text: str, step: int) -> list:
+    items = []
+    for i in range(0, len(text), step):
+        items += extractor.feed(text[i:i + step])
+    return items
+
+
+@pytest.mark.parametrize("step", [1, 7, 1000])
+def test_array_items_skip_prose_brackets(step):
+    text = '格式见 [示例]，结果如下：\n[{"id": "1"}, {"id": "2"}]'
+    assert _feed(JsonArrayItemExtractor(), text, step) == [{"id": "1"}, {"id": "2"}]
+
+
+@pytest.mark.parametrize("step", [1, 7, 1000])
+def test_array_items_skip_think_block(step):
+    text = '<think>[x] 先列个 [1, 2]</think>[{"id": "1"}, <think>{"bad"</think>{"id": "2"}]'
+    assert _feed(JsonArrayItemExtractor(), text, step) == [{"id": "1"}, {"id": "2"}]
+
+
+@pytest.mark.parametrize("step", [1, 7, 1000])
+def test_array_items_ignore_brackets_in_strings(step):
+    text = '[{"a": "含 ] 和 , 的字符串"}, {"b": [1, {"c": "}"}]}, "s"]'
+    assert _feed(JsonArrayItemExtractor(), text, step) == [{"a": "含 ] 和 , 的字符串"}, {"b": [1, {"c": "}"}]}, "s"]
+
+
+@pytest.mark.parametrize("text", [
+    '{"a": 1, "c": "<think>x</think>"}',
+    '<think>先想想 {"a": 0}</think>{"a": 1, "c": "<think>x</think>"}',
+    '说明 {"a": 1, "c": "<think>x</think>"',
+])
+def test_extract_json_keeps_think_tags_inside_strings(text):
+    value, _ = extract_json(text)
+    assert value == {"a": 1, "c": "<think>x</think>"}
+
+
+@pytest.mark.parametrize("step", [1, 5, 1000])
+def test_field_extractor_reports_fields_and_rest(step):
+    text = '{"mood": "happy", "n": 3, "tags": ["a", "}"], <think>{</think>"ok": true} 后面的正文'
+    extractor = JsonFieldExtractor()
+    fields = []
+    i = 0
+    while not extractor.done:
+        fields += extractor.feed(text[i:i + step])
+        i += step
+    assert fields == [("mood", "happy"), ("n", 3), ("tags", ["a", "}"]), ("ok", True)]
+    assert extractor.value == {"mood": "happy", "n": 3, "tags": ["a", "}"], "ok": True}
+    # 闭合所在的那段里，对象之后的部分
+    assert extractor.rest + text[i:] == " 后面的正文"
+
+
+def test_dialogue_splitter_treats_plain_braces_as_text():
+    splitter = DialogueTrailerSplitter()
+    out = splitter.feed('你好 {就是个括号} 再见 {"emotion": "happy"}')
+    out += splitter.finish()
+    assert out.strip() == "你好 {就是个括号} 再见"
+    assert splitter.meta == {"emotion": "happy"}
@@ -0,0 +1,146 @@
+"""provider_router 的故障切换、冷却探测与延迟排序"""
+
+import asyncio
+
+import pytest
+
+import provider_router
+from provider_router import Provider, ProviderRouter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(provider_router.time, "monotonic", lambda: now[0])
+    return now
+
+
+class FakeProvider(Provider):
+    """每次调用让时钟前进 latency 秒；fail 为 True 时返回 None，为异常时抛出"""
+
+    def __init__(self, name: str, clock, latency: float = 0.1, fail=False):
+        self.name = name
+        self.clock = clock
+        self.latency = latency
+        self.fail = fail
+        self.available = True
+        self.calls = 0
+
+    def is_available(self) -> bool:
+        return self.available
+
+    async def chat_with_npc(self, npc_name, npc_profile, player_message, *args, **kwargs):
+        return await self._respond({"content": f"{self.name}: {player_message}"})
+
+    async def generate_tasks(self, player_info, current_time="09:00"):
+        return await self._respond({"tasks": [self.name]})
+
+    async def _respond(self, result):
+        self.calls += 1
+        self.clock[0] += self.latency
+        if isinstance(self.fail, Exception):
+            raise self.fail
+        return None if self.fail else result
+
+
+def _router(providers, **kwargs):
+    kwargs.setdefault("explore_rate", 0)
+    return ProviderRouter(providers, **kwargs)
+
+
+def _call(router, operation="generate_tasks"):
+    return asyncio.run(router.call(operation, {}))
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        Provider()
+
+
+def test_fails_over_to_next_provider(clock):
+    broken = FakeProvider("a", clock, fail=RuntimeError("boom"))
+    backup = FakeProvider("b", clock)
+    router = _router([broken, backup])
+
+    assert _call(router) == {"tasks": ["b"]}
+    assert router.failovers == 1
+    assert (broken.calls, backup.calls) == (1, 1)
+
+
+def test_returns_none_when_every_provider_fails(clock):
+    router = _router([FakeProvider("a", clock, fail=True), FakeProvider("b", clock, fail=True)])
+    assert _call(router) is None
+    assert router.failovers == 1
+
+
+def test_unavailable_provider_is_skipped(clock):
+    offline = FakeProvider("a", clock)
+    offline.available = False
+    router = _router([offline, FakeProvider("b", clock)])
+    assert _call(router) == {"tasks": ["b"]}
+    assert offline.calls == 0
+    assert router.failovers == 0
+
+
+def test_unhealthy_provider_ranks_last_until_cooldown_then_probes(clock):
+    flaky = FakeProvider("a", clock, fail=True)
+    steady = FakeProvider("b", clock)
+    router = _router([flaky, steady], max_consecutive_failures=2, cooldown=30)
+
+    for _ in range(2):
+        _call(router)
+    assert router.rank("generate_tasks") == [steady, flaky]
+    assert not router.stats()["providers"]["a"]["generate_tasks"]["healthy"]
+
+    # 冷却期内不先尝试故障后端
+    _call(router)
+    assert flaky.calls == 2
+
+    clock[0] += 30
+    assert router.rank("generate_tasks") == [flaky, steady]
+
+    # 探测失败：重新计时，又排到最后
+    _call(router)
+    assert flaky.calls == 3
+    assert router.rank("generate_tasks") == [steady, flaky]
+
+    # 下一次探测成功：连续失败清零，恢复健康
+    clock[0] += 30
+    flaky.fail = False
+    assert _call(router) == {"tasks": ["a"]}
+    assert router.stats()["providers"]["a"]["generate_tasks"]["healthy"]
+
+
+def test_healthy_providers_ordered_by_p50(clock):
+    slow = FakeProvider("slow", clock, latency=0.8)
+    fast = FakeProvider("fast", clock, latency=0.2)
+    router = _router([slow, fast], min_samples=3)
+
+    # 样本不足的后端排在最前积累数据，依次让两个后端各积累 min_samples 次
+    for provider in (slow, fast):
+        others = [p for p in (slow, fast) if p is not provider]
+        for other in others:
+            other.available = False
+        for _ in range(3):
+            _call(router)
+        for other in others:
+            other.available = True
+
+    assert router.rank("generate_tasks") == [fast, slow]
+    assert _call(router) == {"tasks": ["fast"]}
+    # 按操作分别统计：另一个操作还没有数据，保持原顺序
+    assert router.rank("chat_with_npc") == [slow, fast]
+
+
+def test_stats_report_p50_and_p95(clock):
+    provider = FakeProvider("a", clock)
+    router = _router([provider])
+    for latency in [0.1] * 18 + [1.0, 2.0]:
+        provider.latency = latency
+        _call(router)
+
+    stats = router.stats()["providers"]["a"]["generate_tasks"]
+    assert stats["calls"] == 20
+    assert stats["p50_ms"] == 100.0
+    assert stats["p95_ms"] == 2000.0
+    assert stats["error_rate"] == 0.0
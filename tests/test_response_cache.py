@@ -0,0 +1,53 @@
+"""response_cache 的新鲜度判断"""
+
+import asyncio
+
+import response_cache
+from response_cache import ResponseCache
+
+
+def test_stale_variant_revalidated_after_sibling_is_stored(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: clock[0])
+    cache = ResponseCache()
+    cache.configure("event", ttl=10, stale_ttl=100, variants=2)
+    calls = []
+
+    async def fetch():
+        calls.append(clock[0])
+        return {"n": len(calls)}
+
+    async def run():
+        await cache.get_or_fetch("event", {}, fetch)      # t=0 写入第 1 个
+        clock[0] = 9
+        await cache.get_or_fetch("event", {}, fetch)      # t=9 写入第 2 个
+        clock[0] = 11
+        await cache.get_or_fetch("event", {}, fetch)      # 第 1 个已过期，第 2 个还新鲜
+        await asyncio.gather(*cache._tasks)
+
+    asyncio.run(run())
+    assert calls == [0, 9, 11]
+    assert cache.counters["event"]["refreshes"] == 1
+    assert [fetched_at for fetched_at, _ in cache._entries[cache.make_key("event", {})].variants] == [9, 11]
+
+
+def test_expired_variants_dropped_individually(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: clock[0])
+    cache = ResponseCache()
+    cache.configure("event", ttl=10, stale_ttl=5, variants=2)
+    calls = []
+
+    async def fetch():
+        calls.append(clock[0])
+        return len(calls)
+
+    async def run():
+        await cache.get_or_fetch("event", {}, fetch)
+        clock[0] = 12
+        await cache.get_or_fetch("event", {}, fetch)
+        clock[0] = 16  # 第 1 个超过宽限期被丢弃，只剩 1 个，按未命中处理
+        return await cache.get_or_fetch("event", {}, fetch)
+
+    assert asyncio.run(run()) == 3
+    assert cache.counters["event"]["misses"] == 3
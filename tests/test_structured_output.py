@@ -0,0 +1,84 @@
+"""structured_output 的 JSON 模式回退"""
+
+import asyncio
+
+import httpx
+import pytest
+from openai import BadRequestError
+
+from structured_output import OUTPUT_SPECS, StructuredOutputs
+
+
+def _bad_request(message: str, param: str = None) -> BadRequestError:
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    response = httpx.Response(400, request=request)
+    body = {"error": {"message": message, "param": param}}
+    return BadRequestError(message, response=response, body=body)
+
+
+class FakeClient:
+    def __init__(self, error: BadRequestError):
+        self.error = error
+        self.calls = []
+
+    async def complete(self, model, messages, endpoint=None, **kwargs):
+        self.calls.append((model, "response_format" in kwargs))
+        if "response_format" in kwargs:
+            raise self.error
+        return "{}"
+
+
+def _complete(outputs: StructuredOutputs):
+    spec = OUTPUT_SPECS["workplace_event"]
+    return asyncio.run(outputs._complete("workplace_event", spec, [], max_tokens=10, temperature=0))
+
+
+@pytest.mark.parametrize("message, param", [
+    ("response_format is not supported by this model", None),
+    ("Invalid parameter", "response_format"),
+    ("'json_object' is not supported", None),
+])
+def test_json_mode_disabled_only_for_that_model(message, param):
+    client = FakeClient(_bad_request(message, param))
+    outputs = StructuredOutputs(client, "model-a", json_mode=True)
+    assert _complete(outputs) == "{}"
+    assert outputs.json_unsupported == {"model-a"}
+    assert outputs.json_mode
+
+    _complete(outputs)
+    assert client.calls == [("model-a", True), ("model-a", False), ("model-a", False)]
+
+    outputs.model = "model-b"
+    _complete(outputs)
+    assert client.calls[-2:] == [("model-b", True), ("model-b", False)]
+
+
+def test_unrelated_bad_request_keeps_json_mode():
+    client = FakeClient(_bad_request("This model's maximum context length is 8192 tokens"))
+    outputs = StructuredOutputs(client, "model-a", json_mode=True)
+    with pytest.raises(BadRequestError):
+        _complete(outputs)
+    assert outputs.json_unsupported == set()
+    assert client.calls == [("model-a", True)]
+
+
+class StreamingClient:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self, model, messages, endpoint=None, **kwargs):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def test_generate_stream_reports_fields_as_they_complete():
+    chunks = ['{"question": "为什么', '离职？", "type": "pers', 'onal", "display_type": "离职原因"}']
+    outputs = StructuredOutputs(StreamingClient(chunks), "model-a", json_mode=True)
+    seen = []
+    result = asyncio.run(outputs.generate_stream(
+        "interview_next_question", [], max_tokens=10, temperature=0,
+        on_field=lambda key, value: seen.append((key, value))))
+    assert [key for key, _ in seen] == ["question", "type", "display_type"]
+    assert seen[0] == ("question", "为什么离职？")
+    assert result["type"] == "personal"
+    assert outputs.stats()["interview_next_question"]["valid"] == 1
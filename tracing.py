@@ -0,0 +1,342 @@
+"""
+请求链路追踪
+按阶段（prompt 组装、排队、上游生成、JSON 解析 ...）记录耗时，
+trace id 写入响应头 X-Trace-Id 和日志；设置 TRACE_FILE 后完整链路按行写入本地 JSONL 文件供离线分析
+
+离线分析：
+    python tracing.py traces.jsonl --slowest 10
+    python tracing.py traces.jsonl --trace-id 3f2a...
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+
+logger = logging.getLogger("trace")
+
+TRACE_HEADER = "x-trace-id"
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attrs", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attrs: dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Trace:
+    """一次请求的全部阶段"""
+
+    def __init__(self, name: str, trace_id: str = None, **attrs):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started_at = datetime.now()
+        self.root = Span(name, None, attrs)
+        self.spans: List[Span] = [self.root]
+        self.finished = False
+
+    @property
+    def duration(self) -> float:
+        end = self.root.end if self.root.end is not None else time.perf_counter()
+        return end - self.root.start
+
+    def to_dict(self) -> dict:
+        base = self.root.start
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": self.started_at.isoformat(timespec="milliseconds"),
+            "duration_ms": round(self.duration * 1000, 2),
+            "attrs": self.root.attrs,
+            "error": self.root.error,
+            "spans": [
+                {
+                    "name": span.name,
+                    "id": span.span_id,
+                    "parent": span.parent_id,
+                    "offset_ms": round((span.start - base) * 1000, 2),
+                    "duration_ms": round(((span.end or span.start) - span.start) * 1000, 2),
+                    **({"attrs": span.attrs} if span.attrs else {}),
+                    **({"error": span.error} if span.error else {}),
+                }
+                for span in self.spans[1:]
+            ],
+        }
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_span: ContextVar[Optional[Span]] = ContextVar("span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Optional[Span]]:
+    """
+    记录一个阶段；当前没有进行中的 trace 时什么也不做
+
+    不要在异步生成器里跨 yield 使用（上下文变量会泄漏给调用方），那种场景用 record_span
+    """
+    trace = _trace.get()
+    if trace is None or trace.finished:
+        yield None
+        return
+    parent = _span.get()
+    current = Span(name, parent.span_id if parent else trace.root.span_id, attrs)
+    trace.spans.append(current)
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _span.reset(token)
+
+
+def record_span(name: str, start: float, end: float = None, error: str = None, **attrs):
+    """补记一个已经结束的阶段（start / end 为 time.perf_counter() 读数），不改变当前上下文"""
+    trace = _trace.get()
+    if trace is None or trace.finished:
+        return
+    parent = _span.get()
+    finished = Span(name, parent.span_id if parent else trace.root.span_id, attrs)
+    finished.start = start
+    finished.end = end if end is not None else time.perf_counter()
+    finished.error = error
+    trace.spans.append(finished)
+
+
+def traced(name: str):
+    """把整个函数 / 协程记为一个阶段（不适用于生成器）"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TraceExporter:
+    """
+    把结束的 trace 追加写入 JSONL 文件
+
+    默认关闭，设置 TRACE_FILE 后才导出；写文件在后台线程进行，不阻塞事件循环；
+    文件超过 max_bytes 时轮转为 .1。只导出耗时不少于 min_ms 的请求（0 表示全部导出）
+    """
+
+    def __init__(self, path: str = None, min_ms: float = None, max_bytes: int = None):
+        self.path = path if path is not None else os.getenv("TRACE_FILE", "")
+        self.min_ms = min_ms if min_ms is not None else float(os.getenv("TRACE_MIN_MS", "0"))
+        self.max_bytes = max_bytes or int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+        self.exported = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=10000)
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def export(self, trace: Trace):
+        if not self.enabled or trace.duration * 1000 < self.min_ms:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(trace.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.exported += 1
+            except OSError as e:
+                self.dropped += 1
+                logger.warning("trace 写入失败: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0):
+        """等待已入队的 trace 写完（测试 / 退出时用）"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> dict:
+        return {"path": self.path or None, "exported": self.exported, "dropped": self.dropped}
+
+
+exporter = TraceExporter()
+
+
+class TraceIdFilter(logging.Filter):
+    """给日志记录加上 trace_id 字段（不在请求内时为 "-"）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+class TracingMiddleware:
+    """
+    为每个 HTTP 请求建立 trace
+
+    沿用请求头里的 X-Trace-Id（便于前端或上游网关串联），否则新生成；
+    响应头带回 X-Trace-Id；流式响应在最后一个 body 分片发出时结束
+    """
+
+    def __init__(self, app, exporter: TraceExporter = exporter, slow_ms: float = None,
+                 skip: tuple = ("/api/metrics", "/api/status")):
+        self.app = app
+        self.exporter = exporter
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv("TRACE_SLOW_MS", "5000"))
+        self.skip = skip
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or []).get(TRACE_HEADER.encode())
+        trace_id = incoming.decode("latin-1")[:64] if incoming else None
+        trace = Trace(f"{scope['method']} {scope['path']}", trace_id, method=scope["method"])
+        trace_token = _trace.set(trace)
+        span_token = _span.set(trace.root)
+
+        def finish():
+            if trace.finished:
+                return
+            trace.root.end = time.perf_counter()
+            route = scope.get("route")
+            if getattr(route, "path", None):
+                trace.root.name = f"{scope['method']} {route.path}"
+            trace.finished = True
+            self.exporter.export(trace)
+            duration_ms = trace.duration * 1000
+            failed = [s for s in trace.spans if s.error]
+            if duration_ms >= self.slow_ms:
+                logger.warning("慢请求 %s %.0fms，最耗时阶段: %s", trace.root.name, duration_ms, _slowest_phases(trace))
+            elif failed:
+                logger.warning("请求 %s 有阶段出错: %s", trace.root.name,
+                               "; ".join(f"{s.name}: {s.error}" for s in failed[:3]))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.root.attrs["status"] = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((TRACE_HEADER.encode(), trace.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            trace.root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            finish()
+            _span.reset(span_token)
+            _trace.reset(trace_token)
+
+
+def _slowest_phases(trace: Trace, limit: int = 3) -> str:
+    phases = sorted(trace.spans[1:], key=lambda s: (s.end or s.start) - s.start, reverse=True)
+    return ", ".join(f"{s.name} {((s.end or s.start) - s.start) * 1000:.0f}ms" for s in phases[:limit]) or "无"
+
+
+# ========== 离线分析 ==========
+
+def _print_tree(record: dict):
+    print(f"{record['trace_id']}  {record['name']}  {record['duration_ms']}ms  {record['start']}"
+          + (f"  错误: {record['error']}" if record.get("error") else ""))
+    children: Dict[Optional[str], List[dict]] = {}
+    ids = {s["id"] for s in record["spans"]}
+    for s in record["spans"]:
+        children.setdefault(s["parent"] if s["parent"] in ids else None, []).append(s)
+
+    def walk(parent, depth):
+        for s in sorted(children.get(parent, []), key=lambda s: s["offset_ms"]):
+            extra = f"  {s['attrs']}" if s.get("attrs") else ""
+            error = f"  错误: {s['error']}" if s.get("error") else ""
+            print(f"{'  ' * depth}+{s['offset_ms']:>9.1f}ms {s['duration_ms']:>9.1f}ms  {s['name']}{extra}{error}")
+            walk(s["id"], depth + 1)
+
+    walk(None, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析导出的 trace 文件")
+    parser.add_argument("path", nargs="?", default=os.getenv("TRACE_FILE") or "traces.jsonl")
+    parser.add_argument("--slowest", type=int, default=5, help="列出最慢的 N 个请求")
+    parser.add_argument("--route", default=None, help="只看名称包含该字符串的请求")
+    parser.add_argument("--trace-id", default=None)
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if args.trace_id:
+        records = [r for r in records if r["trace_id"].startswith(args.trace_id)]
+    if args.route:
+        records = [r for r in records if args.route in r["name"]]
+
+    # 各阶段的总耗时占比，看时间主要花在哪
+    totals: Dict[str, List[float]] = {}
+    for r in records:
+        for s in r["spans"]:
+            totals.setdefault(s["name"], []).append(s["duration_ms"])
+    print(f"{len(records)} 个请求")
+    print(f"{'阶段':<36}{'次数':>8}{'平均(ms)':>12}{'最大(ms)':>12}")
+    for name, values in sorted(totals.items(), key=lambda kv: -sum(kv[1])):
+        print(f"{name:<36}{len(values):>8}{sum(values) / len(values):>12.1f}{max(values):>12.1f}")
+    print()
+    for record in sorted(records, key=lambda r: -r["duration_ms"])[:args.slowest]:
+        _print_tree(record)
+        print()
+
+
+if __name__ == "__main__":
+    main()